@@ -10,50 +10,51 @@ import matplotlib.pyplot as plt
 import os
 import re
 import datetime
+from inference import InferenceEngine
+from latency import stage
+from tflite_engine import TFLiteEngine
+from preprocessing import DEPTH_SPEC, IMAGE_SPEC, preprocess_batch
 
 def reshape_depth(depth):
-    """Resize to the same size as the one in Ritwik's work."""
-    width = 224
-    height = 224
-    frame = depth
-    # frame = cv2.cvtColor(depth, cv2.COLOR_RGB2GRAY)
-    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
-    frame = np.expand_dims(frame, axis=2)
-    frame = np.expand_dims(frame, axis=0)
-    return frame / 255.0
+    """Single depth frame to a (1, 224, 224, 1) float32 batch."""
+    return preprocess_batch([depth], DEPTH_SPEC)
 
 
 def reshape_image(image):
-    """Resize to the size as required in ResNet."""
-    width = 224
-    height = 224
-    frame = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
-    frame = np.expand_dims(frame, axis=0)
-    return frame / 255.0
+    """Single RGB frame to a (1, 224, 224, 3) float32 batch."""
+    return preprocess_batch([image], IMAGE_SPEC)
 
 
-def arilNN(airsim_img, depth, aril):
-    # Reshape image from AirSim camera
-    print("Type and max-min values")
-    print(airsim_img.dtype, depth.dtype)
-    print(np.max(airsim_img), np.min(airsim_img))
-    print(np.max(depth), np.min(depth))
+def arilNN(airsim_img, depth, aril, verbose=False, preprocessed=False):
+    """
+    Roll, pitch, throttle, yaw commands and gaze for one AirSim frame.
+    ``aril`` is either an engine from inference.load_engine (preferred in the
+    control loop) or a plain Keras model. With ``preprocessed=True`` the
+    frames are already network inputs, e.g. from AirSimEnv.getInputs.
+    """
+    if verbose:
+        # Reshape image from AirSim camera
+        print("Type and max-min values")
+        print(airsim_img.dtype, depth.dtype)
+        print(np.max(airsim_img), np.min(airsim_img))
+        print(np.max(depth), np.min(depth))
 
-    img = reshape_image(np.float32(airsim_img))
-    
-    depth = reshape_depth(np.float32(depth))
-    # print("Printing image shape")
-    # print(img.shape)
-    # print(depth.shape)
-    # print("max and min value after reshaping")
-    # print(img.dtype, depth.dtype)
-    # print(np.max(img), np.min(img))
-    # print(np.max(depth), np.min(depth))
-    
-    input_data = [img, depth]
-    commands, gaze = aril.predict(input_data)
+    if preprocessed:
+        is_engine = isinstance(aril, (InferenceEngine, TFLiteEngine))
+        with stage("inference"):
+            commands, gaze = aril.run(airsim_img, depth) if is_engine else aril.predict([airsim_img, depth])
+    elif isinstance(aril, (InferenceEngine, TFLiteEngine)):
+        commands, gaze = aril(airsim_img, depth)
+    else:
+        img = reshape_image(airsim_img)
+
+        depth = reshape_depth(depth)
+
+        input_data = [img, depth]
+        commands, gaze = aril.predict(input_data)
     #commands = agil_model(input_agil)
-    print("Commands", commands)
+    if verbose:
+        print("Commands", commands)
     return commands, gaze
 
 if __name__ == "__main__":
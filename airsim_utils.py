@@ -2,10 +2,88 @@ import airsim
 import math
 import numpy as np
 import cv2
+from latency import stage, timed
+from preprocessing import DEPTH_SPEC, IMAGE_SPEC, normalize
+
+
+def decodeRGB(response) -> np.ndarray:
+    # read-only view over the response bytes, PNG responses are decoded
+    buf = np.frombuffer(response.image_data_uint8, dtype=np.uint8)
+    if response.compress:
+        return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    # for Unreal 4.25
+    return buf.reshape(response.height, response.width, 3)
+
+
+def depthFloats(response) -> np.ndarray:
+    # msgpack hands the float image over as a list, fromiter skips the
+    # intermediate float64 array np.array would build
+    count = response.height * response.width
+    return np.fromiter(response.image_data_float, dtype=np.float32, count=count).reshape(response.height, response.width)
+
+
+def decodeDepth(response, out=None) -> np.ndarray:
+    # |1 - dp| * 255 computed in place, truncated into uint8 ``out``
+    dp = depthFloats(response)
+    np.clip(dp, 0.0, 1.0, out=dp)
+    np.subtract(1.0, dp, out=dp)
+    np.abs(dp, out=dp)
+    if out is None:
+        out = np.empty(dp.shape, dtype=np.uint8)
+    np.multiply(dp, 255, out=out, casting="unsafe")
+    return out
+
+
+class FrameDecoder():
+    """
+    Decodes Scene + DepthVis responses straight into network input batches
+    of shape (batch_size, H, W, C) float32, one frame per index. The output
+    arrays are reused for every frame, so copy them if a frame has to
+    outlive the next decode.
+    """
+
+    def __init__(self, rgb_spec=IMAGE_SPEC, depth_spec=DEPTH_SPEC, batch_size=1):
+        self.rgb_spec = rgb_spec
+        self.depth_spec = depth_spec
+        self.rgb = np.empty((batch_size,) + rgb_spec.shape, dtype=np.float32)
+        self.depth = np.empty((batch_size,) + depth_spec.shape, dtype=np.float32)
+        self._rgb_staging = np.empty(rgb_spec.shape, dtype=np.uint8)
+        self._depth_staging = np.empty(depth_spec.shape[:2], dtype=np.uint8)
+
+    def decodeRGB(self, response, i=0) -> np.ndarray:
+        cv2.resize(decodeRGB(response), (self.rgb_spec.width, self.rgb_spec.height),
+                   dst=self._rgb_staging, interpolation=self.rgb_spec.interpolation)
+        normalize(self._rgb_staging, out=self.rgb[i])
+        return self.rgb
+
+    def decodeDepth(self, response, i=0) -> np.ndarray:
+        # quantize to uint8 before resizing, like the depth PNGs the
+        # training frames are made from
+        cv2.resize(decodeDepth(response), (self.depth_spec.width, self.depth_spec.height),
+                   dst=self._depth_staging, interpolation=self.depth_spec.interpolation)
+        normalize(self._depth_staging, out=self.depth[i, :, :, 0])
+        return self.depth
+
+
+def imageRequests(cameras=("0",)):
+    # Scene + DepthVis of every camera, fetched in a single simGetImages call
+    requests = []
+    for camera in cameras:
+        requests += [airsim.ImageRequest(camera, airsim.ImageType.Scene, False, False),
+                     airsim.ImageRequest(camera, airsim.ImageType.DepthVis, True)]
+    return requests
+
+
 class AirSimEnv():
 
-    def __init__(self):
-        self.client = airsim.MultirotorClient()
+    def __init__(self, client=None, ip="", port=41451, vehicles=("",), cameras=("0",)):
+        # each thread talking to AirSim needs its own client connection
+        self.client = client if client is not None else airsim.MultirotorClient(ip=ip, port=port)
+        self.decoder = FrameDecoder()
+        # vehicles and cameras captured together by getImageBatch/getInputBatch
+        self.vehicles = list(vehicles)
+        self.cameras = list(cameras)
+        self.batch_decoder = FrameDecoder(batch_size=len(self.vehicles) * len(self.cameras))
 
     def connectQuadrotor(self) -> None:
         self.client.confirmConnection()
@@ -25,28 +103,71 @@ class AirSimEnv():
     def hover(self) -> None:
         self.client.hoverAsync().join()
 
-    def hasCollided(self):
-        return self.client.simGetCollisionInfo.has_collided #todo return
+    def hasCollided(self, vehicle_name=""):
+        return self.client.simGetCollisionInfo(vehicle_name=vehicle_name).has_collided
 
+    @timed("airsim.getState")
+    def getState(self, vehicle_name=""):
+        return self.client.getMultirotorState(vehicle_name=vehicle_name)
+
+    @timed("airsim.getRGBImage")
     def getRGBImage(self) -> np.ndarray:
         # retrieve single RGB image from the camera
         response = self.client.simGetImages([airsim.ImageRequest("0", airsim.ImageType.Scene, False, False)])[0]
-        # numpy array
-        img1d = np.fromstring(response.image_data_uint8, dtype=np.uint8)
-        # for Unreal 4.25
-        img_rgb = img1d.reshape(response.height, response.width, 3)
-
-        return img_rgb
+        return decodeRGB(response)
 
+    @timed("airsim.getDepthImage")
     def getDepthImage(self):
 
         response = self.client.simGetImages([airsim.ImageRequest(0, airsim.ImageType.DepthVis, True)])[0]
+        return decodeDepth(response)
+
+    @timed("airsim.getImages")
+    def getImages(self) -> tuple:
+        # RGB and depth of camera 0 in a single simGetImages round trip
+        with stage("airsim.simGetImages"):
+            responses = self.client.simGetImages(imageRequests())
+        with stage("decode"):
+            return decodeRGB(responses[0]), decodeDepth(responses[1])
 
-        dp1d = np.array(response.image_data_float, dtype=np.float32)
-        dp = dp1d.reshape(response.height, response.width)
-        img_depth = np.array(np.abs(1-dp) * 255, dtype=np.uint8)
+    @timed("airsim.getInputs")
+    def getInputs(self) -> tuple:
+        # like getImages, but decoded straight into reused network input
+        # batches; pass them to arilNN with preprocessed=True
+        with stage("airsim.simGetImages"):
+            responses = self.client.simGetImages(imageRequests())
+        with stage("decode"):
+            return self.decoder.decodeRGB(responses[0]), self.decoder.decodeDepth(responses[1])
 
-        return img_depth
+    def _captureBatch(self):
+        # one simGetImages round trip per vehicle covering all its cameras,
+        # AirSim has no call that spans vehicles
+        requests = imageRequests(self.cameras)
+        with stage("airsim.simGetImages"):
+            return [self.client.simGetImages(requests, vehicle_name=v) for v in self.vehicles]
+
+    @timed("airsim.getImageBatch")
+    def getImageBatch(self) -> tuple:
+        # raw uint8 RGB (N,H,W,3) and depth (N,H,W), N = vehicles x cameras,
+        # vehicle-major; all cameras must share one resolution
+        per_vehicle = self._captureBatch()
+        with stage("decode"):
+            rgb = np.stack([decodeRGB(r) for responses in per_vehicle for r in responses[0::2]])
+            depth = np.stack([decodeDepth(r) for responses in per_vehicle for r in responses[1::2]])
+        return rgb, depth
+
+    @timed("airsim.getInputBatch")
+    def getInputBatch(self) -> tuple:
+        # getImageBatch decoded straight into reused network input batches
+        per_vehicle = self._captureBatch()
+        with stage("decode"):
+            i = 0
+            for responses in per_vehicle:
+                for rgb, depth in zip(responses[0::2], responses[1::2]):
+                    self.batch_decoder.decodeRGB(rgb, i)
+                    self.batch_decoder.decodeDepth(depth, i)
+                    i += 1
+        return self.batch_decoder.rgb, self.batch_decoder.depth
 
     def saveImage(self, filename: str, image: np.ndarray) -> None:
         cv2.imwrite(filename, image)
@@ -67,7 +188,8 @@ class AirSimEnv():
         C[1, 1] = C[0, 0]
         return C.dot(np.array([vx, vy]))
 
-    def controlQuadrotor(self, vb, vz, ref_alt, duration):
+    @timed("airsim.controlQuadrotor")
+    def controlQuadrotor(self, vb, vz, ref_alt, duration, vehicle_name=""):
         self.client.moveByVelocityZAsync(
             vb[0],
             vb[1],
@@ -75,8 +197,10 @@ class AirSimEnv():
             duration,
             airsim.DrivetrainType.MaxDegreeOfFreedom,
             airsim.YawMode(True, vz),
+            vehicle_name=vehicle_name,
         )
 
+    @staticmethod
     def toEulerianAngle(q):
         z = q.z_val
         y = q.y_val
@@ -112,3 +236,21 @@ class AirSimEnv():
         pose.orientation.z_val += yaw
         self.client.simSetVehiclePose(pose, True, "SimpleFlight")
 
+
+def commands_to_velocity(commands, state, sc=10):
+    """
+    Map network commands (roll, pitch, throttle, yaw) to a body frame
+    velocity, yaw rate and reference altitude, as in spawn_eval.py.
+    """
+    act_roll, act_pitch, act_throttle, act_yaw = (float(c) for c in np.ravel(commands)[:4])
+    (pitch, roll, yaw) = AirSimEnv.toEulerianAngle(state.kinematics_estimated.orientation)
+
+    vx = sc / 1.5 * act_pitch
+    vy = sc / 1.5 * act_roll
+    vz = 10 * sc * act_yaw
+    ref_alt = state.kinematics_estimated.position.z_val + sc / 2 * act_throttle
+
+    # translate from inertial to body frame
+    c, s = np.cos(yaw), np.sin(yaw)
+    vb = (c * vx - s * vy, s * vx + c * vy)
+    return vb, vz, ref_alt
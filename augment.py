@@ -0,0 +1,201 @@
+'''
+Stochastic batch augmentation for the training input pipeline.
+
+Augmentations run inside tf.data on normalized batches (after
+batch_loader.normalize_batch), so nothing extra is stored on disk:
+
+    ds = make_dataset(path, files, model="gril", augment=("flip", "brightness"))
+
+Each augmentation decides per sample whether it applies and transforms the
+labels along with the frames. The horizontal flip mirrors image, depth and
+gaze heatmap, maps gaze_x to 1 - gaze_x and negates roll and yaw, the same
+transform utils/prepare_flipped_data.py materializes on disk.
+
+With a seed (make_dataset passes ``(seed, batch index)``) every random
+draw is a stateless op, so a batch gets the same augmentation in every run
+and after a resume. New augmentations subclass Augmentation, implement
+``apply(inputs, targets, mask)``, draw their random numbers with
+``self.uniform`` and are registered in AUGMENTATIONS.
+'''
+
+import tensorflow as tf
+
+# action rows negated by a horizontal flip: roll, pitch, throttle, yaw
+FLIP_ACTION_SIGNS = (-1.0, 1.0, 1.0, -1.0)
+
+# inputs holding frames; only "image" is photometric
+FRAME_KEYS = ("image", "depth", "images")
+
+# upper bound on the random draws of one batch, keeps their seeds distinct
+MAX_DRAWS = 1024
+
+
+def _select(mask, new, old):
+    """Per-sample ``new if mask else old`` for a batch tensor of any rank."""
+    mask = tf.reshape(mask, [-1] + [1] * (len(old.shape) - 1))
+    return tf.where(mask, new, old)
+
+
+class SeedStream():
+    """
+    Random draws of one batch. With a (2,) int64 ``seed`` each draw is a
+    stateless op with its own seed derived from it, otherwise it comes from
+    the global random generator.
+    """
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.draws = 0
+
+    def uniform(self, shape, minval=0.0, maxval=1.0):
+        if self.seed is None:
+            return tf.random.uniform(shape, minval, maxval)
+        self.draws += 1
+        if self.draws >= MAX_DRAWS:
+            raise ValueError(f"more than {MAX_DRAWS} random draws per batch")
+        seed = tf.stack([self.seed[0], self.seed[1] * MAX_DRAWS + self.draws])
+        return tf.random.stateless_uniform(shape, seed, minval, maxval)
+
+
+class Augmentation():
+    """Applied to each sample of a batch with probability ``p``."""
+
+    def __init__(self, p=0.5):
+        self.p = p
+        self._stream = SeedStream()
+
+    def __call__(self, inputs, targets, stream=None):
+        self._stream = stream if stream is not None else SeedStream()
+        batch = tf.shape(next(iter(inputs.values())))[0]
+        mask = self.uniform([batch]) < self.p
+        return self.apply(dict(inputs), dict(targets), mask)
+
+    def uniform(self, shape, minval=0.0, maxval=1.0):
+        return self._stream.uniform(shape, minval, maxval)
+
+    def apply(self, inputs, targets, mask):
+        raise NotImplementedError
+
+
+class Flip(Augmentation):
+    """Horizontal flip with the matching gaze and action transforms."""
+
+    def apply(self, inputs, targets, mask):
+        for key in FRAME_KEYS:
+            if key in inputs:
+                inputs[key] = _select(mask, tf.reverse(inputs[key], axis=[2]), inputs[key])
+        if "features" in inputs:
+            raise ValueError("cached backbone features cannot be flipped, augment the frames instead")
+
+        gaze = targets.get("gaze")
+        if gaze is not None:
+            if len(gaze.shape) == 3 and gaze.shape[1] == 2:
+                # (N, 2, 1) normalized coordinates
+                flipped = tf.concat([1.0 - gaze[:, :1], gaze[:, 1:]], axis=1)
+            else:
+                # (N, rows, cols[, 1]) heatmap
+                flipped = tf.reverse(gaze, axis=[2])
+            targets["gaze"] = _select(mask, flipped, gaze)
+
+        for key in ("action", "vel_comm"):
+            if key in targets:
+                action = targets[key]
+                signs = tf.reshape(tf.constant(FLIP_ACTION_SIGNS, action.dtype), [1, 4, 1])
+                targets[key] = _select(mask, action * signs, action)
+        return inputs, targets
+
+
+class Brightness(Augmentation):
+    """Random brightness shift of the RGB image in [-max_delta, max_delta]."""
+
+    def __init__(self, p=0.5, max_delta=0.2):
+        super().__init__(p)
+        self.max_delta = max_delta
+
+    def apply(self, inputs, targets, mask):
+        if "image" in inputs:
+            image = inputs["image"]
+            delta = self.uniform([tf.shape(image)[0], 1, 1, 1], -self.max_delta, self.max_delta)
+            inputs["image"] = _select(mask, tf.clip_by_value(image + delta, 0.0, 1.0), image)
+        return inputs, targets
+
+
+class Fog(Augmentation):
+    """Blend the RGB image towards a uniform haze of random density."""
+
+    def __init__(self, p=0.3, max_density=0.5, color=0.8):
+        super().__init__(p)
+        self.max_density = max_density
+        self.color = color
+
+    def apply(self, inputs, targets, mask):
+        if "image" in inputs:
+            image = inputs["image"]
+            density = self.uniform([tf.shape(image)[0], 1, 1, 1], 0.0, self.max_density)
+            inputs["image"] = _select(mask, image * (1.0 - density) + self.color * density, image)
+        return inputs, targets
+
+
+class CropJitter(Augmentation):
+    """
+    Crop a random window of at least ``1 - max_zoom`` of the frame and resize
+    it back. Frames share the window; gaze coordinates and heatmaps follow it.
+    """
+
+    def __init__(self, p=0.5, max_zoom=0.15):
+        super().__init__(p)
+        self.max_zoom = max_zoom
+
+    def apply(self, inputs, targets, mask):
+        batch = tf.shape(next(iter(inputs.values())))[0]
+        size = 1.0 - self.uniform([batch], 0.0, self.max_zoom)
+        size = tf.where(mask, size, tf.ones_like(size))
+        y1 = self.uniform([batch]) * (1.0 - size)
+        x1 = self.uniform([batch]) * (1.0 - size)
+        boxes = tf.stack([y1, x1, y1 + size, x1 + size], axis=1)
+        box_indices = tf.range(batch)
+
+        def crop(frames):
+            out = tf.image.crop_and_resize(frames, boxes, box_indices, tf.shape(frames)[1:3])
+            return tf.cast(out, frames.dtype)
+
+        for key in FRAME_KEYS:
+            if key in inputs:
+                inputs[key] = _select(mask, crop(inputs[key]), inputs[key])
+
+        gaze = targets.get("gaze")
+        if gaze is not None:
+            if len(gaze.shape) == 3 and gaze.shape[1] == 2:
+                offset = tf.reshape(tf.stack([x1, y1], axis=1), [-1, 2, 1])
+                moved = tf.clip_by_value((gaze - offset) / tf.reshape(size, [-1, 1, 1]), 0.0, 1.0)
+            else:
+                heatmap = gaze if len(gaze.shape) == 4 else gaze[..., None]
+                moved = crop(heatmap)
+                moved = moved / tf.maximum(tf.reduce_sum(moved, axis=[1, 2, 3], keepdims=True), 1e-12)
+                moved = tf.reshape(moved, tf.shape(gaze))
+            targets["gaze"] = _select(mask, moved, gaze)
+        return inputs, targets
+
+
+AUGMENTATIONS = {
+    "flip": Flip,
+    "brightness": Brightness,
+    "fog": Fog,
+    "crop": CropJitter,
+}
+
+
+class Augmenter():
+    """
+    Chain of augmentations, mapped over a batched (inputs, targets) dataset.
+    ``seed`` is an optional (2,) int64 tensor, e.g. (epoch seed, batch index).
+    """
+
+    def __init__(self, augmentations):
+        self.augmentations = [AUGMENTATIONS[a]() if isinstance(a, str) else a for a in augmentations]
+
+    def __call__(self, inputs, targets, seed=None):
+        stream = SeedStream(None if seed is None else tf.cast(seed, tf.int64))
+        for augmentation in self.augmentations:
+            inputs, targets = augmentation(inputs, targets, stream)
+        return inputs, targets
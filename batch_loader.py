@@ -6,21 +6,75 @@ import numpy as np
 import os
 import glob
 import random
+from augment import Augmenter
+from shards import PIXEL_KEYS, ShardReader, is_shard, quantize_pixels
+
+AUTOTUNE = tf.data.experimental.AUTOTUNE
+
+# Per-sample element spec of the datasets fed to gril() and il_cgl(). Pixels
+# stay uint8 as stored on disk until normalize_batch scales whole batches
+GRIL_SIGNATURE = (
+    {"image": tf.TensorSpec(shape=(224, 224, 3), dtype=tf.uint8),
+     "depth": tf.TensorSpec(shape=(224, 224, 1), dtype=tf.uint8)},
+    {"action": tf.TensorSpec(shape=(4, 1), dtype=tf.float32),
+     "gaze": tf.TensorSpec(shape=(2, 1), dtype=tf.float32)},
+)
+
+IL_CGL_SIGNATURE = (
+    {"image": tf.TensorSpec(shape=(224, 224, 3), dtype=tf.uint8)},
+    {"gaze": tf.TensorSpec(shape=(28, 28), dtype=tf.float32),
+     "action": tf.TensorSpec(shape=(4, 1), dtype=tf.float32)},
+)
+
+# gril_head() trains on cached MobileNet feature maps instead of raw frames
+GRIL_HEAD_SIGNATURE = (
+    {"features": tf.TensorSpec(shape=(7, 7, 1024), dtype=tf.float32),
+     "depth": tf.TensorSpec(shape=(224, 224, 1), dtype=tf.uint8)},
+    GRIL_SIGNATURE[1],
+)
+
+SIGNATURES = {
+    "gril": GRIL_SIGNATURE,
+    "il_cgl": IL_CGL_SIGNATURE,
+    "gril_head": GRIL_HEAD_SIGNATURE,
+}
 
 def read_npz(data_path):
+    # npz files written before the uint8 format hold float [0,1] pixels
+    # and float64 labels; both are converted to the current layout
     with np.load(data_path) as data:
         l = len(data["images"])
-        train_imgs = data['images']
-        print(train_imgs.shape)
-        train_depth = data['depth']
+        train_imgs = quantize_pixels(data['images'])
+        train_depth = quantize_pixels(data['depth'])
         #print(train_depth.shape)
-        train_act = data['action']
-        print(train_act.shape)
-        train_gaze = data['gaze_coords']
+        train_act = data['action'].astype(np.float32, copy=False)
+        train_gaze = data['gaze_coords'].astype(np.float32, copy=False)
         #train_gaze = data['heatmap']
         #print(train_gaze.shape)
         return train_imgs, train_depth, train_act, train_gaze
 
+def read_shard_rows(shard, start, stop, image_key="images"):
+    """Same arrays as read_npz, but only frames start:stop of a shard."""
+    imgs = shard.rows(image_key, start, stop)
+    imgs = imgs if image_key in PIXEL_KEYS else imgs.astype(np.float32)
+    depth = shard.rows("depth", start, stop)
+    acts = shard.rows("action", start, stop)
+    gaze = shard.rows("gaze_coords", start, stop)
+    return imgs, depth, acts, gaze
+
+def iter_episode(data_path, chunk=64, image_key="images"):
+    """
+    Yield (imgs, depth, acts, gaze) chunks of one episode. NPZ files are
+    decompressed in one go, shards are memory-mapped and read chunk by chunk.
+    ``image_key="features"`` reads a MobileNet feature cache instead.
+    """
+    if is_shard(data_path):
+        with ShardReader(data_path) as shard:
+            for start in range(0, len(shard), chunk):
+                yield read_shard_rows(shard, start, start + chunk, image_key)
+    else:
+        yield read_npz(data_path)
+
 def generate_gril(path, file_list):
     # Generate batches of samples
     #while 1:
@@ -30,18 +84,16 @@ def generate_gril(path, file_list):
             file_npz = [k for k in file_list[i*1:(i+1)*1]]
             #file_npz = file_list[i*1:(i+1)*1]
 
-            print(file_npz)
-
             file_npz = b" ".join(file_npz)
             #file_npz = " ".join(file_npz)
 
-            imgs, depth, acts, gaze = read_npz(os.path.join(path, file_npz))
-            #X, y = read_npz(file_npz)
-            #print(img.dtype, gaze.dtype)
-            for idx in range(0, len(depth)):
+            for imgs, depth, acts, gaze in iter_episode(os.path.join(path, file_npz)):
+                #X, y = read_npz(file_npz)
+                #print(img.dtype, gaze.dtype)
+                for idx in range(0, len(depth)):
 
-                #yield {"input_1":img, "input_2":gaze}, act
-                yield {"image": imgs[idx], "depth": depth[idx]}, {"action":acts[idx], "gaze":gaze[idx]}
+                    #yield {"input_1":img, "input_2":gaze}, act
+                    yield {"image": imgs[idx], "depth": depth[idx]}, {"action":acts[idx], "gaze":gaze[idx]}
 
 
 def generate_il_cgl(path, file_list):
@@ -53,21 +105,102 @@ def generate_il_cgl(path, file_list):
             file_npz = [k for k in file_list[i*1:(i+1)*1]]
             #file_npz = file_list[i*1:(i+1)*1]
 
-            print(file_npz)
-
             file_npz = b" ".join(file_npz)
             #file_npz = " ".join(file_npz)
 
-            imgs, depth, acts, gaze = read_npz(os.path.join(path, file_npz))
-            #X, y = read_npz(file_npz)
-            #print(img.dtype, gaze.dtype)
-            for idx in range(0, len(depth)):
-
-                #image = cv2.cvtColor(imgs[idx], cv2.COLOR_BGR2GRAY)
-                #print(gaze[idx].shape)
-                gaze_reshaped = cv2.resize(gaze[idx], (28, 28), interpolation=cv2.INTER_AREA)
-                #yield {"input_1":img, "input_2":gaze}, act
-                yield {"image": imgs[idx]},  {"gaze":gaze_reshaped, "action":acts[idx]}
-
-
-
+            for imgs, depth, acts, gaze in iter_episode(os.path.join(path, file_npz)):
+                #X, y = read_npz(file_npz)
+                #print(img.dtype, gaze.dtype)
+                for idx in range(0, len(depth)):
+
+                    #image = cv2.cvtColor(imgs[idx], cv2.COLOR_BGR2GRAY)
+                    #print(gaze[idx].shape)
+                    gaze_reshaped = cv2.resize(gaze[idx], (28, 28), interpolation=cv2.INTER_AREA)
+                    #yield {"input_1":img, "input_2":gaze}, act
+                    yield {"image": imgs[idx]},  {"gaze":gaze_reshaped, "action":acts[idx]}
+
+
+def generate_chunks(file_path, model):
+    """
+    Yield whole chunks of one episode in the layout of SIGNATURES[model].
+    One Python call per chunk instead of per sample keeps the GIL time low
+    when several of these run under tf.data interleave.
+    """
+    model = model.decode() if isinstance(model, bytes) else model
+    image_key = "features" if model == "gril_head" else "images"
+    for imgs, depth, acts, gaze in iter_episode(file_path, image_key=image_key):
+        if model == "gril":
+            yield {"image": imgs, "depth": depth}, {"action": acts, "gaze": gaze}
+        elif model == "gril_head":
+            yield {"features": imgs, "depth": depth}, {"action": acts, "gaze": gaze}
+        elif model == "il_cgl":
+            gaze_reshaped = np.stack([cv2.resize(g, (28, 28), interpolation=cv2.INTER_AREA) for g in gaze])
+            yield {"image": imgs}, {"gaze": gaze_reshaped, "action": acts}
+        else:
+            raise ValueError(f"no dataset signature for model {model}")
+
+
+def _batched_signature(signature):
+    return tf.nest.map_structure(lambda s: tf.TensorSpec(shape=(None,) + tuple(s.shape), dtype=s.dtype), signature)
+
+
+def episode_dataset(file_path, model="gril"):
+    """Per-sample dataset of a single npz/shard episode."""
+    chunks = tf.data.Dataset.from_generator(
+        generate_chunks, args=[file_path, model],
+        output_signature=_batched_signature(SIGNATURES[model]))
+    return chunks.unbatch()
+
+
+def normalize_batch(inputs, targets):
+    """Scale the uint8 pixel inputs of a batch to float32 [0,1]."""
+    inputs = {k: tf.cast(v, tf.float32) * (1.0 / 255.0) if v.dtype == tf.uint8 else v
+              for k, v in inputs.items()}
+    return inputs, targets
+
+
+def make_dataset(path, file_list, model="gril", batch_size=32, shuffle_buffer=1024,
+                 cycle_length=4, cache_path=None, seed=None, augment=None, num_samples=None):
+    """
+    Batched tf.data pipeline over the episode files in ``path``.
+
+    Episode files are shuffled, read ``cycle_length`` at a time with a
+    parallel interleave, mixed through a cross-file shuffle buffer and
+    prefetched. ``cache_path`` caches the decoded samples (``""`` keeps them
+    in memory, a file path writes a local cache); pixels are cached as
+    uint8 and only normalized per batch. Passing a seed makes the order
+    reproducible, augmentation included. ``augment`` is a list of
+    augment.AUGMENTATIONS names (or Augmentation objects) applied to every
+    batch on the fly.
+    ``num_samples`` (sample_index.SampleIndex.num_samples of ``file_list``)
+    gives the dataset a known length, so Keras sizes epochs and progress
+    bars exactly; a wrong count raises instead of truncating.
+    """
+    files = [os.path.join(path, os.fsdecode(f)) for f in file_list]
+    ds = tf.data.Dataset.from_tensor_slices(files)
+    if shuffle_buffer:
+        ds = ds.shuffle(len(files), seed=seed, reshuffle_each_iteration=True)
+
+    ds = ds.interleave(lambda f: episode_dataset(f, model),
+                       cycle_length=cycle_length,
+                       num_parallel_calls=AUTOTUNE,
+                       deterministic=seed is not None)
+    if num_samples is not None:
+        ds = ds.apply(tf.data.experimental.assert_cardinality(num_samples))
+
+    if cache_path is not None:
+        ds = ds.cache(cache_path)
+    if shuffle_buffer:
+        ds = ds.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+
+    ds = ds.batch(batch_size).map(normalize_batch, num_parallel_calls=AUTOTUNE)
+    if augment:
+        augmenter = Augmenter(augment)
+        if seed is None:
+            ds = ds.map(augmenter, num_parallel_calls=AUTOTUNE)
+        else:
+            def seeded(i, batch):
+                # stateless draws keyed on (seed, batch index), the same in every run
+                return augmenter(*batch, seed=tf.stack([tf.constant(seed, tf.int64), i]))
+            ds = ds.enumerate().map(seeded, num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
@@ -0,0 +1,241 @@
+'''
+Benchmark suite for data preparation, training and inference.
+
+    python benchmark.py -o bench.json
+    python benchmark.py -o bench_new.json -b bench.json   # fail on regressions
+
+Runs on synthetic episodes in the aril npz schema (images, depth, action,
+gaze_coords) written to a temporary folder, so the numbers only depend on
+the code and the machine. Suites:
+
+    read_npz     decompressing one episode with batch_loader.read_npz
+    generate     samples/sec through batch_loader.generate_gril
+    train_step   samples/sec of train_on_batch for each model in models.py,
+                 optionally under a mixed precision policy and/or XLA
+    arilnn       single-frame latency of agil_airsim.arilNN on raw camera frames
+    heatmap      read_gaze.preprocess_gaze_heatmap on a batch of gaze points
+
+With ``-b`` every metric is compared against a previous results file and the
+script exits with status 1 if one got worse by more than the tolerance.
+'''
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils"))
+
+SUITES = ("read_npz", "generate", "train_step", "arilnn", "heatmap")
+MODELS = ("gril", "gril_head", "il_cgl", "vanilla_bc", "agil_airsim")
+
+# metrics where a larger value is better; everything else is a duration
+HIGHER_IS_BETTER = ("_per_sec",)
+
+
+def synthetic_episode(path, frames=64, seed=0):
+    """Random episode with the dtypes and shapes written by prepare_aril_data.py."""
+    rng = np.random.default_rng(seed)
+    np.savez_compressed(
+        path,
+        images=rng.integers(0, 256, (frames, 224, 224, 3), dtype=np.uint8),
+        depth=rng.integers(0, 256, (frames, 224, 224, 1), dtype=np.uint8),
+        action=rng.uniform(-1, 1, (frames, 4, 1)).astype(np.float32),
+        gaze_coords=rng.random((frames, 2, 1), dtype=np.float32),
+    )
+    return path
+
+
+def synthetic_dataset(out_dir, episodes=4, frames=64, seed=0):
+    files = []
+    for i in range(episodes):
+        files.append(os.path.basename(synthetic_episode(os.path.join(out_dir, f"synthetic_{i}.npz"), frames, seed + i)))
+    return files
+
+
+def _timings(fn, repeats, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return np.array(times)
+
+
+def _latency(times, prefix=""):
+    return {
+        prefix + "mean_ms": 1000 * float(times.mean()),
+        prefix + "p50_ms": 1000 * float(np.percentile(times, 50)),
+        prefix + "p95_ms": 1000 * float(np.percentile(times, 95)),
+    }
+
+
+def bench_read_npz(data_dir, files, repeats=3):
+    from batch_loader import read_npz
+    path = os.path.join(data_dir, files[0])
+    frames = len(np.load(path)["action"])
+    times = _timings(lambda: read_npz(path), repeats)
+    return {"frames": frames, "seconds": float(times.mean()), "frames_per_sec": frames / float(times.mean())}
+
+
+def bench_generate(data_dir, files):
+    from batch_loader import generate_gril
+    start = time.perf_counter()
+    n = sum(1 for _ in generate_gril(data_dir.encode(), [f.encode() for f in files]))
+    elapsed = time.perf_counter() - start
+    return {"samples": n, "seconds": elapsed, "samples_per_sec": n / elapsed}
+
+
+def _build(model_name):
+    import models
+    if model_name == "gril":
+        # throughput does not depend on the ImageNet weights, skip the download
+        return models.gril(weights=None)
+    return getattr(models, model_name)()
+
+
+def _compile(model, jit_compile=False):
+    from losses import action_loss, my_kld
+    from precision import compile_model
+    losses = {"action": action_loss}
+    if "gaze" in model.output_names:
+        # il_cgl predicts a gaze heatmap, gril normalized gaze coordinates
+        heatmap = len(model.get_layer("gaze").output.shape) == 4
+        losses["gaze"] = my_kld if heatmap else "mean_squared_error"
+    return compile_model(model, losses, tf.keras.optimizers.Adam(1e-5), jit_compile=jit_compile)
+
+
+def _random_batch(tensors, batch_size, rng):
+    return [rng.random((batch_size,) + tuple(t.shape[1:]), dtype=np.float32) for t in tensors]
+
+
+def bench_train_step(model_name, batch_size=16, steps=10, precision="float32", jit_compile=False):
+    from precision import set_precision
+    set_precision(precision)
+    try:
+        model = _compile(_build(model_name), jit_compile)
+    finally:
+        set_precision("float32")
+    rng = np.random.default_rng(0)
+    x = dict(zip(model.input_names, _random_batch(model.inputs, batch_size, rng)))
+    y = dict(zip(model.output_names, _random_batch(model.outputs, batch_size, rng)))
+    times = _timings(lambda: model.train_on_batch(x, y), steps, warmup=2)
+    return {"batch_size": batch_size, "step_ms": 1000 * float(times.mean()),
+            "samples_per_sec": batch_size / float(times.mean())}
+
+
+def bench_arilnn(frames=50, camera_shape=(144, 256)):
+    from agil_airsim import arilNN
+    from inference import InferenceEngine
+    model = _build("gril")
+    rng = np.random.default_rng(0)
+    rgb = rng.integers(0, 256, camera_shape + (3,), dtype=np.uint8)
+    depth = rng.integers(0, 256, camera_shape, dtype=np.uint8)
+    engine = InferenceEngine(model)
+    results = _latency(_timings(lambda: arilNN(rgb, depth, engine), frames), "engine_")
+    results.update(_latency(_timings(lambda: arilNN(rgb, depth, model), max(frames // 5, 3)), "predict_"))
+    return results
+
+
+def bench_heatmap(frames=1000, sigma=10, repeats=3):
+    from read_gaze import preprocess_gaze_heatmap
+    gaze = np.random.default_rng(0).random((frames, 2))
+    times = _timings(lambda: preprocess_gaze_heatmap(gaze, sigma, shape=(224, 224)), repeats)
+    return {"frames": frames, "seconds": float(times.mean()), "frames_per_sec": frames / float(times.mean())}
+
+
+def run(suites=SUITES, models=MODELS, episodes=4, frames=64, batch_size=16, steps=10, data_dir=None,
+        precision="float32", jit_compile=False):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        if data_dir:
+            files = sorted(f for f in os.listdir(data_dir) if f.endswith(".npz"))
+            if not files:
+                raise ValueError(f"no npz episodes in {data_dir}")
+        else:
+            # synthetic episodes only ever go to the temporary directory
+            data_dir = tmp
+            files = synthetic_dataset(data_dir, episodes, frames)
+        if "read_npz" in suites:
+            results["read_npz"] = bench_read_npz(data_dir, files)
+        if "generate" in suites:
+            results["generate_gril"] = bench_generate(data_dir, files)
+    if "train_step" in suites:
+        # non-default modes get their own keys so baselines stay comparable
+        mode = "" if precision == "float32" else f"/{precision}"
+        mode += "/xla" if jit_compile else ""
+        for name in models:
+            results[f"train_step/{name}{mode}"] = bench_train_step(name, batch_size, steps, precision, jit_compile)
+    if "arilnn" in suites:
+        results["arilnn"] = bench_arilnn()
+    if "heatmap" in suites:
+        results["heatmap"] = bench_heatmap()
+    return results
+
+
+def environment():
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "tensorflow": tf.__version__,
+        "gpus": len(tf.config.list_physical_devices("GPU")),
+    }
+
+
+def compare(results, baseline, tolerance=0.1):
+    """Print current vs. baseline for every shared metric; returns the regressions."""
+    regressions = []
+    print(f"{'benchmark':<28} {'metric':<18} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if old is None or not old or metric in ("frames", "samples", "batch_size"):
+                continue
+            change = (value - old) / old
+            worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+            flag = "  REGRESSION" if worse > tolerance else ""
+            print(f"{name:<28} {metric:<18} {old:>12.3f} {value:>12.3f} {100 * change:>7.1f}%{flag}")
+            if flag:
+                regressions.append((name, metric, old, value))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark data prep, training steps and inference")
+    parser.add_argument("-o", "--out", type=str, default="benchmark.json", help="results JSON file")
+    parser.add_argument("-b", "--baseline", type=str, default=None, help="previous results to compare against")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.1, help="relative slowdown counted as a regression")
+    parser.add_argument("-s", "--suites", nargs="+", default=list(SUITES), choices=SUITES, help="suites to run")
+    parser.add_argument("-m", "--models", nargs="+", default=list(MODELS), choices=MODELS, help="models for train_step")
+    parser.add_argument("-d", "--data", type=str, default=None, help="benchmark on these npz files instead of synthetic ones")
+    parser.add_argument("-e", "--episodes", type=int, default=4, help="synthetic episodes")
+    parser.add_argument("-f", "--frames", type=int, default=64, help="frames per synthetic episode")
+    parser.add_argument("--batch-size", type=int, default=16, help="train_step batch size")
+    parser.add_argument("--steps", type=int, default=10, help="timed train steps per model")
+    parser.add_argument("--precision", type=str, default="float32",
+                        choices=["float32", "mixed_float16", "mixed_bfloat16"], help="train_step dtype policy")
+    parser.add_argument("--jit", action="store_true", help="XLA-compile the train_step models")
+
+    args = parser.parse_args()
+    results = run(args.suites, args.models, args.episodes, args.frames, args.batch_size, args.steps, args.data,
+                  args.precision, args.jit)
+    with open(args.out, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=1)
+    print(json.dumps(results, indent=1))
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"{len(regressions)} regression(s) beyond {100 * args.tolerance:.0f}%")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,181 @@
+'''
+Incremental build cache for the utils/prepare_*_data.py scripts.
+
+Every output (``<name>.npz`` or ``<name>.shard``) is recorded in
+``build_cache.json`` next to it together with a fingerprint of its inputs:
+the bytes of the episode's log.csv, name/size/mtime of every file under
+rgb/ and depth/, and the builder parameters (script, format, preprocessing
+specs). A rerun skips outputs whose fingerprint is unchanged and rebuilds
+only the stale ones.
+
+    python build_cache.py -d training_data     # manifest of what is built
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from sample_index import episode_frames
+from shards import SHARD_SUFFIX
+
+CACHE_NAME = "build_cache.json"
+# bump when a builder changes its output for the same inputs
+BUILD_VERSION = 1
+
+# frame folders of an episode that feed the fingerprint
+SOURCE_DIRS = ("rgb", "depth")
+
+BUILDING = "building"
+BUILT = "built"
+
+
+def episode_fingerprint(dirname, params=None):
+    """sha1 of log.csv, the stat of every source frame and ``params``."""
+    h = hashlib.sha1()
+    h.update(json.dumps({"version": BUILD_VERSION, "params": params or {}}, sort_keys=True, default=str).encode())
+    log = os.path.join(dirname, "log.csv")
+    if os.path.exists(log):
+        with open(log, "rb") as f:
+            h.update(f.read())
+    for sub in SOURCE_DIRS:
+        folder = os.path.join(dirname, sub)
+        if not os.path.isdir(folder):
+            continue
+        # stat only, reading every PNG would cost as much as the build
+        for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+            st = entry.stat()
+            h.update(f"{sub}/{entry.name}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def output_frames(path):
+    """Number of frames in a built npz or shard, None if it is not there."""
+    return episode_frames(path)
+
+
+def remove_output(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class BuildCache():
+    """
+    The ``build_cache.json`` of one output folder. Builders call
+    ``fresh()`` before an output and skip it if it is up to date, otherwise
+    ``start()`` before and ``done()`` after writing it.
+    """
+
+    def __init__(self, out_dir="."):
+        self.out_dir = out_dir
+        self.path = os.path.join(out_dir, CACHE_NAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)["outputs"]
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": BUILD_VERSION, "outputs": self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def fresh(self, out_name, fingerprint):
+        entry = self.entries.get(out_name)
+        if entry is None or entry["status"] != BUILT or entry["fingerprint"] != fingerprint:
+            return False
+        return output_frames(os.path.join(self.out_dir, out_name)) is not None
+
+    def start(self, out_name, source, fingerprint, params=None):
+        """
+        Mark ``out_name`` as being built from ``source``. Outputs built from
+        other inputs are removed; a partial shard of the same inputs is kept
+        so the builder can resume it.
+        """
+        entry = self.entries.get(out_name)
+        if entry is None or entry["fingerprint"] != fingerprint or entry["status"] == BUILT:
+            remove_output(os.path.join(self.out_dir, out_name))
+        self.entries[out_name] = {
+            "source": os.path.abspath(source),
+            "fingerprint": fingerprint,
+            "params": params or {},
+            "status": BUILDING,
+            "frames": None,
+            "built": None,
+        }
+        self.save()
+
+    def done(self, out_name):
+        entry = self.entries[out_name]
+        entry["frames"] = output_frames(os.path.join(self.out_dir, out_name))
+        entry["status"] = BUILT
+        entry["built"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.save()
+
+    def begin(self, out_name, source, params=None):
+        """
+        ``start()`` unless the output is up to date. Returns the fingerprint,
+        or None when ``out_name`` can be skipped.
+        """
+        fingerprint = episode_fingerprint(source, params)
+        if self.fresh(out_name, fingerprint):
+            print(f"{out_name} is up to date, skipping")
+            return None
+        self.start(out_name, source, fingerprint, params)
+        return fingerprint
+
+    def manifest(self):
+        """One row per recorded output, with its state against the current sources."""
+        rows = []
+        for name, entry in sorted(self.entries.items()):
+            if entry["status"] != BUILT:
+                state = "partial"
+            elif output_frames(os.path.join(self.out_dir, name)) is None:
+                state = "missing"
+            elif not os.path.isdir(entry["source"]):
+                state = "orphan"
+            elif episode_fingerprint(entry["source"], entry["params"]) != entry["fingerprint"]:
+                state = "stale"
+            else:
+                state = "ok"
+            rows.append({"output": name, "source": entry["source"], "frames": entry["frames"],
+                         "built": entry["built"], "state": state})
+        return rows
+
+
+def report(out_dir="."):
+    rows = BuildCache(out_dir).manifest()
+    print("=" * 100)
+    print("BUILD MANIFEST", os.path.abspath(out_dir))
+    print("=" * 100)
+    print(f"{'Output':<30} {'Frames':<8} {'State':<8} {'Built':<20} {'Source'}")
+    print("-" * 100)
+    for r in rows:
+        frames = r["frames"] if r["frames"] is not None else "-"
+        print(f"{r['output']:<30} {frames:<8} {r['state']:<8} {r['built'] or '-':<20} {r['source']}")
+    print("=" * 100)
+    states = [r["state"] for r in rows]
+    print(f"\nOutputs: {len(rows)}  up to date: {states.count('ok')}  stale: {states.count('stale')}  "
+          f"partial: {states.count('partial')}  missing: {states.count('missing')}")
+    print(f"Total frames built: {sum(r['frames'] or 0 for r in rows if r['state'] != 'missing')}")
+    return rows
+
+
+def output_name(out_name, fmt):
+    return out_name + (SHARD_SUFFIX if fmt == "shard" else ".npz")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="list the outputs recorded in a build cache")
+    parser.add_argument("-d", "--dir", type=str, default=".", help="output folder of the prepare_*_data.py scripts")
+    parser.add_argument("-j", "--json", action="store_true", help="print the manifest as JSON")
+
+    args = parser.parse_args()
+    if args.json:
+        print(json.dumps(BuildCache(args.dir).manifest(), indent=1))
+    else:
+        report(args.dir)
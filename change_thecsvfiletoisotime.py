@@ -1,31 +1,30 @@
 import pandas as pd
-from datetime import datetime
 
-def process_flight_data(file_path, output_path=None):
+from timestamps import IST_OFFSET_HOURS, TIME_COLUMN, epoch_ms_to_ns, ns_to_iso
+
+
+def process_flight_data(file_path, output_path=None, utc_offset_hours=IST_OFFSET_HOURS, iso=True):
     # Read the TXT file with tab separator
     df = pd.read_csv(file_path, sep='\t')
-    
-    # Convert Unix timestamp (milliseconds) to UTC datetime
-    df['absolute_timestamp_iso'] = pd.to_datetime(df['TimeStamp'], unit='ms', utc=True)
-    
-    # Convert from UTC to IST (Indian Standard Time)
-    df['absolute_timestamp_iso'] = df['absolute_timestamp_iso'].dt.tz_convert('Asia/Kolkata')
-    
-    # Remove timezone info to make it naive
-    df['absolute_timestamp_iso'] = df['absolute_timestamp_iso'].dt.tz_localize(None)
-    
-    # Convert to ISO format with 'T' separator 
-    df['absolute_timestamp_iso'] = df['absolute_timestamp_iso'].dt.strftime('%Y-%m-%dT%H:%M:%S.%f')
-    
+
+    # Unix timestamp (milliseconds) to int64 UTC nanoseconds; this is the
+    # column merge_with_closest_timestamp.py aligns on
+    df[TIME_COLUMN] = epoch_ms_to_ns(df['TimeStamp'].to_numpy())
+
+    # Local (IST) ISO string with 'T' separator, for reading only. The offset
+    # is applied numerically, no timezone database lookups
+    if iso:
+        df['absolute_timestamp_iso'] = ns_to_iso(df[TIME_COLUMN].to_numpy(), utc_offset_hours)
+
     # Display first few rows
     print("First 5 rows with new timestamp column:")
-    print(df[['VehicleName', 'TimeStamp', 'absolute_timestamp_iso']].head())
-    
+    print(df[['VehicleName', 'TimeStamp', TIME_COLUMN] + (['absolute_timestamp_iso'] if iso else [])].head())
+
     # Save to file if output path provided
     if output_path:
         df.to_csv(output_path, sep='\t', index=False)
         print(f"\nData saved to: {output_path}")
-    
+
     return df
 
 
@@ -0,0 +1,130 @@
+'''
+Episode bookkeeping for the rollout scripts.
+
+    manager = EpisodeManager(env, max_steps=500, max_seconds=120)
+    manager.start()
+    while not manager.done:
+        ...one control step...
+        manager.update(state)
+    print(manager.result())
+
+An episode ends on the first of: a collision, reaching the target object
+(Truck_4), the step budget or the wall-clock budget. Episodes are reset by
+teleporting the vehicle back to its start pose, which is much faster than
+client.reset() and keeps the vehicle armed and in the air.
+'''
+
+import math
+import time
+
+import airsim
+
+TARGET_NAME = 'Truck_4'
+
+# reasons an episode ended, in the order they are checked
+COLLISION = "collision"
+TARGET = "target"
+MAX_STEPS = "max_steps"
+TIMEOUT = "timeout"
+
+
+class EpisodeManager():
+    """
+    Budgets and termination checks for episodes on one vehicle. ``max_steps``
+    and ``max_seconds`` may be None for no limit; the target counts as
+    reached within ``target_radius`` meters, measured horizontally.
+    """
+
+    def __init__(self, env, max_steps=None, max_seconds=None, target_name=TARGET_NAME, target_radius=5.0,
+                 vehicle_name=""):
+        self.env = env
+        self.client = env.client
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.target_name = target_name
+        self.target_radius = target_radius
+        self.vehicle_name = vehicle_name
+        self.start_pose = None
+        self.episode = -1
+        self.reason = None
+
+    def start(self, spawn=None):
+        """
+        Teleport to the start pose and start a new episode. The first call
+        records the current pose as the start pose. ``spawn`` is an optional
+        (dx, dy, yaw) offset from it.
+        """
+        if self.start_pose is None:
+            self.start_pose = self.client.simGetVehiclePose(vehicle_name=self.vehicle_name)
+        self.teleport(spawn)
+
+        self.target = self.client.simGetObjectPose(self.target_name).position
+        # AirSim keeps reporting the last collision, only count newer ones
+        self._collision_stamp = self.client.simGetCollisionInfo(vehicle_name=self.vehicle_name).time_stamp
+        self.episode += 1
+        self.steps = 0
+        self.reason = None
+        self.reached_at = None
+        self.started = time.perf_counter()
+        self.ended = None
+
+    def teleport(self, spawn=None):
+        dx, dy, yaw = spawn if spawn is not None else (0.0, 0.0, None)
+        p, o = self.start_pose.position, self.start_pose.orientation
+        orientation = o if yaw is None else airsim.to_quaternion(0.0, 0.0, yaw)
+        pose = airsim.Pose(airsim.Vector3r(p.x_val + dx, p.y_val + dy, p.z_val),
+                           airsim.Quaternionr(orientation.x_val, orientation.y_val, orientation.z_val, orientation.w_val))
+        self.client.simSetVehiclePose(pose, True, vehicle_name=self.vehicle_name)
+        # drop the velocity left over from the last episode
+        self.client.moveByVelocityZAsync(0, 0, p.z_val, 0.1, vehicle_name=self.vehicle_name)
+
+    def collided(self):
+        info = self.client.simGetCollisionInfo(vehicle_name=self.vehicle_name)
+        return info.has_collided and info.time_stamp > self._collision_stamp
+
+    def target_distance(self, state):
+        position = state.kinematics_estimated.position
+        return math.hypot(position.x_val - self.target.x_val, position.y_val - self.target.y_val)
+
+    @property
+    def done(self):
+        return self.reason is not None
+
+    @property
+    def elapsed(self):
+        return (self.ended or time.perf_counter()) - self.started
+
+    def update(self, state=None):
+        """
+        Count one control step and check the end conditions. ``state`` is
+        the multirotor state of this step (fetched if not given). Returns
+        the reason the episode ended, or None while it goes on.
+        """
+        self.steps += 1
+        if state is None:
+            state = self.env.getState(self.vehicle_name)
+        if self.collided():
+            self.reason = COLLISION
+        elif self.target_distance(state) < self.target_radius:
+            self.reason = TARGET
+            self.reached_at = self.elapsed
+        elif self.max_steps is not None and self.steps >= self.max_steps:
+            self.reason = MAX_STEPS
+        elif self.max_seconds is not None and self.elapsed >= self.max_seconds:
+            self.reason = TIMEOUT
+        if self.reason is not None:
+            self.ended = time.perf_counter()
+        return self.reason
+
+    def result(self):
+        elapsed = self.elapsed
+        return {
+            "episode": self.episode,
+            "steps": self.steps,
+            "seconds": elapsed,
+            "reason": self.reason,
+            "collided": self.reason == COLLISION,
+            "reached_target": self.reason == TARGET,
+            "time_to_target": self.reached_at,
+            "commands_per_sec": self.steps / elapsed if elapsed else 0.0,
+        }
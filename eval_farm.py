@@ -0,0 +1,203 @@
+'''
+Evaluate a checkpoint over many episodes on several simulators at once.
+
+    python eval_farm.py -m gil.h5 -e 100 -w 4 --port 41451          # AirSim on ports 41451..41454
+    python eval_farm.py -m gil.h5 -e 100 -w 4 -r training_data      # replayed episodes, no simulator
+
+Every worker process drives one simulator (or a replay_client.ReplayClient)
+and pulls episode specs (seed + spawn offset) from a shared queue; on a
+replay worker the seed also picks the recording and its start frame, which
+the report lists per episode. The
+workers do not load TensorFlow: frames go to a single model server process
+that batches the pending requests of all workers into one forward pass.
+Episodes are bounded and reset by episode_manager.EpisodeManager; the
+per-episode metrics (collision, time to target, commands/sec) are collected
+into one JSON report.
+'''
+
+import argparse
+import json
+import math
+import multiprocessing as mp
+import os
+import queue
+import random
+import time
+
+import numpy as np
+
+
+def episode_specs(episodes, seed=0, spawn_range=5.0, yaw_range=math.pi / 6):
+    """Seed and spawn offset (x, y, yaw) relative to the start pose of every episode."""
+    rng = random.Random(seed)
+    specs = []
+    for i in range(episodes):
+        specs.append({
+            "episode": i,
+            "seed": rng.randrange(2**31),
+            "spawn": [rng.uniform(-spawn_range, spawn_range), rng.uniform(-spawn_range, spawn_range),
+                      rng.uniform(-yaw_range, yaw_range)],
+        })
+    return specs
+
+
+def model_server(model_path, batch_size, requests, responses):
+    """
+    Owns the model. Serves (worker, rgb, depth) requests with network-ready
+    inputs; all requests pending at the same time share one forward pass.
+    """
+    from inference import load_engine
+
+    engine = load_engine(model_path, batch_size=batch_size)
+    rgb = np.zeros_like(engine.buffers[0])
+    depth = np.zeros_like(engine.buffers[1])
+    while True:
+        pending = [requests.get()]
+        while len(pending) < batch_size:
+            try:
+                pending.append(requests.get_nowait())
+            except queue.Empty:
+                break
+        if any(p is None for p in pending):
+            return
+        for i, (worker, frame_rgb, frame_depth) in enumerate(pending):
+            rgb[i], depth[i] = frame_rgb[0], frame_depth[0]
+        commands, gaze = engine.run(rgb, depth)
+        for i, (worker, _, _) in enumerate(pending):
+            responses[worker].put(commands[i])
+
+
+def run_episode(env, manager, spec, infer, sc=10, duration=1.0):
+    from airsim_utils import commands_to_velocity
+
+    manager.start(spec["spawn"])
+    while not manager.done:
+        state = env.getState()
+        img_rgb, img_depth = env.getInputs()
+        commands = infer(img_rgb, img_depth)
+        vb, vz, ref_alt = commands_to_velocity(commands, state, sc)
+        env.controlQuadrotor(vb, vz, ref_alt, duration)
+        manager.update(state)
+    result = manager.result()
+    result.update({"episode": spec["episode"], "seed": spec["seed"]})
+    return result
+
+
+def worker(worker_id, connect, tasks, results, requests, response, episode_kwargs):
+    """Runs episodes from ``tasks`` until it gets None."""
+    from airsim_utils import AirSimEnv
+    from episode_manager import EpisodeManager
+
+    if "replay" in connect:
+        from replay_client import ReplayClient
+        client = ReplayClient(connect["replay"], latency=connect.get("latency", 0.0), seed=worker_id)
+    else:
+        import airsim
+        client = airsim.MultirotorClient(ip=connect.get("ip", ""), port=connect["port"])
+    env = AirSimEnv(client)
+    env.connectQuadrotor()
+    env.enableAPI(True)
+    env.armQuadrotor()
+    env.takeOff()
+    # episodes are reset by teleporting back to the pose after takeoff
+    manager = EpisodeManager(env, **episode_kwargs)
+
+    def infer(img_rgb, img_depth):
+        requests.put((worker_id, img_rgb, img_depth))
+        return response.get()
+
+    while True:
+        spec = tasks.get()
+        if spec is None:
+            break
+        replay = {}
+        if "replay" in connect:
+            # the episode seed picks the recording and where it starts
+            recording, start_frame = client.start(spec["seed"])
+            replay = {"recording": os.path.basename(recording), "start_frame": start_frame}
+        result = run_episode(env, manager, spec, infer)
+        result.update(replay)
+        result["worker"] = worker_id
+        results.put(result)
+
+
+def summarize(episodes):
+    n = len(episodes)
+    times = [e["time_to_target"] for e in episodes if e["time_to_target"] is not None]
+    return {
+        "episodes": n,
+        "collision_rate": sum(e["collided"] for e in episodes) / n if n else 0.0,
+        "success_rate": len(times) / n if n else 0.0,
+        "mean_time_to_target": float(np.mean(times)) if times else None,
+        "mean_commands_per_sec": float(np.mean([e["commands_per_sec"] for e in episodes])) if n else 0.0,
+        "total_steps": sum(e["steps"] for e in episodes),
+    }
+
+
+def evaluate(model_path, specs, connections, episode_kwargs=None):
+    """Run ``specs`` on one worker per entry of ``connections``; returns the report."""
+    ctx = mp.get_context("spawn")  # TensorFlow does not survive fork
+    tasks, results, requests = ctx.Queue(), ctx.Queue(), ctx.Queue()
+    responses = [ctx.Queue() for _ in connections]
+
+    server = ctx.Process(target=model_server, args=(model_path, len(connections), requests, responses), daemon=True)
+    server.start()
+    workers = [ctx.Process(target=worker, args=(i, c, tasks, results, requests, responses[i], episode_kwargs or {}),
+                           daemon=True) for i, c in enumerate(connections)]
+    for w in workers:
+        w.start()
+    for spec in specs:
+        tasks.put(spec)
+    for _ in workers:
+        tasks.put(None)
+
+    start = time.perf_counter()
+    episodes = []
+    while len(episodes) < len(specs):
+        try:
+            episodes.append(results.get(timeout=10))
+        except queue.Empty:
+            if not any(w.is_alive() for w in workers):
+                print("all workers exited with episodes left")
+                break
+            continue
+        e = episodes[-1]
+        print(f"episode {e['episode']} (worker {e['worker']}): {e['steps']} steps, ended by {e['reason']}")
+    wall = time.perf_counter() - start
+
+    for w in workers:
+        w.join()
+    requests.put(None)
+    server.join()
+
+    episodes.sort(key=lambda e: e["episode"])
+    report = summarize(episodes)
+    report.update({"model": model_path, "workers": len(connections), "wall_seconds": wall})
+    return {"summary": report, "episodes": episodes}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="evaluate a model over many episodes in parallel")
+    parser.add_argument("-m", "--model", type=str, help=".h5 or .tflite model")
+    parser.add_argument("-e", "--episodes", type=int, default=100, help="episodes to run")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="simulators/worker processes")
+    parser.add_argument("--ip", type=str, default="", help="AirSim host")
+    parser.add_argument("--port", type=int, default=41451, help="RPC port of the first simulator, one per worker from there")
+    parser.add_argument("-r", "--replay", type=str, default=None, help="replay npz/shard episodes instead of AirSim")
+    parser.add_argument("-l", "--latency", type=float, default=0.0, help="artificial RPC latency of the replay client")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="seed of the episode specs")
+    parser.add_argument("--max-steps", type=int, default=500, help="step budget per episode")
+    parser.add_argument("--max-seconds", type=float, default=120.0, help="wall-clock budget per episode")
+    parser.add_argument("-o", "--out", type=str, default="eval_report.json", help="report JSON file")
+
+    args = parser.parse_args()
+    if args.replay:
+        connections = [{"replay": args.replay, "latency": args.latency} for _ in range(args.workers)]
+    else:
+        connections = [{"ip": args.ip, "port": args.port + i} for i in range(args.workers)]
+
+    specs = episode_specs(args.episodes, args.seed)
+    report = evaluate(args.model, specs, connections, {"max_steps": args.max_steps, "max_seconds": args.max_seconds})
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=1)
+    print(json.dumps(report["summary"], indent=1))
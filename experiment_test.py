@@ -5,21 +5,19 @@ import time
 import tensorflow as tf
 import os
 from agil_airsim import arilNN
+from inference import load_engine
 import math
 import timeit
 import argparse
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
 
-from losses import action_loss
 from airsim_utils import AirSimEnv
-
-customObjects = {
-    'action_loss': action_loss
-}
+from episode_manager import EpisodeManager
 
 
 aril_model = "gil.h5"
-aril = tf.keras.models.load_model(aril_model, custom_objects=customObjects)
+# compiled once, reused every control step instead of model.predict
+aril = load_engine(aril_model)  # .h5 or an export_tflite.py .tflite file
 
 env = AirSimEnv()
 
@@ -36,6 +34,8 @@ parser = argparse.ArgumentParser(
 parser.add_argument('-e', '--episodes', type=int, help='Number of episodes to run', default=10)
 parser.add_argument('-d', '--duration', type=int, help='Duration of control command', default=1)
 parser.add_argument('-sc', '--sc', type=int, help='Constant related to ang->lin', default=10)
+parser.add_argument('-s', '--max-steps', type=int, help='Step budget of an episode', default=500)
+parser.add_argument('-t', '--max-seconds', type=float, help='Wall-clock budget of an episode in seconds', default=120)
 args = parser.parse_args()
 
 print(args)
@@ -45,17 +45,26 @@ EPISODES=args.episodes
 DURATION=args.duration
 SC=args.sc
 
+# ends episodes on collision, reaching Truck_4 or the budgets, and resets
+# them by teleporting back to the pose after takeoff
+manager = EpisodeManager(env, max_steps=args.max_steps, max_seconds=args.max_seconds)
+
 for i in range(EPISODES):
 
-    done = False
-    while not done:
+    manager.start()
+    while not manager.done:
 
-        img_rgb, img_depth =  env.getRGBImage(), env.getDepthImage()
-        commands,gaze = arilNN(img_rgb, img_depth, aril)
+        # decoded straight into the network input batches
+        img_rgb, img_depth =  env.getInputs()
+        commands,gaze = arilNN(img_rgb, img_depth, aril, preprocessed=True)
         roll     = float(commands[:,0])
         pitch    = float(commands[:,1])
         throttle = float(commands[:,2])
         yaw      = float(commands[:,3])
         vx, vy, vz, ref_alt = env.angularRatesToLinearVelocity(pitch, roll, yaw, throttle, SC)
         vb = env.inertialToBodyFrame(yaw, vx, vy)
-        env.controlQuadrotor(vb, vz, ref_alt, DURATION)
\ No newline at end of file
+        env.controlQuadrotor(vb, vz, ref_alt, DURATION)
+        # angularRatesToLinearVelocity fetched the state of this step
+        manager.update(env.state)
+
+    print(manager.result())
\ No newline at end of file
@@ -0,0 +1,157 @@
+'''
+Export trained gril/il_cgl/agil_airsim/vanilla_bc models to TFLite.
+
+    python export_tflite.py -m gil.h5 -o gil_int8.tflite -q int8 -d training_data --benchmark
+
+float16 stores the weights in half precision. int8 quantizes weights and
+activations post-training; the activation ranges are calibrated on frames
+drawn from our npz files/shards. A ``<out>.json`` sidecar records the input
+and output layout for tflite_engine.TFLiteEngine, and ``--benchmark``
+compares action error and per-frame latency against the float model.
+'''
+
+import argparse
+import json
+import os
+import random
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from inference import InferenceEngine, customObjects
+from shards import ShardReader, dequantize_pixels, is_shard
+from tflite_engine import TFLiteEngine, sidecar_path
+
+# dataset array feeding each model input
+INPUT_KEYS = {
+    "image": "images",
+    "depth": "depth",
+    "images": "images",
+    "gaze": "heatmap",
+}
+
+
+def _as_input(arr):
+    arr = np.asarray(arr)
+    if arr.dtype == np.uint8:
+        return dequantize_pixels(arr)
+    return arr.astype(np.float32)
+
+
+def read_inputs(file_path, input_names, num_samples=None):
+    """Model inputs of the first ``num_samples`` frames of one episode."""
+    keys = [INPUT_KEYS[name] for name in input_names]
+    if is_shard(file_path):
+        with ShardReader(file_path) as shard:
+            return [_as_input(shard.rows(k, 0, num_samples)) for k in keys]
+    with np.load(file_path) as data:
+        return [_as_input(data[k][:num_samples]) for k in keys]
+
+
+def sample_inputs(data_path, input_names, num_samples=200, seed=0):
+    """Up to ``num_samples`` single-frame input lists drawn across episodes."""
+    files = sorted(f for f in os.listdir(data_path) if f.endswith(".npz") or is_shard(os.path.join(data_path, f)))
+    random.Random(seed).shuffle(files)
+    samples = []
+    for f in files:
+        arrays = read_inputs(os.path.join(data_path, f), input_names, num_samples - len(samples))
+        for i in range(len(arrays[0])):
+            samples.append([a[i:i + 1] for a in arrays])
+        if len(samples) >= num_samples:
+            break
+    return samples
+
+
+def convert(model, quantize=None, samples=None):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        if not samples:
+            raise ValueError("int8 quantization needs representative data (-d/--data)")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: iter(samples)
+    elif quantize is not None:
+        raise ValueError(f"unknown quantization: {quantize}")
+    return converter.convert()
+
+
+def export(model, out_path, quantize=None, samples=None):
+    tflite_model = convert(model, quantize, samples)
+    with open(out_path, "wb") as f:
+        f.write(tflite_model)
+    meta = {
+        "input_names": list(model.input_names),
+        "output_names": list(model.output_names),
+        "output_shapes": [list(t.shape[1:]) for t in model.outputs],
+        "quantize": quantize,
+    }
+    with open(sidecar_path(out_path), "w") as f:
+        json.dump(meta, f, indent=1)
+    return out_path
+
+
+def _timed(engine, sample):
+    start = time.perf_counter()
+    out = engine.run(*sample)
+    return out, time.perf_counter() - start
+
+
+def benchmark(model, tflite_path, samples, num_threads=None):
+    """Action error of the TFLite model against the float Keras model, plus latency."""
+    keras_engine = InferenceEngine(model)
+    lite_engine = TFLiteEngine(tflite_path, num_threads=num_threads)
+    action_idx = list(model.output_names).index("action")
+
+    errors, keras_lat, lite_lat = [], [], []
+    for sample in samples:
+        ref, t_ref = _timed(keras_engine, sample)
+        out, t_out = _timed(lite_engine, sample)
+        ref = ref[action_idx] if isinstance(ref, list) else ref
+        out = out[action_idx] if isinstance(out, list) else out
+        errors.append(np.abs(ref - out))
+        keras_lat.append(t_ref)
+        lite_lat.append(t_out)
+
+    errors = np.concatenate(errors)
+    return {
+        "samples": len(samples),
+        "action_mae": errors.mean(axis=0).tolist(),
+        "action_max_abs_error": float(errors.max()),
+        "keras_ms_mean": 1000 * float(np.mean(keras_lat)),
+        "keras_ms_p95": 1000 * float(np.percentile(keras_lat, 95)),
+        "tflite_ms_mean": 1000 * float(np.mean(lite_lat)),
+        "tflite_ms_p95": 1000 * float(np.percentile(lite_lat, 95)),
+        "tflite_bytes": os.path.getsize(tflite_path),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="export trained models to TFLite")
+    parser.add_argument("-m", "--model", type=str, help="trained .h5/SavedModel")
+    parser.add_argument("-o", "--out", type=str, help="output .tflite file")
+    parser.add_argument("-q", "--quantize", type=str, default=None, choices=["float16", "int8"], help="post-training quantization")
+    parser.add_argument("-d", "--data", type=str, default=None, help="folder of npz/shard episodes for calibration and benchmark")
+    parser.add_argument("-n", "--num-samples", type=int, default=200, help="representative frames")
+    parser.add_argument("-t", "--threads", type=int, default=None, help="interpreter threads for the benchmark")
+    parser.add_argument("--benchmark", action="store_true", help="compare against the float model")
+    parser.add_argument("--report", type=str, default=None, help="write benchmark results to this JSON file")
+
+    args = parser.parse_args()
+    model = tf.keras.models.load_model(args.model, custom_objects=customObjects)
+    samples = sample_inputs(args.data, model.input_names, args.num_samples) if args.data else None
+
+    export(model, args.out, args.quantize, samples)
+    print(f"{args.model} -> {args.out} ({os.path.getsize(args.out)} bytes, quantize={args.quantize})")
+
+    if args.benchmark:
+        if not samples:
+            parser.error("--benchmark needs -d/--data")
+        results = benchmark(model, args.out, samples, args.threads)
+        results.update({"model": args.model, "tflite": args.out, "quantize": args.quantize})
+        print(json.dumps(results, indent=1))
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(results, f, indent=1)
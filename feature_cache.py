@@ -0,0 +1,63 @@
+'''
+Precompute the frozen MobileNet features used by gril().
+
+The backbone is run once per episode and the 7x7x1024 feature maps are
+written to a shard per episode (``<cache>/<episode>.shard``, row = frame)
+next to depth, action and gaze. gril_head() then trains from the cache
+through batch_loader.make_dataset(..., model="gril_head").
+'''
+
+import argparse
+import os
+
+import numpy as np
+
+from batch_loader import iter_episode
+from models import mobilenet_backbone
+from shards import SHARD_SUFFIX, ShardWriter, dequantize_pixels, is_shard
+
+FEATURE_SHAPE = (7, 7, 1024)
+
+
+def feature_shard_path(cache_dir, file_name):
+    episode = os.path.splitext(os.path.basename(os.fsdecode(file_name).rstrip("/")))[0]
+    return os.path.join(cache_dir, episode + SHARD_SUFFIX)
+
+
+def precompute_features(path, file_list, cache_dir, batch_size=64, dtype="float16", backbone=None):
+    """
+    Write one feature shard per episode in ``file_list``. Episodes already in
+    the cache are skipped. float16 halves the cache size; the head casts
+    back to float32 when reading.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    backbone = backbone if backbone is not None else mobilenet_backbone()
+
+    for file_name in file_list:
+        out_path = feature_shard_path(cache_dir, file_name)
+        if is_shard(out_path):
+            print("cached", out_path)
+            continue
+
+        print(file_name, "->", out_path)
+        tmp_path = out_path + ".tmp"
+        with ShardWriter(tmp_path, dtypes={"features": dtype}) as writer:
+            for imgs, depth, acts, gaze in iter_episode(os.path.join(path, file_name), chunk=batch_size):
+                for start in range(0, len(imgs), batch_size):
+                    stop = start + batch_size
+                    feats = backbone.predict_on_batch(dequantize_pixels(imgs[start:stop]))
+                    writer.append(features=np.asarray(feats), depth=depth[start:stop],
+                                  action=acts[start:stop], gaze_coords=gaze[start:stop])
+        # only complete episodes show up under the final name
+        os.replace(tmp_path, out_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="cache frozen MobileNet features for gril_head training")
+    parser.add_argument("-p", "--path", type=str, help="folder of npz/shard episodes")
+    parser.add_argument("-o", "--out", type=str, help="feature cache folder")
+    parser.add_argument("-b", "--batch-size", type=int, default=64, help="frames per backbone call")
+    parser.add_argument("--dtype", type=str, default="float16", choices=["float16", "float32"], help="feature storage dtype")
+
+    args = parser.parse_args()
+    precompute_features(args.path, sorted(os.listdir(args.path)), args.out, args.batch_size, args.dtype)
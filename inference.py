@@ -0,0 +1,75 @@
+'''
+Low-latency inference for the rollout loop.
+
+Keras ``predict`` builds a data adapter on every call, which dominates the
+cost of a single-frame forward pass. InferenceEngine traces the model once
+into a tf.function with a fixed input signature, preprocesses frames into
+preallocated buffers and does no per-step logging.
+'''
+
+import numpy as np
+import tensorflow as tf
+
+from losses import action_loss, cgl_kl, my_kld, my_softmax
+from latency import stage
+from preprocessing import INPUT_SPECS, fill_input
+from tflite_engine import TFLiteEngine
+
+customObjects = {
+    'action_loss': action_loss,
+    'my_softmax': my_softmax,
+    'my_kld': my_kld,
+    'cgl_kl': cgl_kl,
+}
+
+
+class InferenceEngine():
+    """
+    Wraps a Keras model for repeated fixed-size forward passes. Call it with
+    one raw camera frame per model input (in model input order), or with a
+    batch of frames per input when ``batch_size`` > 1. Inputs that are not
+    camera frames (see preprocessing.INPUT_SPECS) are passed through.
+    """
+
+    def __init__(self, model, batch_size=1, jit_compile=False):
+        self.model = model
+        self.batch_size = batch_size
+        self.input_names = list(model.input_names)
+        self.specs = [INPUT_SPECS.get(name) for name in self.input_names]
+        self.buffers = [np.zeros((batch_size,) + tuple(t.shape[1:]), dtype=np.float32) for t in model.inputs]
+
+        signature = [tf.TensorSpec(shape=b.shape, dtype=tf.float32) for b in self.buffers]
+        self._forward = tf.function(self._call_model, input_signature=signature, jit_compile=jit_compile)
+        # trace once up front so the first control step is not slowed down
+        self._forward(*self.buffers)
+
+    def _call_model(self, *inputs):
+        return self.model(list(inputs), training=False)
+
+    def run(self, *inputs):
+        """Forward pass on already preprocessed float32 batches."""
+        outputs = self._forward(*inputs)
+        if isinstance(outputs, (list, tuple)):
+            return [o.numpy() for o in outputs]
+        return outputs.numpy()
+
+    def __call__(self, *frames):
+        if len(frames) != len(self.buffers):
+            raise ValueError(f"model expects inputs {self.input_names}, got {len(frames)} frames")
+        with stage("preprocess"):
+            for frame, spec, buf in zip(frames, self.specs, self.buffers):
+                fill_input(frame, spec, buf)
+        with stage("inference"):
+            return self.run(*self.buffers)
+
+
+def load_engine(model_path, batch_size=1, jit_compile=False, num_threads=None):
+    """
+    Load a trained model and wrap it for rollouts: .tflite files exported by
+    export_tflite.py get the TFLite interpreter, .h5/SavedModel the
+    tf.function engine.
+    """
+    if str(model_path).endswith(".tflite"):
+        return TFLiteEngine(model_path, batch_size=batch_size, num_threads=num_threads)
+    model = tf.keras.models.load_model(model_path, custom_objects=customObjects)
+    return InferenceEngine(model, batch_size=batch_size, jit_compile=jit_compile)
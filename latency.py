@@ -0,0 +1,152 @@
+'''
+Per-stage latency instrumentation for the rollout loop.
+
+    from latency import TRACKER, stage
+
+    with stage("inference"):
+        commands, gaze = arilNN(img_rgb, img_depth, aril)
+
+Every stage keeps its last ``window`` durations in a ring buffer, so
+p50/p95/p99 summaries cost a fixed amount of memory however long the flight
+is. Timed spans are also kept (bounded) for a Chrome trace export that can
+be opened in chrome://tracing or Perfetto. Recording a span is one
+perf_counter call on each side plus a ring buffer write, cheap enough to
+leave on during flights; ``TRACKER.enabled = False`` turns it off entirely.
+'''
+
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+class RingHistogram():
+    """Last ``size`` samples of a duration, in seconds."""
+
+    def __init__(self, size=4096):
+        self.values = np.zeros(size, dtype=np.float64)
+        self.count = 0
+
+    def add(self, value):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+
+    def window(self):
+        return self.values[:min(self.count, len(self.values))]
+
+    def summary(self):
+        vals = self.window()
+        if len(vals) == 0:
+            return {"count": 0}
+        p50, p95, p99 = np.percentile(vals, (50, 95, 99))
+        return {
+            "count": self.count,
+            "mean_ms": 1000 * float(vals.mean()),
+            "p50_ms": 1000 * float(p50),
+            "p95_ms": 1000 * float(p95),
+            "p99_ms": 1000 * float(p99),
+            "max_ms": 1000 * float(vals.max()),
+        }
+
+
+class LatencyTracker():
+    """Stage timers with ring-buffered histograms and a bounded span log."""
+
+    def __init__(self, window=4096, max_events=100000, report_every=None, enabled=True):
+        self.window = window
+        self.report_every = report_every
+        self.enabled = enabled
+        self.hists = {}
+        self.events = collections.deque(maxlen=max_events)
+        self.t0 = time.perf_counter()
+        self._last_report = self.t0
+        self._lock = threading.Lock()
+
+    def record(self, name, start, end):
+        with self._lock:
+            hist = self.hists.get(name)
+            if hist is None:
+                hist = self.hists[name] = RingHistogram(self.window)
+            hist.add(end - start)
+            self.events.append((name, start, end - start, threading.get_ident()))
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def timed(self, name):
+        """Decorator form of ``stage``."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(name, start, time.perf_counter())
+            return wrapper
+        return decorator
+
+    def summary(self):
+        with self._lock:
+            return {name: hist.summary() for name, hist in self.hists.items()}
+
+    def report(self):
+        print(f"{'stage':<24} {'count':>8} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)")
+        for name, s in sorted(self.summary().items()):
+            if s["count"]:
+                print(f"{name:<24} {s['count']:>8} {s['mean_ms']:>8.2f} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f}")
+
+    def maybe_report(self):
+        """Print a summary if ``report_every`` seconds passed since the last one."""
+        if self.report_every is None:
+            return
+        now = time.perf_counter()
+        if now - self._last_report >= self.report_every:
+            self._last_report = now
+            self.report()
+
+    def export_chrome_trace(self, path):
+        pid = os.getpid()
+        with self._lock:
+            events = [{"name": name, "ph": "X", "pid": pid, "tid": tid,
+                       "ts": 1e6 * (start - self.t0), "dur": 1e6 * dur}
+                      for name, start, dur, tid in self.events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def export_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=1)
+
+    def reset(self):
+        with self._lock:
+            self.hists = {}
+            self.events.clear()
+            self.t0 = self._last_report = time.perf_counter()
+
+
+# process-wide tracker used by airsim_utils, inference and rollout
+TRACKER = LatencyTracker()
+
+
+def stage(name):
+    return TRACKER.stage(name)
+
+
+def timed(name):
+    return TRACKER.timed(name)
@@ -4,19 +4,29 @@ from tensorflow import keras
 import os
 import random
 
+# roll, pitch, throttle, yaw
+#ACTION_WEIGHTS = (0.40, 0.10, 0.10, 0.40)
+# ACTION_WEIGHTS = (0.005, 0.005, 0.005, 0.85)
+ACTION_WEIGHTS = (0.10, 0.10, 0.10, 0.70)
+
+
+def _float32(y_true, y_pred):
+    # losses are computed in float32 whatever the labels and the compute
+    # dtype of the model (mixed precision outputs may be float16)
+    return tf.cast(y_true, tf.float32), tf.cast(y_pred, tf.float32)
+
 
 def action_loss(y_true, y_pred):
     """
     Weighted MSE for control commands. This loss function gives
     higher weightage to errors in roll and yaw commands
-    The weight coefficient are [0.40, 0.10,0.10, 0.40]
+    The weight coefficient are [0.10, 0.10, 0.10, 0.70]
     for roll, pitch, throttle and yaw respectively
     """
 
+    y_true, y_pred = _float32(y_true, y_pred)
     squared_difference = tf.square(y_true - y_pred)
-    #weights = np.array([[0.40, 0.10, 0.10, 0.40]])
-    # weights = np.array([[0.005, 0.005, 0.005, 0.85]])
-    weights = np.array([[0.10, 0.10, 0.10, 0.70]])
+    weights = tf.constant([ACTION_WEIGHTS], dtype=tf.float32)
 
     weighted_squared_difference = weights*squared_difference
 
@@ -39,6 +49,7 @@ def my_kld(y_true, y_pred):
     Correct keras bug. Compute the KL-divergence between two metrics.
     """
     epsilon = 1e-10  # introduce epsilon to avoid log and division by zero error
+    y_true, y_pred = _float32(y_true, y_pred)
     y_true = keras.backend.clip(y_true, epsilon, 1)
     y_pred = keras.backend.clip(y_pred, epsilon, 1)
     return keras.backend.sum(y_true * keras.backend.log(y_true / y_pred), axis=[1, 2, 3])
@@ -47,6 +58,7 @@ def my_kld(y_true, y_pred):
 def cgl_kl(y_true, y_pred):
     '''CGL loss function'''
     epsilon = 2.2204e-16 # introduce epsilon to avoid log and division by zero error
+    y_true, y_pred = _float32(y_true, y_pred)
     y_true2 = keras.backend.clip(y_true, epsilon, 1)
     y_pred = keras.backend.clip(y_pred, epsilon, 1)
     return keras.backend.sum(y_true * keras.backend.log(y_true2 / y_pred)) #for old Keras need axis = [1,2,3]
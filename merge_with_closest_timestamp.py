@@ -1,67 +1,54 @@
-import pandas as pd
-
-# Define the specific timestamp formats for each file
-# Updated AirSim format: no timezone part and with 'T' separator
-AIRSIM_TS_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
-GAZE_TS_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
-
-# Load files
-try:
-    # Use tab separator for AirSim file as before
-    airsim = pd.read_csv('flight_data_with_iso_timestamp.csv', sep='\t')
-    
-    gaze = pd.read_csv('gaze_log.csv')
-except FileNotFoundError as e:
-    print(f"Error loading files: {e}")
-    exit()
-
-# Convert timestamps using the specific formats
-
-# AirSim timestamps are now naive timestamps without timezone info, so no utc=True
-airsim['absolute_timestamp_iso'] = pd.to_datetime(
-    airsim['absolute_timestamp_iso'],
-    format=AIRSIM_TS_FORMAT,
-    errors='coerce'
-)
-
-# Gaze timestamps parsed with utc=True (timezone-aware)
-gaze['absolute_timestamp_iso'] = pd.to_datetime(
-    gaze['absolute_timestamp_iso'],
-    format=GAZE_TS_FORMAT,
-    errors='coerce',
-    utc=True
-)
-
-# To merge correctly, convert gaze timestamps to naive (remove timezone info)
-gaze['absolute_timestamp_iso'] = gaze['absolute_timestamp_iso'].dt.tz_localize(None)
-
-# Drop any rows where timestamp conversion failed
-airsim.dropna(subset=['absolute_timestamp_iso'], inplace=True)
-gaze.dropna(subset=['absolute_timestamp_iso'], inplace=True)
-
-# Check if dataframes are empty before proceeding
-if airsim.empty or gaze.empty:
-    print("\nERROR: One or both dataframes are still empty after parsing. Cannot merge.")
-    print("Please check the AirSim file to confirm it is tab-separated.")
-    exit()
-
-# Sort values (required for merge_asof)
-airsim = airsim.sort_values('absolute_timestamp_iso')
-gaze = gaze.sort_values('absolute_timestamp_iso')
-
-# --- Perform the merge ---
-# Find the absolute nearest gaze point for each airsim point
-merged = pd.merge_asof(
-    airsim,
-    gaze[['absolute_timestamp_iso', 'x', 'y', 'confidence']],
-    on='absolute_timestamp_iso',
-    direction='nearest'  # Using 'nearest' with no tolerance for the first attempt
-)
-
-# Save the final merged result
-merged.to_csv('airsim_with_gaze_closest.csv', index=False)
-
-print("Script finished successfully. Merged data saved to 'airsim_with_gaze_closest.csv'.")
-print(f"Total rows in merged file: {len(merged)}")
-print("Merged file head:")
-print(merged.head())
\ No newline at end of file
+import argparse
+
+from timestamps import IST_OFFSET_HOURS, read_flight_log, read_gaze_log, stream_align
+
+GAZE_COLUMNS = ['x', 'y', 'confidence']
+
+
+def merge(flight_path, gaze_path, output_path, tolerance_ms=None, method='nearest',
+          utc_offset_hours=IST_OFFSET_HOURS, chunksize=100000):
+    """
+    Join the closest (or interpolated) gaze sample to every AirSim row. Both
+    logs are aligned on int64 UTC nanoseconds and streamed in chunks.
+    """
+    # Use tab separator for AirSim file as before; both the raw recording and
+    # the output of change_thecsvfiletoisotime.py carry the epoch ms TimeStamp
+    flight = read_flight_log(flight_path, chunksize)
+    gaze = read_gaze_log(gaze_path, utc_offset_hours, chunksize)
+
+    rows = 0
+    matched = 0
+    for i, merged in enumerate(stream_align(flight, gaze, GAZE_COLUMNS, tolerance_ms, method)):
+        merged.to_csv(output_path, index=False, mode='w' if i == 0 else 'a', header=i == 0)
+        rows += len(merged)
+        matched += int(merged['x'].notna().sum())
+        if i == 0:
+            print("Merged file head:")
+            print(merged.head())
+    return rows, matched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="attach the closest gaze sample to every AirSim log row")
+    parser.add_argument("-f", "--flight", type=str, default='flight_data_with_iso_timestamp.csv', help="AirSim recording (tab separated)")
+    parser.add_argument("-g", "--gaze", type=str, default='gaze_log.csv', help="gaze log written by track_gaze.py")
+    parser.add_argument("-o", "--out", type=str, default='airsim_with_gaze_closest.csv', help="merged csv")
+    parser.add_argument("-t", "--tolerance", type=float, default=None, help="max time difference in ms, none by default")
+    parser.add_argument("-m", "--method", type=str, default='nearest', choices=['nearest', 'interp'], help="gaze join")
+    parser.add_argument("-z", "--utc-offset", type=float, default=IST_OFFSET_HOURS, help="UTC offset of the gaze log's wall clock in hours")
+    parser.add_argument("-c", "--chunksize", type=int, default=100000, help="rows per chunk")
+
+    args = parser.parse_args()
+    try:
+        rows, matched = merge(args.flight, args.gaze, args.out, args.tolerance, args.method, args.utc_offset, args.chunksize)
+    except FileNotFoundError as e:
+        print(f"Error loading files: {e}")
+        exit()
+
+    if rows == 0:
+        print("\nERROR: the AirSim log is empty. Cannot merge.")
+        print("Please check the AirSim file to confirm it is tab-separated.")
+        exit()
+
+    print(f"Script finished successfully. Merged data saved to '{args.out}'.")
+    print(f"Total rows in merged file: {rows} ({matched} with gaze)")
@@ -12,23 +12,30 @@ from tensorflow.keras.layers import Conv2D
 from tensorflow.keras.layers import MaxPool2D
 from tensorflow.keras.layers import Concatenate
 from tensorflow.keras.applications import mobilenet
+from losses import my_softmax
 
-def gril():
+# Output layers are pinned to float32, so under a mixed precision policy
+# (precision.py) only the hidden layers compute in float16/bfloat16.
 
+def mobilenet_backbone(weights='imagenet'):
+    """Frozen ImageNet MobileNet used as the RGB encoder of gril()."""
     mobilenet = tf.keras.applications.mobilenet.MobileNet(
     include_top=False,
-    weights='imagenet',
+    weights=weights,
     input_tensor=None,
     input_shape=(224,224,3),
     pooling=None,
     )
 
     mobilenet.trainable = False
+    return mobilenet
 
-    # RGB Channel
-    rgb = Input(shape=(224,224,3), name='image')
 
-    x = mobilenet(rgb, training = False) #todo::here in the og code it was resnet instead of mobilenet
+def _gril_heads(x, depth):
+    """
+    Everything in gril() after the MobileNet feature map: the RGB and depth
+    conv stacks and the action/gaze prediction heads.
+    """
 
     x = Conv2D(64, (5,5), strides=2, padding='same', activation='relu')(x)
 
@@ -43,7 +50,6 @@ def gril():
     rgb_flat = Flatten()(pool11)
 
     # Depth Channel
-    depth = Input(shape=(224,224,1), name='depth')# depth = Input(shape=(224,224,3), name='depth')
     conv21 = Conv2D(64, (5,5), strides=2, padding='same', activation='relu')(depth)
 
     conv22 = Conv2D(64, (5,5), strides=2, padding='same', activation='relu')(conv21)
@@ -71,7 +77,7 @@ def gril():
     x1= Dense(64, activation='elu')(x1)
 
     # action = Dense(4, activation='softmax')(x1)
-    action = Dense(4, name='action')(x1)
+    action = Dense(4, name='action', dtype='float32')(x1)
 
 
     # conv1 = Conv2D(32, kernel_size=3, activation='relu')(shared_layer)
@@ -85,18 +91,65 @@ def gril():
     x2= Dense(64, activation='relu')(x2)
 
     # gaze= Dense(2, activation='softmax')(x2)
-    gaze= Dense(2, name='gaze')(x2)
+    gaze= Dense(2, name='gaze', dtype='float32')(x2)
 
     # conv2 = Conv2D(16, kernel_size=3, activation='relu')(shared_layer)
     # pool2 = MaxPool2D(pool_size=(2, 2))(conv2)
     # gaze = Flatten()(pool2)
 
+    return action, gaze
+
+
+def gril(weights='imagenet'):
+
+    mobilenet = mobilenet_backbone(weights)
+
+    # RGB Channel
+    rgb = Input(shape=(224,224,3), name='image')
+
+    x = mobilenet(rgb, training = False) #todo::here in the og code it was resnet instead of mobilenet
+
+    # Depth Channel
+    depth = Input(shape=(224,224,1), name='depth')# depth = Input(shape=(224,224,3), name='depth')
+
+    action, gaze = _gril_heads(x, depth)
+
     model = Model(inputs = [rgb, depth], outputs=[action, gaze])
 
     model.summary()
     return model
 
 
+def gril_head():
+    """
+    gril() without the frozen MobileNet. Takes the cached 7x7x1024 feature
+    maps written by feature_cache.py, so training only runs the layers
+    that actually change.
+    """
+
+    features = Input(shape=(7,7,1024), name='features')
+
+    depth = Input(shape=(224,224,1), name='depth')
+
+    action, gaze = _gril_heads(features, depth)
+
+    model = Model(inputs = [features, depth], outputs=[action, gaze])
+
+    model.summary()
+    return model
+
+
+def transfer_head_weights(head_model, model):
+    """Copy trained gril_head() weights into a gril() model for rollouts."""
+    src = [l for l in head_model.layers if l.weights]
+    dst = [l for l in model.layers if l.weights and not isinstance(l, Model)]
+    if len(src) != len(dst):
+        raise ValueError("gril_head and gril layer layouts do not match")
+    for s, d in zip(src, dst):
+        d.set_weights(s.get_weights())
+    return model
+
+
 def agil_airsim():
     ###############################
     # Zhang et.al "AGIL: Learning Attention from Human for Visuomotor Tasks"
@@ -155,7 +208,7 @@ def agil_airsim():
     x=L.Dense(256, activation='elu')(x)
     x=L.Dense(128, activation='elu')(x)
     #x=L.Dropout(dropout)(x)
-    output=L.Dense(num_action, name='action')(x)
+    output=L.Dense(num_action, name='action', dtype='float32')(x)
 
     agil_airsim_model=keras.Model(inputs=[imgs, gaze_heatmaps], outputs=output)
     agil_airsim_model.summary()
@@ -187,7 +240,7 @@ def il_cgl():
     # CGL conv output
     last_conv = L.Conv2D(1, (1,1), strides=1, padding='same')
     z = last_conv(x)
-    cgl_out = L.Activation(my_softmax, name="gaze")(z)
+    cgl_out = L.Activation(my_softmax, name="gaze", dtype="float32")(z)
 
     y = L.MaxPooling2D(pool_size=(2, 2), strides=(2, 2))(x)
 
@@ -200,7 +253,7 @@ def il_cgl():
     #x = L.Dropout(0.5)(x)
     y = L.Dense(64, activation='elu')(y)
 
-    action = Dense(4, name="action")(y)
+    action = Dense(4, name="action", dtype="float32")(y)
 
 
     model = Model(inputs=rgb, outputs=[cgl_out, action])
@@ -235,7 +288,7 @@ def vanilla_bc():
     #x = L.Dropout(0.5)(x)
     x = L.Dense(64, activation='elu')(x)
 
-    output= Dense(4, name="action")(x)
+    output= Dense(4, name="action", dtype="float32")(x)
 
 
     model=Model(inputs=inputs, outputs=output)
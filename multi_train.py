@@ -0,0 +1,218 @@
+'''
+Train several baselines in one pass over the data.
+
+    python multi_train.py -t training_data -v validation_data -m gril il_cgl vanilla_bc agil_airsim -o runs/sweep
+
+Every batch is read, decoded and augmented once (batch_loader.make_dataset
+in the gril layout: image, depth, action, gaze coordinates) and then
+converted in the tf.data graph into the inputs and targets of each model:
+
+    gril          image, depth           -> action, gaze coordinates
+    il_cgl        image                  -> 28x28 gaze heatmap, action
+    vanilla_bc    image                  -> action
+    agil_airsim   grayscale image, heatmap -> action
+
+Each model has its own optimizer, losses, CSV log and checkpoint folder
+(``<out>/<model>/``); the models take one train step each per batch.
+'''
+
+import argparse
+import csv
+import os
+import time
+
+import tensorflow as tf
+
+import models
+from batch_loader import make_dataset
+from losses import action_loss, cgl_kl, my_kld
+from precision import PRECISIONS, compile_model, set_precision
+from sample_index import SampleIndex
+
+MODELS = ("gril", "il_cgl", "vanilla_bc", "agil_airsim")
+
+LOSSES = {
+    "action_loss": action_loss,
+    "my_kld": my_kld,
+    "cgl_kl": cgl_kl,
+    "mean_squared_error": "mean_squared_error",
+}
+
+# default loss per model output
+MODEL_LOSSES = {
+    "gril": {"action": "action_loss", "gaze": "mean_squared_error"},
+    "il_cgl": {"gaze": "cgl_kl", "action": "action_loss"},
+    "vanilla_bc": {"action": "action_loss"},
+    "agil_airsim": {"action": "action_loss"},
+}
+
+# gaze heatmap width in pixels of a 224x224 frame, as in prepare_agil_data.py
+HEATMAP_SIGMA = 10.0
+
+
+def gaze_heatmap(gaze, size, sigma=HEATMAP_SIGMA):
+    """
+    (N, size, size, 1) Gaussian maps summing to 1 from (N, 2, 1) normalized
+    gaze coordinates, the TF counterpart of read_gaze.preprocess_gaze_heatmap.
+    """
+    sigma = sigma * size / 224.0
+    centers = (tf.range(size, dtype=tf.float32) + 0.5) / size
+    gx = tf.cast(gaze[:, 0], tf.float32)
+    gy = tf.cast(gaze[:, 1], tf.float32)
+    kx = tf.exp(-0.5 * tf.square((centers[None, :] - gx) * size / sigma))
+    ky = tf.exp(-0.5 * tf.square((centers[None, :] - gy) * size / sigma))
+    maps = ky[:, :, None] * kx[:, None, :]
+    maps = maps / tf.maximum(tf.reduce_sum(maps, axis=[1, 2], keepdims=True), 1e-12)
+    return maps[..., None]
+
+
+def model_batch(name, inputs, targets):
+    """Inputs and targets of model ``name`` from one shared gril-layout batch."""
+    image, gaze, action = inputs["image"], targets["gaze"], targets["action"]
+    if name == "gril":
+        return {"image": image, "depth": inputs["depth"]}, {"action": action, "gaze": gaze}
+    if name == "il_cgl":
+        return {"image": image}, {"gaze": gaze_heatmap(gaze, 28), "action": action}
+    if name == "vanilla_bc":
+        return {"image": image}, {"action": action}
+    if name == "agil_airsim":
+        return {"images": tf.image.rgb_to_grayscale(image), "gaze": gaze_heatmap(gaze, 224)}, {"action": action}
+    raise ValueError(f"no batch adapter for model {name}")
+
+
+def split_batch(names):
+    def split(inputs, targets):
+        return {name: model_batch(name, inputs, targets) for name in names}
+    return split
+
+
+def match_outputs(model, targets):
+    # the action heads end in Dense(4), the stored labels are (4, 1)
+    shapes = dict(zip(model.output_names, model.outputs))
+    return {k: tf.reshape(v, [-1] + list(shapes[k].shape[1:])) if k in shapes else v for k, v in targets.items()}
+
+
+def build(name, losses=None, learning_rate=1e-5, weights="imagenet", jit_compile=False):
+    model = models.gril(weights=weights) if name == "gril" else getattr(models, name)()
+    names = dict(MODEL_LOSSES[name], **(losses or {}))
+    lr_schedule = tf.keras.optimizers.schedules.ExponentialDecay(
+        initial_learning_rate=learning_rate,
+        decay_steps=10000,
+        decay_rate=0.9)
+    opt = tf.keras.optimizers.Adam(learning_rate=lr_schedule, epsilon=10e-4)
+    return compile_model(model, {k: LOSSES[v] for k, v in names.items()}, opt, jit_compile=jit_compile)
+
+
+class ModelRun():
+    """One model of the sweep: its checkpoint folder, CSV log and running losses."""
+
+    def __init__(self, name, model, out_dir):
+        self.name = name
+        self.model = model
+        self.dir = os.path.join(out_dir, name)
+        os.makedirs(self.dir, exist_ok=True)
+        self.log_path = os.path.join(self.dir, f"{name}.log")
+        self.sums = {}
+        self.steps = 0
+
+    def _add(self, logs, prefix=""):
+        for k, v in logs.items():
+            self.sums[prefix + k] = self.sums.get(prefix + k, 0.0) + float(v)
+
+    def train(self, x, y):
+        logs = self.model.train_on_batch(x, match_outputs(self.model, y), return_dict=True)
+        self._add(logs)
+        self.steps += 1
+        return logs
+
+    def validate(self, x, y):
+        self._add(self.model.test_on_batch(x, match_outputs(self.model, y), return_dict=True), "val_")
+
+    def end_epoch(self, epoch, val_steps=0):
+        logs = {"epoch": epoch}
+        for k, v in sorted(self.sums.items()):
+            logs[k] = v / (val_steps if k.startswith("val_") else max(self.steps, 1))
+        write_header = not os.path.exists(self.log_path)
+        with open(self.log_path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(logs))
+            if write_header:
+                writer.writeheader()
+            writer.writerow(logs)
+        self.model.save(os.path.join(self.dir, f"{self.name}.h5"))
+        self.sums, self.steps = {}, 0
+        return logs
+
+
+def train(train_path, names=MODELS, val_path=None, out_dir="runs", epochs=30, batch_size=32,
+          augment=(), losses=None, weights="imagenet", seed=None, precision="float32", jit_compile=False):
+    """
+    Train ``names`` side by side, one read of the data per epoch for all of
+    them. ``precision`` and ``jit_compile`` are passed on to precision.py.
+    """
+    index = SampleIndex.build(train_path)
+    steps = index.steps(batch_size)
+    print(f"{index.num_samples} training samples in {len(index)} episodes, {steps} steps per epoch")
+    ds = make_dataset(train_path, index.files, model="gril", batch_size=batch_size, seed=seed, augment=augment,
+                      num_samples=index.num_samples)
+    ds = ds.map(split_batch(names), num_parallel_calls=tf.data.experimental.AUTOTUNE)
+    val = None
+    if val_path:
+        val_index = SampleIndex.build(val_path)
+        val = make_dataset(val_path, val_index.files, model="gril", batch_size=batch_size, shuffle_buffer=0,
+                           num_samples=val_index.num_samples)
+        val = val.map(split_batch(names), num_parallel_calls=tf.data.experimental.AUTOTUNE)
+
+    set_precision(precision)
+    runs = [ModelRun(name, build(name, (losses or {}).get(name), weights=weights, jit_compile=jit_compile), out_dir)
+            for name in names]
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        step = 0
+        for batch in ds:
+            for run in runs:
+                run.train(*batch[run.name])
+            step += 1
+        val_steps = 0
+        if val is not None:
+            for batch in val:
+                for run in runs:
+                    run.validate(*batch[run.name])
+                val_steps += 1
+        elapsed = time.perf_counter() - start
+        print(f"epoch {epoch + 1}/{epochs}: {step}/{steps} steps in {elapsed:.1f}s")
+        for run in runs:
+            logs = run.end_epoch(epoch, val_steps)
+            print("   ", run.name, {k: round(v, 5) for k, v in logs.items() if k != "epoch"})
+    return [run.model for run in runs]
+
+
+def parse_losses(specs):
+    """``model:output=loss`` strings to {model: {output: loss}}."""
+    losses = {}
+    for spec in specs or []:
+        target, loss = spec.split("=")
+        name, output = target.split(":")
+        if loss not in LOSSES:
+            raise ValueError(f"unknown loss {loss}, expected one of {sorted(LOSSES)}")
+        losses.setdefault(name, {})[output] = loss
+    return losses
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="train several models on one stream of batches")
+    parser.add_argument("-t", "--train", type=str, help="folder of training npz/shard episodes")
+    parser.add_argument("-v", "--val", type=str, default=None, help="folder of validation episodes")
+    parser.add_argument("-m", "--models", nargs="+", default=list(MODELS), choices=MODELS, help="models to train")
+    parser.add_argument("-o", "--out", type=str, default="runs", help="one checkpoint folder per model below this")
+    parser.add_argument("-e", "--epochs", type=int, default=30, help="epochs")
+    parser.add_argument("-b", "--batch-size", type=int, default=32, help="batch size")
+    parser.add_argument("-a", "--augment", nargs="*", default=["flip"], help="augment.py augmentations")
+    parser.add_argument("-l", "--loss", action="append", help="override a loss, e.g. il_cgl:gaze=my_kld")
+    parser.add_argument("-s", "--seed", type=int, default=None, help="data order seed")
+    parser.add_argument("--no-imagenet", action="store_true", help="random init of the gril MobileNet")
+    parser.add_argument("-p", "--precision", type=str, default="float32", choices=PRECISIONS, help="Keras dtype policy")
+    parser.add_argument("-x", "--jit", action="store_true", help="XLA-compile the train steps")
+
+    args = parser.parse_args()
+    train(args.train, args.models, args.val, args.out, args.epochs, args.batch_size, args.augment,
+          parse_losses(args.loss), None if args.no_imagenet else "imagenet", args.seed, args.precision, args.jit)
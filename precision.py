@@ -0,0 +1,44 @@
+'''
+Mixed precision and XLA options for training the models in models.py.
+
+    set_precision("mixed_bfloat16")   # before the model is built
+    model = gril()
+    compile_model(model, loss, optimizer, jit_compile=True)
+
+``mixed_float16`` suits GPUs and needs loss scaling, which compile_model
+adds; ``mixed_bfloat16`` suits CPUs with AVX-512 BF16/AMX and GPUs from
+Ampere on, and trains without it. Model outputs and losses stay float32.
+'''
+
+import inspect
+
+import tensorflow as tf
+
+PRECISIONS = ("float32", "mixed_float16", "mixed_bfloat16")
+
+
+def set_precision(precision="float32"):
+    """Global Keras dtype policy; applies to models built afterwards."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"unknown precision {precision}, expected one of {PRECISIONS}")
+    tf.keras.mixed_precision.set_global_policy(precision)
+
+
+def compile_model(model, loss, optimizer, jit_compile=False, **kwargs):
+    """
+    ``model.compile`` with loss scaling under mixed_float16 and optional XLA
+    compilation of the train step.
+    """
+    if model.dtype_policy.name == "mixed_float16" and \
+            not isinstance(optimizer, tf.keras.mixed_precision.LossScaleOptimizer):
+        optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+    if jit_compile:
+        # Keras before 2.8 has no jit_compile; its fallback, XLA
+        # auto-clustering, is process-wide and would leak into every model
+        # compiled afterwards, so it is left to the user
+        if "jit_compile" not in inspect.signature(model.compile).parameters:
+            raise ValueError("jit_compile needs Keras 2.8 or newer; on older versions enable XLA "
+                             "for the whole process with TF_XLA_FLAGS=--tf_xla_auto_jit=2")
+        kwargs["jit_compile"] = True
+    model.compile(loss=loss, optimizer=optimizer, **kwargs)
+    return model
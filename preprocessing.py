@@ -0,0 +1,123 @@
+'''
+Frame preprocessing shared by the npz builders and the rollout scripts.
+
+Every frame that reaches a network goes through ``preprocess_batch`` with one
+of the specs below, so training data and rollout inputs are produced by the
+same code. Frames are resized straight into a preallocated batch in their
+input dtype and normalized to float32 in one vectorized pass at the end; a
+spec with ``normalize=False`` keeps uint8 and leaves the scaling to later.
+'''
+
+import cv2
+import numpy as np
+
+
+class PreprocessSpec():
+    """Target size, channel count and value range of a network input."""
+
+    def __init__(self, width=224, height=224, channels=3, normalize=True, interpolation=cv2.INTER_AREA):
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.normalize = normalize
+        self.interpolation = interpolation
+
+    @property
+    def shape(self):
+        return (self.height, self.width, self.channels)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float32) if self.normalize else np.dtype(np.uint8)
+
+    def __repr__(self):
+        return (f"PreprocessSpec(width={self.width}, height={self.height}, channels={self.channels}, "
+                f"normalize={self.normalize})")
+
+
+# RGB camera frames (gril, il_cgl, vanilla_bc)
+IMAGE_SPEC = PreprocessSpec(channels=3)
+# depth frames; 3-channel depth PNGs are collapsed to one channel
+DEPTH_SPEC = PreprocessSpec(channels=1)
+# grayscale frames used by the AGIL models
+GRAY_SPEC = PreprocessSpec(channels=1)
+
+# the npz/shard builders store the same frames as uint8; the training
+# pipeline scales them to [0,1] (batch_loader.normalize_batch)
+IMAGE_STORE_SPEC = PreprocessSpec(channels=3, normalize=False)
+DEPTH_STORE_SPEC = PreprocessSpec(channels=1, normalize=False)
+GRAY_STORE_SPEC = PreprocessSpec(channels=1, normalize=False)
+
+
+# camera inputs of the models in models.py, by input layer name; other
+# inputs (the AGIL gaze heatmap) are fed to the network as they are
+INPUT_SPECS = {
+    "image": IMAGE_SPEC,
+    "depth": DEPTH_SPEC,
+    "images": GRAY_SPEC,
+}
+
+
+def _to_channels(frame, channels):
+    if frame.ndim == 3 and frame.shape[2] == 1:
+        frame = frame[:, :, 0]
+    if channels == 1 and frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    return frame
+
+
+def normalize(frames, out=None):
+    """Scale [0,255] pixels to float32 [0,1] in one pass."""
+    return np.multiply(frames, np.float32(1.0 / 255.0), out=out, dtype=np.float32)
+
+
+def preprocess_batch(frames, spec, out=None):
+    """
+    Resize and normalize a batch of frames (array or list of HxW[xC]
+    arrays) according to ``spec``. Returns an (N, height, width, channels)
+    array of ``spec.dtype``, written into ``out`` when given.
+    """
+    n = len(frames)
+    if out is None:
+        out = np.empty((n,) + spec.shape, dtype=spec.dtype)
+    if n == 0:
+        return out
+
+    src_dtype = np.asarray(frames[0]).dtype
+    if src_dtype == out.dtype:
+        staging = out
+    else:
+        staging = np.empty((n,) + spec.shape, dtype=src_dtype)
+
+    size = (spec.width, spec.height)
+    for i in range(n):
+        frame = _to_channels(np.asarray(frames[i]), spec.channels)
+        dst = staging[i, :, :, 0] if spec.channels == 1 else staging[i]
+        cv2.resize(frame, size, dst=dst, interpolation=spec.interpolation)
+
+    if spec.normalize:
+        if staging is out:
+            out *= np.float32(1.0 / 255.0)
+        else:
+            normalize(staging, out=out)
+    elif staging is not out:
+        np.copyto(out, np.clip(np.rint(staging), 0, 255), casting="unsafe")
+    return out
+
+
+def preprocess(frame, spec):
+    """Single-frame version of preprocess_batch, without the batch axis."""
+    return preprocess_batch([frame], spec)[0]
+
+
+def fill_input(frame, spec, out):
+    """
+    Write one raw frame, or a batch of them, into the network input buffer
+    ``out``. With ``spec=None`` the frame is already a network input and is
+    only copied.
+    """
+    if spec is None:
+        out[...] = np.reshape(frame, out.shape)
+        return out
+    frames = [frame] if len(out) == 1 and np.ndim(frame) <= 3 else frame
+    return preprocess_batch(frames, spec, out=out)
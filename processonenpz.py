@@ -2,6 +2,8 @@ import os
 import numpy as np
 import cv2
 
+from shards import quantize_pixels
+
 npz_path = "101.npz"
 out_img_dir = "npz_images"
 out_depth_dir = "npz_depth"
@@ -10,8 +12,8 @@ os.makedirs(out_img_dir, exist_ok=True)
 os.makedirs(out_depth_dir, exist_ok=True)
 
 data = np.load(npz_path)
-images = data["images"]      # (N,224,224,3), [0,1]
-depth  = data["depth"]       # (N,224,224,1), [0,1]
+images = data["images"]      # (N,224,224,3), uint8 (older files: float [0,1])
+depth  = data["depth"]       # (N,224,224,1), uint8 (older files: float [0,1])
 action = data["action"]
 gaze   = data["gaze_coords"]
 
@@ -23,13 +25,13 @@ print("gaze  :", gaze.shape)
 N = images.shape[0]
 
 for i in range(N):
-    # RGB image: convert [0,1] float -> uint8 BGR for cv2
-    img = (images[i] * 255.0).clip(0, 255).astype("uint8")
+    # RGB image: uint8 BGR for cv2
+    img = quantize_pixels(images[i])
     img_bgr = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
     img_name = os.path.join(out_img_dir, f"img_{i:05d}.png")
     cv2.imwrite(img_name, img_bgr)
 
     # depth: single channel
-    d = (depth[i, :, :, 0] * 255.0).clip(0, 255).astype("uint8")
+    d = quantize_pixels(depth[i, :, :, 0])
     depth_name = os.path.join(out_depth_dir, f"depth_{i:05d}.png")
     cv2.imwrite(depth_name, d)
@@ -0,0 +1,346 @@
+'''
+Offline stand-in for airsim.MultirotorClient.
+
+Replays the camera frames of recorded episodes (our npz files or shards)
+instead of rendering them, and integrates the velocity commands it receives
+into a simple kinematic state, so the rollout scripts can run end to end
+without a simulator:
+
+    env = AirSimEnv(ReplayClient("training_data", latency=0.005))
+
+Each simGetImages call returns the next recorded frame. ``latency`` (plus up
+to ``jitter``) seconds are slept on every RPC to mimic the round trip to a
+real AirSim instance. The client is thread-safe, so one instance can be
+shared by the control loop and the capture thread of rollout.PipelinedRollout.
+
+    python replay_client.py -d training_data -m gil.tflite -l 0.005 -n 500
+'''
+
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+
+import airsim
+import cv2
+import numpy as np
+
+from airsim_utils import AirSimEnv, commands_to_velocity
+from shards import ShardReader, is_shard, quantize_pixels
+
+
+def read_frames(file_path):
+    """uint8 RGB (N,H,W,3) and depth (N,H,W) frames of one episode."""
+    if is_shard(file_path):
+        with ShardReader(file_path) as shard:
+            rgb, depth = shard.rows("images", 0), shard.rows("depth", 0)
+    else:
+        with np.load(file_path) as data:
+            rgb, depth = data["images"], data["depth"]
+    return quantize_pixels(rgb), quantize_pixels(depth)[..., 0]
+
+
+def list_episodes(data_path):
+    if os.path.isfile(data_path) or is_shard(data_path):
+        return [data_path]
+    return sorted(os.path.join(data_path, f) for f in os.listdir(data_path)
+                  if f.endswith(".npz") or is_shard(os.path.join(data_path, f)))
+
+
+class _Done():
+    """Stands in for the msgpack-rpc future returned by the *Async calls."""
+
+    def join(self):
+        return True
+
+
+class _Vehicle():
+    """Kinematic state and replay position of one vehicle."""
+
+    def __init__(self, frame_idx=0):
+        self.position = airsim.Vector3r(0.0, 0.0, 0.0)
+        self.orientation = airsim.Quaternionr(0.0, 0.0, 0.0, 1.0)
+        self.velocity = airsim.Vector3r(0.0, 0.0, 0.0)
+        self.frame_idx = frame_idx
+        self.finished = False
+        self.stamp = time.time_ns()
+
+    def pose(self):
+        return airsim.Pose(airsim.Vector3r(self.position.x_val, self.position.y_val, self.position.z_val),
+                           airsim.Quaternionr(self.orientation.x_val, self.orientation.y_val,
+                                              self.orientation.z_val, self.orientation.w_val))
+
+
+class ReplayClient():
+    """
+    Serves recorded episodes through the MultirotorClient calls used in this
+    repo. ``reset()`` moves on to the next episode, ``start(seed)`` picks
+    the episode and start frame from a seed; with ``loop=True`` an
+    episode restarts from its first frame once it runs out, otherwise the
+    last frame is repeated and ``finished`` becomes True.
+
+    Every ``vehicle_name`` gets its own state; extra vehicles start
+    ``vehicle_offset`` frames apart so they do not all see the same image.
+    simGetObjectPose reports every object at ``target``.
+    """
+
+    def __init__(self, data_path, latency=0.0, jitter=0.0, loop=True, seed=None, vehicle_offset=16,
+                 target=(30.0, 0.0, -3.0)):
+        self.episodes = list_episodes(data_path)
+        if not self.episodes:
+            raise ValueError(f"no npz files or shards in {data_path}")
+        self.latency = latency
+        self.jitter = jitter
+        self.loop = loop
+        self.vehicle_offset = vehicle_offset
+        self.target = target
+        self.rpc_calls = 0
+        self._rng = random.Random()
+        self.seed(seed)
+        self._lock = threading.Lock()
+        self._episode = -1
+        self._start_frame = 0
+        self.reset()
+
+    def seed(self, seed):
+        """Reseed the latency jitter, e.g. per evaluation episode."""
+        self._rng.seed(seed)
+
+    def _rpc(self):
+        # sleep outside the lock, two clients in AirSim do not block each other
+        with self._lock:
+            self.rpc_calls += 1
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _vehicle(self, vehicle_name):
+        # called with the lock held
+        vehicle = self.vehicles.get(vehicle_name)
+        if vehicle is None:
+            offset = (self._start_frame + len(self.vehicles) * self.vehicle_offset) % len(self.rgb)
+            vehicle = self.vehicles[vehicle_name] = _Vehicle(offset)
+        return vehicle
+
+    @property
+    def finished(self):
+        return any(v.finished for v in self.vehicles.values())
+
+    # connection / setup
+    def confirmConnection(self):
+        self._rpc()
+
+    def enableApiControl(self, is_enabled, vehicle_name=""):
+        self._rpc()
+
+    def armDisarm(self, arm, vehicle_name=""):
+        self._rpc()
+        return True
+
+    def takeoffAsync(self, timeout_sec=20, vehicle_name=""):
+        self._rpc()
+        with self._lock:
+            vehicle = self._vehicle(vehicle_name)
+            vehicle.position = airsim.Vector3r(vehicle.position.x_val, vehicle.position.y_val, -3.0)
+        return _Done()
+
+    def hoverAsync(self, vehicle_name=""):
+        self._rpc()
+        return _Done()
+
+    def simEnableWeather(self, enable):
+        self._rpc()
+
+    def simSetWeatherParameter(self, param, val):
+        self._rpc()
+
+    def reset(self):
+        self._rpc()
+        with self._lock:
+            self._episode = (self._episode + 1) % len(self.episodes)
+            self.rgb, self.depth = read_frames(self.episodes[self._episode])
+            self._start_frame = 0
+            names = list(getattr(self, "vehicles", {})) or [""]
+            self.vehicles = {}
+            for name in names:
+                self._vehicle(name)
+
+    def start(self, seed):
+        """
+        Replay episode ``seed % len(episodes)`` from a start frame drawn from
+        ``seed`` and reseed the latency jitter with it, so one evaluation
+        episode sees the same frames on any worker. Vehicle poses are kept
+        (the caller teleports). Returns the episode path and start frame.
+        """
+        self.seed(seed)
+        self._rpc()
+        with self._lock:
+            episode = seed % len(self.episodes)
+            if episode != self._episode:
+                self._episode = episode
+                self.rgb, self.depth = read_frames(self.episodes[episode])
+            self._start_frame = random.Random(seed).randrange(len(self.rgb))
+            for i, vehicle in enumerate(self.vehicles.values()):
+                vehicle.frame_idx = (self._start_frame + i * self.vehicle_offset) % len(self.rgb)
+                vehicle.finished = False
+            return self.episodes[episode], self._start_frame
+
+    # sensors
+    def _next_frame(self, vehicle):
+        idx = vehicle.frame_idx
+        if idx + 1 < len(self.rgb):
+            vehicle.frame_idx += 1
+        elif self.loop:
+            vehicle.frame_idx = 0
+        else:
+            vehicle.finished = True
+        return self.rgb[idx], self.depth[idx]
+
+    def _response(self, request, rgb, depth):
+        response = airsim.ImageResponse()
+        response.camera_name = request.camera_name
+        response.image_type = request.image_type
+        response.pixels_as_float = request.pixels_as_float
+        response.compress = request.compress
+        response.height, response.width = rgb.shape[:2]
+        if request.image_type == airsim.ImageType.Scene:
+            response.image_data_uint8 = cv2.imencode(".png", rgb)[1].tobytes() if request.compress else rgb.tobytes()
+        elif request.image_type == airsim.ImageType.DepthVis:
+            # inverse of airsim_utils.decodeDepth
+            dp = 1.0 - depth.astype(np.float32) / 255.0
+            if request.pixels_as_float:
+                response.image_data_float = dp.ravel().tolist()
+            else:
+                response.image_data_uint8 = np.rint(dp * 255).astype(np.uint8).tobytes()
+        else:
+            raise ValueError(f"image type {request.image_type} is not recorded in the replay data")
+        return response
+
+    def simGetImages(self, requests, vehicle_name=""):
+        self._rpc()
+        # every request of one call sees the same frame, as in AirSim; all
+        # cameras of a vehicle replay the same recorded camera
+        with self._lock:
+            rgb, depth = self._next_frame(self._vehicle(vehicle_name))
+        return [self._response(r, rgb, depth) for r in requests]
+
+    def getMultirotorState(self, vehicle_name=""):
+        self._rpc()
+        with self._lock:
+            vehicle = self._vehicle(vehicle_name)
+            pose = vehicle.pose()
+            kinematics = airsim.KinematicsState()
+            kinematics.position = pose.position
+            kinematics.orientation = pose.orientation
+            kinematics.linear_velocity = airsim.Vector3r(vehicle.velocity.x_val, vehicle.velocity.y_val,
+                                                         vehicle.velocity.z_val)
+            state = airsim.MultirotorState()
+            state.kinematics_estimated = kinematics
+            state.timestamp = vehicle.stamp
+            return state
+
+    def simGetCollisionInfo(self, vehicle_name=""):
+        self._rpc()
+        return airsim.CollisionInfo()
+
+    # poses
+    def simGetVehiclePose(self, vehicle_name=""):
+        self._rpc()
+        with self._lock:
+            return self._vehicle(vehicle_name).pose()
+
+    def simSetVehiclePose(self, pose, ignore_collision, vehicle_name=""):
+        self._rpc()
+        with self._lock:
+            vehicle = self._vehicle(vehicle_name)
+            vehicle.position = airsim.Vector3r(pose.position.x_val, pose.position.y_val, pose.position.z_val)
+            vehicle.orientation = airsim.Quaternionr(pose.orientation.x_val, pose.orientation.y_val,
+                                                     pose.orientation.z_val, pose.orientation.w_val)
+
+    def simGetObjectPose(self, object_name):
+        self._rpc()
+        return airsim.Pose(airsim.Vector3r(*self.target), airsim.Quaternionr(0.0, 0.0, 0.0, 1.0))
+
+    def simSetObjectPose(self, object_name, pose, teleport=True):
+        self._rpc()
+        return True
+
+    # control
+    def moveByVelocityZAsync(self, vx, vy, z, duration, drivetrain=None, yaw_mode=None, vehicle_name=""):
+        """Applies the command instantly: the vehicle moves as if it flew it for ``duration``."""
+        self._rpc()
+        with self._lock:
+            vehicle = self._vehicle(vehicle_name)
+            (pitch, roll, yaw) = AirSimEnv.toEulerianAngle(vehicle.orientation)
+            if yaw_mode is not None:
+                # AirSim yaw rates are in degrees per second
+                yaw += math.radians(yaw_mode.yaw_or_rate) * duration if yaw_mode.is_rate else math.radians(yaw_mode.yaw_or_rate)
+            dz = z - vehicle.position.z_val
+            vehicle.position = airsim.Vector3r(vehicle.position.x_val + vx * duration,
+                                               vehicle.position.y_val + vy * duration, z)
+            vehicle.orientation = airsim.to_quaternion(pitch, roll, yaw)
+            vehicle.velocity = airsim.Vector3r(vx, vy, dz / duration if duration else 0.0)
+            vehicle.stamp += int(duration * 1e9)
+        return _Done()
+
+
+def benchmark(client, engine, steps=200, pipelined=False, policy="latest", sc=10, duration=1.0, vehicles=1):
+    """
+    Frames per second of the rollout loop over ``steps`` control steps. With
+    several ``vehicles`` every step is one batched rollout.step_vehicles call
+    and fps counts vehicle frames.
+    """
+    from agil_airsim import arilNN
+    from rollout import PipelinedRollout, step_vehicles
+
+    env = AirSimEnv(client)
+    start = time.perf_counter()
+    if vehicles > 1:
+        env = AirSimEnv(client, vehicles=[f"Drone{i + 1}" for i in range(vehicles)])
+        for _ in range(steps):
+            step_vehicles(env, engine, sc, duration)
+        stats = {"steps": steps * vehicles}
+    elif pipelined:
+        runner = PipelinedRollout(env, engine, AirSimEnv(client), policy=policy, sc=sc, duration=duration)
+        stats = runner.run(max_steps=steps)
+    else:
+        for _ in range(steps):
+            state = env.getState()
+            img_rgb, img_depth = env.getImages()
+            commands, gaze = arilNN(img_rgb, img_depth, engine)
+            vb, vz, ref_alt = commands_to_velocity(commands, state, sc)
+            env.controlQuadrotor(vb, vz, ref_alt, duration)
+        stats = {"steps": steps}
+    elapsed = time.perf_counter() - start
+    stats.update({"seconds": elapsed, "fps": stats["steps"] / elapsed, "rpc_calls": client.rpc_calls})
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the rollout loop on replayed episodes")
+    parser.add_argument("-d", "--data", type=str, help="npz file/shard or a folder of them")
+    parser.add_argument("-m", "--model", type=str, help=".h5 or .tflite model to fly with")
+    parser.add_argument("-l", "--latency", type=float, default=0.0, help="artificial RPC latency in seconds")
+    parser.add_argument("-j", "--jitter", type=float, default=0.0, help="extra uniform random latency in seconds")
+    parser.add_argument("-n", "--steps", type=int, default=200, help="control steps to run")
+    parser.add_argument("-p", "--pipelined", action="store_true", help="use rollout.PipelinedRollout")
+    parser.add_argument("-v", "--vehicles", type=int, default=1, help="vehicles flown with one batched forward pass")
+    parser.add_argument("--policy", type=str, default="latest", help="staleness policy of the pipelined runner")
+    parser.add_argument("--report", type=str, default=None, help="write fps and per-stage latencies to this JSON file")
+
+    args = parser.parse_args()
+    from inference import load_engine
+    from latency import TRACKER
+
+    client = ReplayClient(args.data, latency=args.latency, jitter=args.jitter, seed=0)
+    engine = load_engine(args.model, batch_size=args.vehicles)
+    results = benchmark(client, engine, args.steps, args.pipelined, args.policy, vehicles=args.vehicles)
+    print(json.dumps(results, indent=1))
+    TRACKER.report()
+    if args.report:
+        results["stages"] = TRACKER.summary()
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=1)
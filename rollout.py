@@ -0,0 +1,172 @@
+'''
+Pipelined rollout runner.
+
+A background thread keeps capturing state + RGB + depth from AirSim while the
+control loop runs inference on the previous frame and sends the velocity
+command, so the RPC round trip overlaps with the forward pass. Frames pass
+through a bounded double buffer with a staleness policy:
+
+    latest  inference always takes the newest frame, older ones are dropped
+    drop    frames are consumed in order, but those older than ``max_age``
+            seconds are dropped
+'''
+
+import collections
+import threading
+import time
+
+from agil_airsim import arilNN
+from airsim_utils import AirSimEnv, commands_to_velocity
+from latency import TRACKER, stage
+
+POLICIES = ("latest", "drop")
+
+Frame = collections.namedtuple("Frame", ["seq", "stamp", "state", "rgb", "depth"])
+
+
+def step_vehicles(env, engine, sc=10, duration=1.0):
+    """
+    One control step for every vehicle of ``env`` (see AirSimEnv vehicles):
+    a single batched capture, one forward pass over the whole batch, then
+    one command per vehicle. ``engine`` needs batch_size == len(env.vehicles)
+    and env a single camera. Returns the (vehicles, 4) commands.
+    """
+    states = [env.getState(v) for v in env.vehicles]
+    rgb, depth = env.getInputBatch()
+    commands, gaze = arilNN(rgb, depth, engine, preprocessed=True)
+    with stage("command"):
+        for i, vehicle in enumerate(env.vehicles):
+            vb, vz, ref_alt = commands_to_velocity(commands[i], states[i], sc)
+            env.controlQuadrotor(vb, vz, ref_alt, duration, vehicle_name=vehicle)
+    return commands
+
+
+class FrameBuffer():
+    """Bounded buffer between the capture thread and the control loop."""
+
+    def __init__(self, size=2, policy="latest", max_age=None):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown staleness policy {policy}, expected one of {POLICIES}")
+        self.frames = collections.deque(maxlen=size)
+        self.policy = policy
+        self.max_age = max_age
+        self.dropped = 0
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def put(self, frame):
+        with self._cond:
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+            self.frames.append(frame)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Next frame according to the policy, or None on timeout/close."""
+        with self._cond:
+            while True:
+                if not self._cond.wait_for(lambda: self.frames or self.closed, timeout):
+                    return None
+                if not self.frames:
+                    return None
+                if self.policy == "latest":
+                    frame = self.frames.pop()
+                    self.dropped += len(self.frames)
+                    self.frames.clear()
+                    return frame
+                frame = self.frames.popleft()
+                if self.max_age is not None and time.perf_counter() - frame.stamp > self.max_age:
+                    self.dropped += 1
+                    continue
+                return frame
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class PipelinedRollout():
+    """
+    Overlaps capture of frame t+1 with inference and actuation on frame t.
+
+    ``env`` sends the commands, ``capture_env`` is polled from the capture
+    thread; it must own a separate client connection because the AirSim RPC
+    client is not thread-safe.
+    """
+
+    def __init__(self, env, engine, capture_env=None, policy="latest", max_age=None,
+                 sc=10, duration=1.0, buffer_size=2):
+        self.env = env
+        self.engine = engine
+        self.capture_env = capture_env if capture_env is not None else AirSimEnv()
+        self.buffer = FrameBuffer(buffer_size, policy, max_age)
+        self.sc = sc
+        self.duration = duration
+        self.captured = 0
+        self.steps = 0
+        self._running = False
+        self._thread = None
+        self._error = None
+
+    def _capture_loop(self):
+        try:
+            while self._running:
+                with stage("capture"):
+                    state = self.capture_env.getState()
+                    rgb, depth = self.capture_env.getImages()
+                self.buffer.put(Frame(self.captured, time.perf_counter(), state, rgb, depth))
+                self.captured += 1
+        except Exception as e:
+            self._error = e
+        finally:
+            self.buffer.close()
+
+    def start(self):
+        self._running = True
+        self.buffer.closed = False
+        self.buffer.frames.clear()
+        self._thread = threading.Thread(target=self._capture_loop, name="airsim-capture", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self.buffer.close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def step(self, timeout=5.0):
+        """Run one control step; returns (frame, commands) or None if no frame arrived."""
+        with stage("wait_frame"):
+            frame = self.buffer.get(timeout)
+        if frame is None:
+            if self._error is not None:
+                raise self._error
+            return None
+        commands, gaze = arilNN(frame.rgb, frame.depth, self.engine)
+        with stage("command"):
+            vb, vz, ref_alt = commands_to_velocity(commands, frame.state, self.sc)
+            self.env.controlQuadrotor(vb, vz, ref_alt, self.duration)
+        # capture to command sent, the staleness of what the drone acts on
+        TRACKER.record("frame_age", frame.stamp, time.perf_counter())
+        self.steps += 1
+        return frame, commands
+
+    def run(self, max_steps=None, done=None):
+        """Control until ``max_steps`` or until ``done(frame, commands)`` is true."""
+        self.start()
+        try:
+            while max_steps is None or self.steps < max_steps:
+                result = self.step()
+                if result is None:
+                    break
+                if done is not None and done(*result):
+                    break
+                TRACKER.maybe_report()
+        finally:
+            self.stop()
+        return self.stats()
+
+    def stats(self):
+        return {"captured": self.captured, "steps": self.steps, "dropped": self.buffer.dropped}
@@ -5,14 +5,6 @@ import argparse
 
 from airsim_utils import AirSimEnv
 
-env = AirSimEnv()
-
-env.connectQuadrotor()
-env.enableAPI(True)
-env.armQuadrotor()
-env.takeOff()
-env.hover()
-
 parser = argparse.ArgumentParser(
                     prog = 'Experiment',
                     description = 'Configurations for the experiment',
@@ -20,23 +12,51 @@ parser = argparse.ArgumentParser(
 parser.add_argument('-e', '--episodes', type=int, help='Number of episodes to run', default=10)
 parser.add_argument('-d', '--duration', type=int, help='Duration of control command', default=1)
 parser.add_argument('-sc', '--sc', type=int, help='Constant related to ang->lin', default=10)
+parser.add_argument('-m', '--model', type=str, help='Trained model to fly with (random agent if not given)', default=None)
+parser.add_argument('-r', '--replay', type=str, help='Replay npz/shard episodes instead of connecting to AirSim', default=None)
+parser.add_argument('-l', '--latency', type=float, help='Artificial RPC latency of the replay client in seconds', default=0.0)
 args = parser.parse_args()
 
 print(args)
 
+if args.replay:
+    from replay_client import ReplayClient
+    env = AirSimEnv(ReplayClient(args.replay, latency=args.latency))
+else:
+    env = AirSimEnv()
+
+env.connectQuadrotor()
+env.enableAPI(True)
+env.armQuadrotor()
+env.takeOff()
+env.hover()
+
 # Experiment parameters
 EPISODES=args.episodes
 DURATION=args.duration
 SC=args.sc
 
+aril = None
+if args.model:
+    from agil_airsim import arilNN
+    from inference import load_engine
+    aril = load_engine(args.model)
+
 for i in range(EPISODES):
     done = False
     env.teleportRelativeQuadrotor(0, 0, 0, 0) # x, y, z, and yaw [-1 to 1]
     while not done:
         
-        env.getRGBImage()
-        # random agent
-        pitch, roll, yaw, throttle = (np.random.rand()*10, np.random.rand()*10, np.random.rand()*10, np.random.rand()*10)
+        if aril is not None:
+            # RGB and depth in one simGetImages round trip, decoded straight
+            # into the network input batches
+            img_rgb, img_depth = env.getInputs()
+            commands, gaze = arilNN(img_rgb, img_depth, aril, preprocessed=True)
+            roll, pitch, throttle, yaw = (float(c) for c in commands[0])
+        else:
+            env.getRGBImage()
+            # random agent
+            pitch, roll, yaw, throttle = (np.random.rand()*10, np.random.rand()*10, np.random.rand()*10, np.random.rand()*10)
         vx, vy, vz, ref_alt = env.angularRatesToLinearVelocity(pitch, roll, yaw, throttle, SC)
         vb = env.inertialToBodyFrame(yaw, vx, vy)
         env.controlQuadrotor(vb, vz, ref_alt, DURATION)
@@ -0,0 +1,144 @@
+'''
+Sample counts of a folder of npz/shard episodes, read from headers only.
+
+Shards record their length in ``index.json``; for npz files the .npy header
+at the start of one label array gives its shape, so no pixel data is
+decompressed. The index gives exact epoch sizes for Keras:
+
+    index = SampleIndex.build("training_data")
+    model.fit(ds, steps_per_epoch=index.steps(32), ...)
+
+and splits the episodes deterministically across input workers, e.g. the
+per-worker input pipelines of a tf.distribute multi-worker strategy:
+
+    part = index.shard(num_workers, worker)
+    ds = make_dataset("training_data", part.files, num_samples=part.num_samples)
+
+    python sample_index.py -d training_data -b 32 -w 4
+'''
+
+import argparse
+import json
+import os
+import zipfile
+
+import numpy as np
+
+from shards import INDEX_NAME, is_shard
+
+# label arrays checked for the frame count, in order; the last resort is
+# the image array itself, whose header is just as cheap to read
+COUNT_KEYS = ("action", "vel_comm", "gaze_coords", "images")
+
+
+def npz_frames(path):
+    """Length of the first COUNT_KEYS array of an npz, from its .npy header."""
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        key = next((k for k in COUNT_KEYS if k + ".npy" in names), None)
+        if key is None:
+            raise ValueError(f"{path} has none of the arrays {COUNT_KEYS}")
+        with archive.open(key + ".npy") as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, _, _ = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, _ = np.lib.format.read_array_header_2_0(f)
+    return shape[0] if shape else 0
+
+
+def episode_frames(path):
+    """Frames of one npz or shard episode, None if it is not there."""
+    path = os.fsdecode(path)
+    if is_shard(path):
+        with open(os.path.join(path, INDEX_NAME), "r") as f:
+            return json.load(f)["num_frames"]
+    if os.path.isfile(path):
+        return npz_frames(path)
+    return None
+
+
+def is_episode(path):
+    return is_shard(path) or (os.path.isfile(path) and path.endswith(".npz"))
+
+
+class SampleIndex():
+    """Episode files of one folder with their frame counts, in name order."""
+
+    def __init__(self, path, files, frames):
+        self.path = path
+        self.files = list(files)
+        self.frames = [int(n) for n in frames]
+
+    @classmethod
+    def build(cls, path, file_list=None):
+        """Index ``file_list`` (default: every npz/shard in ``path``)."""
+        if file_list is None:
+            file_list = [f for f in os.listdir(path) if is_episode(os.path.join(path, f))]
+        files = sorted(os.fsdecode(f) for f in file_list)
+        return cls(path, files, [episode_frames(os.path.join(path, f)) for f in files])
+
+    def __len__(self):
+        return len(self.files)
+
+    @property
+    def num_samples(self):
+        return sum(self.frames)
+
+    def steps(self, batch_size, drop_remainder=False):
+        """Batches in one pass, the last partial batch included unless dropped."""
+        if drop_remainder:
+            return self.num_samples // batch_size
+        return -(-self.num_samples // batch_size)
+
+    def shard(self, num_workers, worker):
+        """
+        The episodes of ``worker`` out of ``num_workers``. Episodes go,
+        longest first, to the worker with the fewest frames so far (ties to
+        the lower worker id), so every worker gets a near-equal share and
+        the split depends only on the index.
+        """
+        if not 0 <= worker < num_workers:
+            raise ValueError(f"worker {worker} out of range for {num_workers} workers")
+        totals = [0] * num_workers
+        assigned = [[] for _ in range(num_workers)]
+        for i in sorted(range(len(self.files)), key=lambda i: (-self.frames[i], self.files[i])):
+            w = min(range(num_workers), key=lambda w: (totals[w], w))
+            totals[w] += self.frames[i]
+            assigned[w].append(i)
+        keep = sorted(assigned[worker])
+        return SampleIndex(self.path, [self.files[i] for i in keep], [self.frames[i] for i in keep])
+
+    def worker_steps(self, batch_size, num_workers):
+        """
+        Steps every worker can take in one epoch. Workers must run the same
+        number of steps, so this is the smallest shard's full batch count.
+        """
+        return min(self.shard(num_workers, w).steps(batch_size, drop_remainder=True)
+                   for w in range(num_workers))
+
+    def to_dict(self):
+        return {"path": os.path.abspath(self.path), "num_samples": self.num_samples,
+                "episodes": dict(zip(self.files, self.frames))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="count the samples of a folder of npz/shard episodes")
+    parser.add_argument("-d", "--dir", type=str, default=".", help="folder of npz/shard episodes")
+    parser.add_argument("-b", "--batch-size", type=int, default=32, help="batch size for the step counts")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="show the split across this many workers")
+    parser.add_argument("-j", "--json", action="store_true", help="print the index as JSON")
+
+    args = parser.parse_args()
+    index = SampleIndex.build(args.dir)
+    if args.json:
+        print(json.dumps(index.to_dict(), indent=1))
+    else:
+        for name, n in zip(index.files, index.frames):
+            print(f"{name:<40} {n}")
+        print(f"\nEpisodes: {len(index)}  samples: {index.num_samples}  steps per epoch: {index.steps(args.batch_size)}")
+        if args.workers > 1:
+            for w in range(args.workers):
+                part = index.shard(args.workers, w)
+                print(f"worker {w}: {len(part)} episodes, {part.num_samples} samples")
+            print(f"steps per worker: {index.worker_steps(args.batch_size, args.workers)}")
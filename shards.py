@@ -0,0 +1,341 @@
+'''
+Memory-mapped shard format for episode data.
+
+A shard is a directory named ``<episode>.shard`` that holds one raw file per
+array plus a small ``index.json`` header describing dtype, per-frame shape and
+number of frames. Pixel arrays (images, depth) are stored as uint8, everything
+else as float32. Uncompressed shards are opened with ``np.memmap`` so readers
+only page in the rows they touch; block-compressed shards store fixed-size
+blocks of frames with zlib and keep an offset table in the header.
+
+Writers stream frames to disk as they are appended, so memory stays bounded
+by one compression block whatever the episode length. A shard that is still
+being written has a ``progress.json`` checkpoint instead of ``index.json``;
+``ShardWriter(path, resume=True)`` continues it from the last checkpoint.
+'''
+
+import argparse
+import json
+import os
+import zlib
+
+import numpy as np
+
+SHARD_SUFFIX = ".shard"
+INDEX_NAME = "index.json"
+PROGRESS_NAME = "progress.json"
+FORMAT_VERSION = 1
+
+# arrays holding [0,1] pixels, stored as uint8 on disk
+PIXEL_KEYS = ("images", "depth")
+
+
+def is_shard(path):
+    path = os.fsdecode(path)
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, INDEX_NAME))
+
+
+def quantize_pixels(frames):
+    """Map [0,1] float pixels to uint8, uint8 input is returned untouched."""
+    frames = np.asarray(frames)
+    if frames.dtype == np.uint8:
+        return frames
+    return np.clip(np.rint(frames * 255.0), 0, 255).astype(np.uint8)
+
+
+def dequantize_pixels(frames):
+    """Map uint8 pixels back to float32 in [0,1]."""
+    return np.multiply(frames, np.float32(1.0 / 255.0), dtype=np.float32)
+
+
+def _storage_dtype(key):
+    if key in PIXEL_KEYS:
+        return np.uint8
+    return np.float32
+
+
+class ShardWriter():
+    """
+    Append frames to a shard on disk. All arrays passed to one ``append`` call
+    must share the same number of rows; dtype and per-frame shape are fixed by
+    the first call. ``dtypes`` overrides the storage dtype per array name.
+
+    Every ``checkpoint_every`` frames the data files are flushed and the
+    frames written so far are recorded in ``progress.json``. With
+    ``resume=True`` an interrupted shard is truncated back to its last
+    checkpoint and ``num_frames`` tells the caller where to continue.
+    """
+
+    def __init__(self, path, compression=None, block_size=64, level=1, dtypes=None,
+                 resume=False, checkpoint_every=None):
+        if compression not in (None, "zlib"):
+            raise ValueError(f"unsupported compression: {compression}")
+        self.path = os.fsdecode(path)
+        self.compression = compression
+        self.block_size = int(block_size)
+        self.level = level
+        self.dtypes = dtypes if dtypes else {}
+        self.checkpoint_every = checkpoint_every
+        self.num_frames = 0
+        self.arrays = {}
+        self._files = {}
+        self._pending = {}
+        self._pending_rows = {}
+        self._last_checkpoint = 0
+        os.makedirs(self.path, exist_ok=True)
+        if resume and os.path.exists(os.path.join(self.path, PROGRESS_NAME)):
+            self._resume()
+
+    def _open(self, key, arr):
+        dtype = np.dtype(self.dtypes.get(key, _storage_dtype(key)))
+        fname = f"{key}.bin"
+        self.arrays[key] = {"dtype": dtype.str, "shape": list(arr.shape[1:]), "file": fname}
+        if self.compression:
+            self.arrays[key]["blocks"] = []
+            self._pending[key] = []
+            self._pending_rows[key] = 0
+        self._files[key] = open(os.path.join(self.path, fname), "wb")
+
+    def _resume(self):
+        with open(os.path.join(self.path, PROGRESS_NAME), "r") as f:
+            progress = json.load(f)
+        if progress["compression"] != self.compression or progress["block_size"] != self.block_size:
+            raise ValueError(f"{self.path} was started with different compression settings")
+        self.arrays = progress["arrays"]
+        self.num_frames = self._last_checkpoint = progress["num_frames"]
+        for key, meta in self.arrays.items():
+            fh = open(os.path.join(self.path, meta["file"]), "r+b")
+            # drop whatever was written after the checkpoint
+            fh.truncate(progress["sizes"][key])
+            fh.seek(progress["sizes"][key])
+            self._files[key] = fh
+            if self.compression:
+                self._pending[key] = []
+                self._pending_rows[key] = 0
+
+    def _convert(self, key, arr):
+        if key in PIXEL_KEYS:
+            arr = quantize_pixels(arr)
+        return np.ascontiguousarray(arr, dtype=self.arrays[key]["dtype"])
+
+    def append(self, **arrays):
+        lengths = {len(a) for a in arrays.values()}
+        if len(lengths) != 1:
+            raise ValueError("all arrays must have the same number of frames")
+        if self.arrays and set(arrays) != set(self.arrays):
+            raise ValueError(f"expected arrays {sorted(self.arrays)}, got {sorted(arrays)}")
+
+        for key, arr in arrays.items():
+            arr = np.asarray(arr)
+            if key not in self.arrays:
+                self._open(key, arr)
+            elif list(arr.shape[1:]) != self.arrays[key]["shape"]:
+                raise ValueError(f"{key}: frame shape {arr.shape[1:]} does not match {self.arrays[key]['shape']}")
+            arr = self._convert(key, arr)
+            if self.compression:
+                self._pending[key].append(arr)
+                self._pending_rows[key] += len(arr)
+                self._flush_blocks(key, final=False)
+            else:
+                self._files[key].write(arr.tobytes())
+        self.num_frames += lengths.pop()
+        if self.checkpoint_every and self.num_frames - self._last_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def _flush_blocks(self, key, final):
+        if not self._pending[key] or (not final and self._pending_rows[key] < self.block_size):
+            return
+        pending = np.concatenate(self._pending[key])
+        self._pending[key] = []
+        start = 0
+        while len(pending) - start >= self.block_size or (final and start < len(pending)):
+            block = pending[start:start + self.block_size]
+            payload = zlib.compress(block.tobytes(), self.level)
+            fh = self._files[key]
+            self.arrays[key]["blocks"].append([fh.tell(), len(payload)])
+            fh.write(payload)
+            start += len(block)
+        if start < len(pending):
+            self._pending[key].append(pending[start:])
+        self._pending_rows[key] = len(pending) - start
+
+    def _header(self, num_frames):
+        return {
+            "version": FORMAT_VERSION,
+            "num_frames": num_frames,
+            "compression": self.compression,
+            "block_size": self.block_size,
+            "arrays": self.arrays,
+        }
+
+    def checkpoint(self):
+        """Make the frames written so far durable and record them in progress.json."""
+        for fh in self._files.values():
+            fh.flush()
+            os.fsync(fh.fileno())
+        # rows still waiting for a full compression block are not on disk
+        durable = self.num_frames - max(self._pending_rows.values(), default=0)
+        progress = self._header(durable)
+        progress["sizes"] = {key: fh.tell() for key, fh in self._files.items()}
+        tmp = os.path.join(self.path, PROGRESS_NAME + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(progress, f)
+        os.replace(tmp, os.path.join(self.path, PROGRESS_NAME))
+        self._last_checkpoint = self.num_frames
+
+    def close(self):
+        for key, fh in self._files.items():
+            if self.compression:
+                self._flush_blocks(key, final=True)
+            fh.close()
+        self._files = {}
+        with open(os.path.join(self.path, INDEX_NAME), "w") as f:
+            json.dump(self._header(self.num_frames), f, indent=1)
+        if os.path.exists(os.path.join(self.path, PROGRESS_NAME)):
+            os.remove(os.path.join(self.path, PROGRESS_NAME))
+
+    def abort(self):
+        """Checkpoint and close without marking the shard complete."""
+        if self._files:
+            self.checkpoint()
+        for fh in self._files.values():
+            fh.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # a failed writer must not leave an index.json behind
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ShardReader():
+    """
+    Random access to a shard. Uncompressed arrays are ``np.memmap`` views, so
+    ``rows`` only reads the pages it touches; compressed arrays decode the
+    blocks covering the requested range and keep the last block around for
+    sequential access.
+    """
+
+    def __init__(self, path):
+        self.path = os.fsdecode(path)
+        with open(os.path.join(self.path, INDEX_NAME), "r") as f:
+            self.header = json.load(f)
+        if self.header["version"] != FORMAT_VERSION:
+            raise ValueError(f"unsupported shard version {self.header['version']} in {self.path}")
+        self.num_frames = self.header["num_frames"]
+        self.compression = self.header["compression"]
+        self.block_size = self.header["block_size"]
+        self._maps = {}
+        self._block_cache = {}
+
+    def __len__(self):
+        return self.num_frames
+
+    def keys(self):
+        return list(self.header["arrays"])
+
+    def spec(self, key):
+        meta = self.header["arrays"][key]
+        return np.dtype(meta["dtype"]), tuple(meta["shape"])
+
+    def _memmap(self, key):
+        if key not in self._maps:
+            dtype, shape = self.spec(key)
+            fname = os.path.join(self.path, self.header["arrays"][key]["file"])
+            if self.num_frames == 0:
+                self._maps[key] = np.empty((0,) + shape, dtype=dtype)
+            else:
+                self._maps[key] = np.memmap(fname, dtype=dtype, mode="r", shape=(self.num_frames,) + shape)
+        return self._maps[key]
+
+    def _block(self, key, b):
+        cached = self._block_cache.get(key)
+        if cached is not None and cached[0] == b:
+            return cached[1]
+        dtype, shape = self.spec(key)
+        offset, length = self.header["arrays"][key]["blocks"][b]
+        with open(os.path.join(self.path, self.header["arrays"][key]["file"]), "rb") as f:
+            f.seek(offset)
+            payload = f.read(length)
+        block = np.frombuffer(zlib.decompress(payload), dtype=dtype).reshape((-1,) + shape)
+        self._block_cache[key] = (b, block)
+        return block
+
+    def rows(self, key, start, stop=None):
+        """Frames ``start:stop`` of array ``key`` in their on-disk dtype."""
+        stop = self.num_frames if stop is None else min(stop, self.num_frames)
+        if not self.compression:
+            return self._memmap(key)[start:stop]
+        if start >= stop:
+            dtype, shape = self.spec(key)
+            return np.empty((0,) + shape, dtype=dtype)
+        first, last = start // self.block_size, (stop - 1) // self.block_size
+        parts = [self._block(key, b) for b in range(first, last + 1)]
+        data = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        base = first * self.block_size
+        return data[start - base:stop - base]
+
+    def frame(self, key, idx):
+        return self.rows(key, idx, idx + 1)[0]
+
+    def close(self):
+        self._maps = {}
+        self._block_cache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def resume_writer(path, checkpoint_every=256, **kwargs):
+    """
+    ShardWriter continuing the partial shard at ``path`` (or starting it),
+    None if that shard is already complete.
+    """
+    if is_shard(path):
+        return None
+    return ShardWriter(path, resume=True, checkpoint_every=checkpoint_every, **kwargs)
+
+
+def shard_path(npz_path, out_dir=None):
+    base = os.path.splitext(os.path.basename(npz_path))[0] + SHARD_SUFFIX
+    return os.path.join(out_dir if out_dir else os.path.dirname(npz_path), base)
+
+
+def convert_npz(npz_path, out_path=None, compression=None, block_size=64):
+    """Convert one savez_compressed episode into a shard, chunk by chunk."""
+    out_path = out_path if out_path else shard_path(npz_path)
+    with np.load(npz_path) as data:
+        arrays = {key: data[key] for key in data.files}
+    num_frames = len(next(iter(arrays.values())))
+    with ShardWriter(out_path, compression=compression, block_size=block_size) as writer:
+        for start in range(0, num_frames, block_size):
+            writer.append(**{key: arr[start:start + block_size] for key, arr in arrays.items()})
+    return out_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="convert npz episodes into memory-mapped shards")
+    parser.add_argument("-p", "--path", type=str, help="npz file or folder of npz files")
+    parser.add_argument("-o", "--out", type=str, default=None, help="output folder (defaults to the npz folder)")
+    parser.add_argument("-c", "--compression", type=str, default=None, choices=["zlib"], help="block compression")
+    parser.add_argument("-b", "--block-size", type=int, default=64, help="frames per compressed block")
+
+    args = parser.parse_args()
+    if os.path.isdir(args.path):
+        npz_files = sorted(os.path.join(args.path, f) for f in os.listdir(args.path) if f.endswith(".npz"))
+    else:
+        npz_files = [args.path]
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+
+    for npz_file in npz_files:
+        out = convert_npz(npz_file, shard_path(npz_file, args.out), args.compression, args.block_size)
+        print(npz_file, "->", out)
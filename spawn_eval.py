@@ -5,9 +5,13 @@ import time
 import tensorflow as tf
 import os
 from agil_airsim import arilNN
+from inference import load_engine
+from airsim_utils import AirSimEnv
+from rollout import PipelinedRollout
+from latency import TRACKER
+from episode_manager import EpisodeManager
 import math
 import timeit
-from losses import action_loss
 import os
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"  # Force CPU inference
 
@@ -24,10 +28,6 @@ client.simEnableWeather(True)
 client.simSetWeatherParameter(airsim.WeatherParameter.Fog, 0.25)
 
 
-customObjects = {
-    'action_loss': action_loss
-}
-
 def _toEulerianAngle(q):
         z = q.z_val
         y = q.y_val
@@ -59,66 +59,82 @@ def _toEulerianAngle(q):
 
 aril_model = "gil.h5"  #todo Changed from "gril.h5" to "gil.h5"
 
-aril = tf.keras.models.load_model(aril_model, custom_objects=customObjects)
+# compiled once, reused every control step instead of model.predict
+aril = load_engine(aril_model)  # .h5 or an export_tflite.py .tflite file
+
+# Overlap capture of the next frame with inference on the current one
+# (rollout.PipelinedRollout). False runs the serial loop below.
+PIPELINED = True
+STALENESS_POLICY = "latest"  # or "drop" to consume frames in order
+env = AirSimEnv(client)
+TRACKER.report_every = 10  # seconds between per-stage latency summaries
+TRACE_PATH = "rollout_trace.json"  # Chrome trace of the last episode
+capture_env = AirSimEnv()  # the capture thread needs its own connection
+
+# episode budgets, see episode_manager.EpisodeManager; episodes also end on
+# a collision or within TARGET_RADIUS meters of the truck
+EPISODES = 10
+MAX_STEPS = 500
+MAX_SECONDS = 60*2
+TARGET_RADIUS = 5.0
 
 # rollout loop
 img_counter = 0
 #airsim.wait_key('Press any key to begin rollouts')
-while(True):
 
-    # arm and takeoff
-    print("Taking off...")
-    client.armDisarm(True)
-    client.takeoffAsync().join()
+# arm and takeoff once, episodes are reset by teleporting back to this pose
+print("Taking off...")
+client.armDisarm(True)
+client.takeoffAsync().join()
+
+# just hover
+client.hoverAsync().join()
+
+# teleportation/spawning functions for QUADROTOR
+pose = client.simGetVehiclePose()
+# pose.position.x_val -= 25
+# pose.position.y_val += 25
+# pose.position.z_val = -4
+
+client.simSetVehiclePose(pose, True, "SimpleFlight")
+
+# # teleportation/spawning functions for YELLOW TRUCK
+target_name = 'Truck_4'
+target_pose = client.simGetObjectPose(target_name)
+target_pose.position.x_val -= 20
+# target_pose.position.y_val += 10
+# target_pose.position.z_val
+client.simSetObjectPose(target_name, target_pose, teleport = True)
+
+manager = EpisodeManager(env, max_steps=MAX_STEPS, max_seconds=MAX_SECONDS,
+                         target_name=target_name, target_radius=TARGET_RADIUS)
 
-    # just hover
-    client.hoverAsync().join()
+for episode in range(EPISODES):
 
     # get the image of the scene
     sc = 10
     duration = 1e-0
-    done = False
+    # latency stats and trace events cover one episode each
+    TRACKER.reset()
+    manager.start()
 
-    # teleportation/spawning functions for QUADROTOR
-    pose = client.simGetVehiclePose()
-    # pose.position.x_val -= 25
-    # pose.position.y_val += 25
-    # pose.position.z_val = -4
+    if PIPELINED:
+        runner = PipelinedRollout(env, aril, capture_env, policy=STALENESS_POLICY, sc=sc, duration=duration)
+        print(runner.run(done=lambda frame, commands: manager.update(frame.state)))
+        TRACKER.export_chrome_trace(TRACE_PATH)
+        img_counter = img_counter + runner.steps
 
-    client.simSetVehiclePose(pose, True, "SimpleFlight")
-
-    # # teleportation/spawning functions for YELLOW TRUCK
-    target_name = 'Truck_4'
-    target_pose = client.simGetObjectPose(target_name)
-    target_pose.position.x_val -= 20
-    # target_pose.position.y_val += 10
-    # target_pose.position.z_val
-    client.simSetObjectPose(target_name, target_pose, teleport = True)
-
-    while(not done):
+    while(not manager.done):
 
         # getting quad states
-        state = client.getMultirotorState()
+        state = env.getState()
 
         # convert from quaternion to euler angles
         (pitch, roll, yaw) = _toEulerianAngle(state.kinematics_estimated.orientation)
-        # getting images
-        kairos = client.simGetImages([airsim.ImageRequest(0, airsim.ImageType.Scene, False, False),
-                                airsim.ImageRequest(0, airsim.ImageType.DepthVis, True)])
-        kairos_bstr = kairos[0]
-        kairos_depth = kairos[1]
-
-        # get numpy array
-        img1d = np.fromstring(kairos_bstr.image_data_uint8, dtype=np.uint8)
-        img_rgb = img1d.reshape(kairos_bstr.height, kairos_bstr.width, 3)
-        # convert from bgr to rgb
-        # img_rgb = np.fliplr(img_rgb.reshape(-1,3)).reshape(img_rgb.shape)
-
-
-        # reshape to 3-channel image (for Unreal 4.25)
-        dp1d = np.array(kairos_depth.image_data_float, dtype=np.float32)
-        dp = dp1d.reshape(kairos_depth.height, kairos_depth.width)
-        img_depth = np.array(np.abs(1-dp) * 255, dtype=np.uint8)
+        # getting images, decoded straight into the network input batches
+        # (airsim_utils.FrameDecoder) instead of copying the response bytes
+        # and the float depth list into intermediate arrays
+        img_rgb, img_depth = env.getInputs()
 
 
 
@@ -135,7 +151,7 @@ while(True):
         # AGIL network predictions
         # roll, pitch, throttle, yaw
         # output = arilNN(img_rgb, dp, aril)
-        commands, gaze = arilNN(img_rgb, img_depth, aril)
+        commands, gaze = arilNN(img_rgb, img_depth, aril, preprocessed=True)
         # output = agilNN(gaze, agil, img)
         act_roll     = float(commands[:,0])
         act_pitch    = float(commands[:,1])
@@ -174,13 +190,11 @@ while(True):
             airsim.YawMode(True, vz),
         )
 
-        # definition of episode completion (for now, I just wrote hacky done condition that ends each episode after two minutes)
-        #if(time.time() > time.time() + 60*2):
-        #    done = True
+        # collision, truck reached, or out of steps/time
+        manager.update(state)
 
         img_counter = img_counter + 1
-    # resets at the end of the episode
 
-    client.reset()
+    print(manager.result())
 
 
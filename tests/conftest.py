@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# modules live at the top level and in utils/, as when the scripts are run
+sys.path.insert(0, os.path.join(ROOT, "utils"))
+sys.path.insert(0, ROOT)
+
+
+def write_episode(path, frames, seed=0, legacy=False):
+    """npz episode in the layout of prepare_aril_data.py; legacy=True is the old float format."""
+    rng = np.random.default_rng(seed)
+    images = rng.integers(0, 256, (frames, 224, 224, 3), dtype=np.uint8)
+    depth = rng.integers(0, 256, (frames, 224, 224, 1), dtype=np.uint8)
+    action = rng.uniform(-1, 1, (frames, 4, 1)).astype(np.float32)
+    gaze = rng.random((frames, 2, 1), dtype=np.float32)
+    if legacy:
+        images, depth = images / 255.0, depth / 255.0
+        action, gaze = action.astype(np.float64), gaze.astype(np.float64)
+    np.savez_compressed(path, images=images, depth=depth, action=action, gaze_coords=gaze)
+    return {"images": images, "depth": depth, "action": action, "gaze_coords": gaze}
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
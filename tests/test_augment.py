@@ -0,0 +1,86 @@
+import os
+
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from augment import AUGMENTATIONS, Augmenter, Flip
+from batch_loader import normalize_batch
+from preprocessing import DEPTH_STORE_SPEC, IMAGE_STORE_SPEC, preprocess
+from prepare_flipped_data import flipped_frames
+
+
+@pytest.fixture
+def episode(tmp_path, rng):
+    """An AirSim episode folder with three frames and the log columns prepare_flipped_data.py reads."""
+    os.makedirs(tmp_path / "rgb")
+    os.makedirs(tmp_path / "depth")
+    rows = []
+    for i in range(3):
+        rgb = rng.integers(0, 256, (224, 224, 3), dtype=np.uint8)
+        depth = np.repeat(rng.integers(0, 256, (224, 224, 1), dtype=np.uint8), 3, axis=2)
+        cv2.imwrite(str(tmp_path / "rgb" / f"img_{i}.png"), rgb)
+        cv2.imwrite(str(tmp_path / "depth" / f"depth_{i}.png"), depth)
+        roll, pitch, throttle, yaw = rng.uniform(-1, 1, 4)
+        rows.append({"rgb_addr": f"img_{i}.png", "depth_addr": f"depth_{i}.png",
+                     "gaze_x": rng.random(), "gaze_y": rng.random(),
+                     "act_roll": roll, "act_pitch": pitch, "act_throttle": throttle, "act_yaw": yaw})
+    return str(tmp_path), pd.DataFrame(rows)
+
+
+def _batch(dirname, df):
+    """The unflipped frames as make_dataset batches them (gril layout)."""
+    images = np.stack([preprocess(cv2.imread(os.path.join(dirname, "rgb", a)), IMAGE_STORE_SPEC) for a in df["rgb_addr"]])
+    depth = np.stack([preprocess(cv2.imread(os.path.join(dirname, "depth", a)), DEPTH_STORE_SPEC) for a in df["depth_addr"]])
+    action = df[["act_roll", "act_pitch", "act_throttle", "act_yaw"]].to_numpy(np.float32)[:, :, None]
+    gaze = df[["gaze_x", "gaze_y"]].to_numpy(np.float32)[:, :, None]
+    return normalize_batch({"image": tf.constant(images), "depth": tf.constant(depth)},
+                           {"action": tf.constant(action), "gaze": tf.constant(gaze)})
+
+
+def test_flip_matches_prepare_flipped_data(episode):
+    dirname, df = episode
+    expected = list(flipped_frames(dirname, df))
+    inputs, targets = Flip(p=1.0)(*_batch(dirname, df))
+
+    for i, (im_flip, dt_flip, coords_flip, act_flip) in enumerate(expected):
+        np.testing.assert_array_equal(np.rint(inputs["image"][i].numpy() * 255).astype(np.uint8), im_flip)
+        np.testing.assert_array_equal(np.rint(inputs["depth"][i].numpy() * 255).astype(np.uint8), dt_flip)
+        np.testing.assert_allclose(targets["gaze"][i, :, 0].numpy(), coords_flip, rtol=1e-6)
+        np.testing.assert_allclose(targets["action"][i, :, 0].numpy(), act_flip, rtol=1e-6)
+
+
+def test_flip_twice_is_identity(episode):
+    inputs, targets = _batch(*episode)
+    again = Flip(p=1.0)(*Flip(p=1.0)(inputs, targets))
+    for got, want in zip(tf.nest.flatten(again), tf.nest.flatten((inputs, targets))):
+        np.testing.assert_allclose(got.numpy(), want.numpy(), rtol=1e-6)
+
+
+def test_flip_heatmap_targets():
+    heatmap = tf.constant(np.random.default_rng(0).random((2, 28, 28)), tf.float32)
+    _, targets = Flip(p=1.0)({"image": tf.zeros((2, 8, 8, 3))}, {"gaze": heatmap})
+    np.testing.assert_array_equal(targets["gaze"].numpy(), heatmap.numpy()[:, :, ::-1])
+
+
+def test_p_zero_is_a_no_op(episode):
+    inputs, targets = _batch(*episode)
+    for name, cls in AUGMENTATIONS.items():
+        out = cls(p=0.0)(inputs, targets)
+        for got, want in zip(tf.nest.flatten(out), tf.nest.flatten((inputs, targets))):
+            np.testing.assert_allclose(got.numpy(), want.numpy(), err_msg=name)
+
+
+def test_seeded_augmenter_is_reproducible(episode):
+    inputs, targets = _batch(*episode)
+    augmenter = Augmenter(list(AUGMENTATIONS))
+    seed = tf.constant([7, 3], tf.int64)
+    a = augmenter(inputs, targets, seed=seed)
+    b = Augmenter(list(AUGMENTATIONS))(inputs, targets, seed=seed)
+    for x, y in zip(tf.nest.flatten(a), tf.nest.flatten(b)):
+        np.testing.assert_array_equal(x.numpy(), y.numpy())
+    c = augmenter(inputs, targets, seed=tf.constant([7, 4], tf.int64))
+    assert any(not np.array_equal(x.numpy(), y.numpy()) for x, y in zip(tf.nest.flatten(a), tf.nest.flatten(c)))
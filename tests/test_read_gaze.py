@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from read_gaze import preprocess_gaze_heatmap
+
+
+@pytest.mark.parametrize("steps", [0, 8])
+@pytest.mark.parametrize("shape", [(224, 224), (28, 28), (48, 64)])
+def test_maps_sum_to_one(steps, shape):
+    gaze = np.array([[0.5, 0.5], [0.1, 0.9], [0.0, 1.0], [-1, -1], [np.nan, 0.2], [3.0, 0.5], [0.5, -2.0]])
+    maps = preprocess_gaze_heatmap(gaze, 5, shape=shape, steps=steps)
+    assert maps.shape == (len(gaze),) + shape + (1,)
+    assert maps.dtype == np.float32
+    np.testing.assert_allclose(maps.sum(axis=(1, 2, 3)), 1.0, rtol=1e-4)
+    assert (maps >= 0).all()
+
+
+@pytest.mark.parametrize("steps", [0, 8])
+def test_peak_at_the_gaze(steps):
+    maps = preprocess_gaze_heatmap(np.array([[0.25, 0.75]]), 4, shape=(40, 80), steps=steps)
+    row, col = np.unravel_index(np.argmax(maps[0, :, :, 0]), (40, 80))
+    assert (row, col) == (30, 20)
+
+
+@pytest.mark.parametrize("steps", [0, 8])
+def test_missing_and_off_frame_gaze_is_uniform(steps):
+    gaze = np.array([[-1, -1], [np.nan, 0.5], [3.0, 0.5], [0.5, -4.0]])
+    maps = preprocess_gaze_heatmap(gaze, 10, shape=(224, 224), steps=steps)
+    np.testing.assert_allclose(maps, 1.0 / (224 * 224), rtol=1e-5)
+
+
+def test_table_matches_exact():
+    gaze = np.random.default_rng(0).uniform(-0.05, 1.05, (50, 2))
+    table = preprocess_gaze_heatmap(gaze, 10, steps=8)
+    exact = preprocess_gaze_heatmap(gaze, 10, steps=0)
+    # centers are rounded to 1/8 pixel, a few percent of the peak at most
+    assert np.abs(table - exact).max() < 0.03 * exact.max()
@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import write_episode
+from sample_index import SampleIndex, episode_frames, npz_frames
+from shards import convert_npz
+
+
+@pytest.fixture
+def episodes(tmp_path):
+    write_episode(tmp_path / "a.npz", 7, seed=1)
+    write_episode(tmp_path / "b.npz", 12, seed=2, legacy=True)
+    write_episode(tmp_path / "c.npz", 3, seed=3)
+    convert_npz(str(tmp_path / "c.npz"), str(tmp_path / "d.shard"), compression="zlib", block_size=2)
+    # not episodes, must be skipped
+    (tmp_path / "build_cache.json").write_text(json.dumps({"outputs": {}}))
+    (tmp_path / "notes.txt").write_text("x")
+    return tmp_path
+
+
+def test_counts_match_the_arrays(episodes):
+    for name in ("a.npz", "b.npz", "c.npz"):
+        with np.load(episodes / name) as data:
+            assert npz_frames(str(episodes / name)) == len(data["action"])
+    assert episode_frames(str(episodes / "d.shard")) == 3
+    assert episode_frames(str(episodes / "missing.npz")) is None
+
+
+def test_count_falls_back_to_other_arrays(tmp_path):
+    np.savez_compressed(tmp_path / "gaze.npz", images=np.zeros((5, 4, 4, 1), np.uint8))
+    assert npz_frames(str(tmp_path / "gaze.npz")) == 5
+    np.savez_compressed(tmp_path / "empty.npz", other=np.zeros(3))
+    with pytest.raises(ValueError):
+        npz_frames(str(tmp_path / "empty.npz"))
+
+
+def test_build_skips_non_episodes(episodes):
+    index = SampleIndex.build(str(episodes))
+    assert index.files == ["a.npz", "b.npz", "c.npz", "d.shard"]
+    assert index.frames == [7, 12, 3, 3]
+    assert index.num_samples == 25
+    assert index.steps(8) == 4
+    assert index.steps(8, drop_remainder=True) == 3
+    assert index.steps(25) == 1
+
+
+def test_shard_partitions_the_episodes(episodes):
+    index = SampleIndex.build(str(episodes))
+    for workers in (1, 2, 3, 4, 6):
+        parts = [index.shard(workers, w) for w in range(workers)]
+        files = [f for p in parts for f in p.files]
+        assert sorted(files) == index.files
+        assert sum(p.num_samples for p in parts) == index.num_samples
+        for p in parts:
+            assert p.files == sorted(p.files)
+
+
+def test_shard_is_deterministic(episodes):
+    a = SampleIndex.build(str(episodes))
+    # listing order must not matter
+    b = SampleIndex.build(str(episodes), ["d.shard", "c.npz", "b.npz", "a.npz"])
+    for w in range(3):
+        assert a.shard(3, w).files == b.shard(3, w).files
+    assert [a.shard(2, w).files for w in range(2)] == [["b.npz"], ["a.npz", "c.npz", "d.shard"]]
+
+
+def test_shard_balances_frames():
+    index = SampleIndex("data", [f"e{i}.npz" for i in range(10)], [10, 9, 8, 7, 6, 5, 4, 3, 2, 1])
+    totals = [index.shard(3, w).num_samples for w in range(3)]
+    assert sum(totals) == 55
+    assert max(totals) - min(totals) <= 1
+    assert index.worker_steps(4, 3) == min(t // 4 for t in totals)
+
+
+def test_shard_rejects_bad_worker():
+    index = SampleIndex("data", ["e.npz"], [1])
+    with pytest.raises(ValueError):
+        index.shard(2, 2)
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from shards import (INDEX_NAME, PROGRESS_NAME, ShardReader, ShardWriter, convert_npz, is_shard,
+                    quantize_pixels, resume_writer)
+from conftest import write_episode
+
+
+def _frames(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "images": rng.integers(0, 256, (n, 8, 6, 3), dtype=np.uint8),
+        "depth": rng.integers(0, 256, (n, 8, 6, 1), dtype=np.uint8),
+        "action": rng.uniform(-1, 1, (n, 4, 1)).astype(np.float32),
+    }
+
+
+def _append(writer, arrays, start, stop, chunk=5):
+    for i in range(start, stop, chunk):
+        writer.append(**{k: v[i:min(i + chunk, stop)] for k, v in arrays.items()})
+
+
+def _read(path):
+    with ShardReader(path) as shard:
+        return len(shard), {k: np.array(shard.rows(k, 0)) for k in shard.keys()}
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_round_trip(tmp_path, compression):
+    arrays = _frames(23)
+    path = str(tmp_path / "ep.shard")
+    with ShardWriter(path, compression=compression, block_size=4) as writer:
+        _append(writer, arrays, 0, 23)
+    assert is_shard(path)
+
+    n, read = _read(path)
+    assert n == 23
+    for k, v in arrays.items():
+        np.testing.assert_array_equal(read[k], v)
+    with ShardReader(path) as shard:
+        # ranges across block boundaries and single frames
+        np.testing.assert_array_equal(shard.rows("images", 3, 9), arrays["images"][3:9])
+        np.testing.assert_array_equal(shard.frame("action", 22), arrays["action"][22])
+        assert shard.spec("depth") == (np.dtype(np.uint8), (8, 6, 1))
+
+
+def test_pixels_are_quantized(tmp_path):
+    images = np.random.default_rng(0).random((5, 4, 4, 3))
+    path = str(tmp_path / "ep.shard")
+    with ShardWriter(path) as writer:
+        writer.append(images=images, action=np.zeros((5, 4, 1)))
+    _, read = _read(path)
+    assert read["images"].dtype == np.uint8
+    np.testing.assert_array_equal(read["images"], quantize_pixels(images))
+    assert read["action"].dtype == np.float32
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_resume_after_interruption(tmp_path, compression):
+    arrays = _frames(40, seed=1)
+    path = str(tmp_path / "ep.shard")
+    writer = ShardWriter(path, compression=compression, block_size=4, checkpoint_every=10)
+    _append(writer, arrays, 0, 27)
+    # killed without close(): the frames after the last checkpoint are lost
+    for fh in writer._files.values():
+        fh.close()
+    assert not is_shard(path)
+    assert (tmp_path / "ep.shard" / PROGRESS_NAME).exists()
+
+    writer = resume_writer(path, checkpoint_every=10, compression=compression, block_size=4)
+    assert 0 < writer.num_frames <= 27
+    with writer:
+        _append(writer, arrays, writer.num_frames, 40)
+
+    assert not (tmp_path / "ep.shard" / PROGRESS_NAME).exists()
+    n, read = _read(path)
+    assert n == 40
+    for k, v in arrays.items():
+        np.testing.assert_array_equal(read[k], v)
+    # a complete shard is not reopened
+    assert resume_writer(path) is None
+
+
+def test_failed_writer_leaves_no_index(tmp_path):
+    path = tmp_path / "ep.shard"
+    with pytest.raises(RuntimeError):
+        with ShardWriter(str(path), checkpoint_every=5) as writer:
+            writer.append(**_frames(6))
+            raise RuntimeError
+    assert not (path / INDEX_NAME).exists()
+
+
+def test_append_checks_shapes(tmp_path):
+    with ShardWriter(str(tmp_path / "ep.shard")) as writer:
+        writer.append(**_frames(2))
+        with pytest.raises(ValueError):
+            writer.append(images=np.zeros((2, 8, 6, 3)), depth=np.zeros((3, 8, 6, 1)), action=np.zeros((2, 4, 1)))
+        with pytest.raises(ValueError):
+            writer.append(images=np.zeros((1, 8, 7, 3)), depth=np.zeros((1, 8, 6, 1)), action=np.zeros((1, 4, 1)))
+
+
+def test_convert_npz(tmp_path):
+    arrays = write_episode(tmp_path / "ep.npz", 9)
+    path = convert_npz(str(tmp_path / "ep.npz"), compression="zlib", block_size=4)
+    n, read = _read(path)
+    assert n == 9
+    for k, v in arrays.items():
+        np.testing.assert_array_equal(read[k], v)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from timestamps import (NS_PER_MS, TIME_COLUMN, align, epoch_ms_to_ns, interp_join, ns_to_iso, parse_iso_ns,
+                        stream_align)
+
+
+def _logs(seed=0, n_flight=500, n_gaze=1500):
+    rng = np.random.default_rng(seed)
+    start = 1_650_000_000_000 * NS_PER_MS
+    # flight rows ~50 ms apart, gaze samples ~16 ms apart with dropouts
+    flight = pd.DataFrame({TIME_COLUMN: start + np.cumsum(rng.integers(40, 60, n_flight)) * NS_PER_MS
+                           + rng.integers(0, NS_PER_MS, n_flight)})
+    flight["row"] = np.arange(n_flight)
+    gaze_t = start + np.cumsum(rng.integers(10, 22, n_gaze)) * NS_PER_MS + rng.integers(0, NS_PER_MS, n_gaze)
+    keep = np.ones(n_gaze, bool)
+    keep[400:470] = False
+    gaze = pd.DataFrame({TIME_COLUMN: gaze_t[keep], "x": rng.random(keep.sum()), "y": rng.random(keep.sum())})
+    gaze["confidence"] = np.where(rng.random(len(gaze)) > 0.5, "high", "low")
+    return flight, gaze
+
+
+def _chunks(df, size):
+    return (df.iloc[i:i + size].reset_index(drop=True) for i in range(0, len(df), size))
+
+
+@pytest.mark.parametrize("tolerance_ms", [None, 5, 50])
+@pytest.mark.parametrize("sizes", [(10_000, 10_000), (37, 101), (200, 7)])
+def test_stream_align_matches_merge_asof(tolerance_ms, sizes):
+    flight, gaze = _logs()
+    columns = ["x", "y", "confidence"]
+    expected = pd.merge_asof(flight, gaze, on=TIME_COLUMN, direction="nearest",
+                             tolerance=None if tolerance_ms is None else int(tolerance_ms * NS_PER_MS))
+    got = pd.concat(stream_align(_chunks(flight, sizes[0]), _chunks(gaze, sizes[1]), columns, tolerance_ms),
+                    ignore_index=True)
+
+    assert len(got) == len(flight)
+    np.testing.assert_array_equal(got["row"], flight["row"])
+    np.testing.assert_allclose(got[["x", "y"]].to_numpy(float), expected[["x", "y"]].to_numpy(float))
+    np.testing.assert_array_equal(got["confidence"].isna(), expected["confidence"].isna())
+    hit = expected["confidence"].notna()
+    np.testing.assert_array_equal(got["confidence"][hit], expected["confidence"][hit])
+    if tolerance_ms == 5:
+        # the dropout leaves flight rows without a gaze sample
+        assert got["x"].isna().any()
+
+
+def test_align_matches_stream_align():
+    flight, gaze = _logs(seed=1)
+    whole = align(flight, gaze, ["x", "y"], tolerance_ms=20, method="interp")
+    streamed = pd.concat(stream_align(_chunks(flight, 33), _chunks(gaze, 50), ["x", "y"], 20, method="interp"),
+                         ignore_index=True)
+    np.testing.assert_allclose(streamed[["x", "y"]].to_numpy(float), whole[["x", "y"]].to_numpy(float))
+
+
+def test_interp_join():
+    right = np.array([0, 10, 20], dtype=np.int64)
+    values = np.array([0.0, 1.0, 3.0])
+    out = interp_join([-5, 0, 5, 15, 20, 25], right, values, tolerance_ns=6)
+    np.testing.assert_allclose(out[:, 0], [np.nan, 0.0, 0.5, 2.0, 3.0, np.nan])
+    # bracketing samples further apart than the tolerance
+    assert np.isnan(interp_join([5], right, values, tolerance_ns=4)[0, 0])
+
+
+def test_conversions():
+    np.testing.assert_array_equal(epoch_ms_to_ns(np.array([1, 2])), [NS_PER_MS, 2 * NS_PER_MS])
+    assert epoch_ms_to_ns(np.array([1.5]))[0] == 1_500_000
+    ns = parse_iso_ns(["2022-04-15T10:30:00.250000", "not a time"], utc_offset_hours=5.5)
+    assert ns[0] == np.datetime64("2022-04-15T05:00:00.250", "ns").astype(np.int64)
+    assert ns[1] == np.iinfo(np.int64).min
+    assert ns_to_iso(ns[:1], utc_offset_hours=5.5)[0] == "2022-04-15T10:30:00.250000"
@@ -0,0 +1,121 @@
+'''
+TFLite backend for the rollout scripts.
+
+Runs models written by export_tflite.py with the same call interface as
+inference.InferenceEngine. The standalone ``tflite_runtime`` package is used
+when it is installed (companion computer), otherwise the interpreter bundled
+with TensorFlow.
+'''
+
+import json
+import os
+
+import numpy as np
+
+try:
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:
+    import tensorflow as tf
+    Interpreter = tf.lite.Interpreter
+
+from latency import stage
+from preprocessing import INPUT_SPECS, fill_input
+
+
+def sidecar_path(model_path):
+    return os.fsdecode(model_path) + ".json"
+
+
+def read_sidecar(model_path):
+    """Input/output layout written next to the .tflite file at export time."""
+    path = sidecar_path(model_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _tensor_name(detail):
+    name = detail["name"].split(":")[0]
+    return name[len("serving_default_"):] if name.startswith("serving_default_") else name
+
+
+def _order_inputs(details, names):
+    by_name = {_tensor_name(d): d for d in details}
+    if names and all(n in by_name for n in names):
+        return [by_name[n] for n in names]
+    return sorted(details, key=lambda d: d["index"])
+
+
+def _order_outputs(details, shapes):
+    # converted output tensors lose their Keras names, but every model in
+    # models.py has outputs of distinct shapes
+    if shapes:
+        ordered = []
+        for shape in shapes:
+            matches = [d for d in details if list(d["shape"][1:]) == list(shape)]
+            if len(matches) != 1:
+                break
+            ordered.append(matches[0])
+        else:
+            return ordered
+    return sorted(details, key=lambda d: d["index"])
+
+
+def _quantize(x, detail):
+    scale, zero_point = detail["quantization"]
+    dtype = detail["dtype"]
+    if np.issubdtype(dtype, np.integer) and scale:
+        info = np.iinfo(dtype)
+        return np.clip(np.rint(x / scale + zero_point), info.min, info.max).astype(dtype)
+    return x.astype(dtype, copy=False)
+
+
+def _dequantize(x, detail):
+    scale, zero_point = detail["quantization"]
+    if np.issubdtype(x.dtype, np.integer) and scale:
+        return (x.astype(np.float32) - zero_point) * np.float32(scale)
+    return x
+
+
+class TFLiteEngine():
+    """
+    Fixed-size forward passes through a TFLite model. Call it with one raw
+    camera frame per model input, in the input order of the Keras model the
+    file was exported from.
+    """
+
+    def __init__(self, model_path, batch_size=1, num_threads=None):
+        self.interpreter = Interpreter(model_path=os.fsdecode(model_path), num_threads=num_threads)
+        meta = read_sidecar(model_path) or {}
+        self.batch_size = batch_size
+
+        inputs = _order_inputs(self.interpreter.get_input_details(), meta.get("input_names"))
+        for detail in inputs:
+            if detail["shape"][0] != batch_size:
+                self.interpreter.resize_tensor_input(detail["index"], [batch_size] + list(detail["shape"][1:]))
+        self.interpreter.allocate_tensors()
+
+        details = {d["index"]: d for d in self.interpreter.get_input_details()}
+        self.inputs = [details[d["index"]] for d in inputs]
+        self.outputs = _order_outputs(self.interpreter.get_output_details(), meta.get("output_shapes"))
+        self.input_names = meta.get("input_names") or [_tensor_name(d) for d in self.inputs]
+        self.specs = [INPUT_SPECS.get(name) for name in self.input_names]
+        self.buffers = [np.zeros(d["shape"], dtype=np.float32) for d in self.inputs]
+
+    def run(self, *inputs):
+        """Forward pass on already preprocessed float32 batches."""
+        for x, detail in zip(inputs, self.inputs):
+            self.interpreter.set_tensor(detail["index"], _quantize(np.asarray(x), detail))
+        self.interpreter.invoke()
+        outputs = [_dequantize(self.interpreter.get_tensor(d["index"]), d) for d in self.outputs]
+        return outputs if len(outputs) > 1 else outputs[0]
+
+    def __call__(self, *frames):
+        if len(frames) != len(self.buffers):
+            raise ValueError(f"model expects inputs {self.input_names}, got {len(frames)} frames")
+        with stage("preprocess"):
+            for frame, spec, buf in zip(frames, self.specs, self.buffers):
+                fill_input(frame, spec, buf)
+        with stage("inference"):
+            return self.run(*self.buffers)
@@ -0,0 +1,221 @@
+'''
+Timestamp alignment of AirSim flight logs and gaze logs.
+
+All times are int64 nanoseconds since the epoch (UTC) from the moment a log
+is read; timezone offsets are added or subtracted as integers and ISO
+strings are only produced for display. Logs are assumed to be written in
+time order, which lets large files be joined chunk by chunk:
+
+    flight = read_flight_log("airsim_rec.txt", chunksize=100000)
+    gaze = read_gaze_log("gaze_log.csv", utc_offset_hours=5.5, chunksize=100000)
+    for chunk in stream_align(flight, gaze, ["x", "y", "confidence"], tolerance_ms=50):
+        ...
+
+``method="nearest"`` takes the closest gaze sample within the tolerance,
+``method="interp"`` interpolates linearly between the two samples around
+each flight row when both are within the tolerance. Rows without a match
+get NaN.
+'''
+
+import numpy as np
+import pandas as pd
+
+NS_PER_MS = 1_000_000
+NS_PER_HOUR = 3_600_000_000_000
+
+# India Standard Time, used by the recording machine
+IST_OFFSET_HOURS = 5.5
+
+TIME_COLUMN = "timestamp_ns"
+
+
+def offset_ns(hours):
+    return int(round(hours * NS_PER_HOUR))
+
+
+def epoch_ms_to_ns(ms):
+    """Epoch milliseconds (int or float) to int64 nanoseconds."""
+    ms = np.asarray(ms)
+    if np.issubdtype(ms.dtype, np.integer):
+        return ms.astype(np.int64) * NS_PER_MS
+    return np.rint(ms.astype(np.float64) * NS_PER_MS).astype(np.int64)
+
+
+def parse_iso_ns(strings, utc_offset_hours=0.0):
+    """
+    Naive ISO 8601 strings in local time (UTC + ``utc_offset_hours``) to
+    UTC nanoseconds. Unparseable entries become the int64 minimum
+    (see ``valid``).
+    """
+    strings = np.asarray(strings, dtype=str)
+    try:
+        # numpy parses ISO 8601 in C, with or without the fractional part
+        local = strings.astype("datetime64[ns]")
+    except ValueError:
+        local = np.array([_parse_one(s) for s in strings], dtype="datetime64[ns]")
+    ns = local.view(np.int64)
+    missing = ns == np.iinfo(np.int64).min
+    return np.where(missing, ns, ns - offset_ns(utc_offset_hours))
+
+
+def _parse_one(s):
+    try:
+        return np.datetime64(s, "ns")
+    except ValueError:
+        return np.datetime64("NaT", "ns")
+
+
+def valid(ns):
+    return ns != np.iinfo(np.int64).min
+
+
+def ns_to_iso(ns, utc_offset_hours=0.0):
+    """Display strings of UTC nanoseconds in local time, microsecond precision."""
+    local = (np.asarray(ns, dtype=np.int64) + offset_ns(utc_offset_hours)).astype("datetime64[ns]")
+    return np.datetime_as_string(local.astype("datetime64[us]"), unit="us")
+
+
+def nearest_index(left_ns, right_ns, tolerance_ns=None):
+    """
+    Index into the sorted ``right_ns`` of the closest sample for every entry
+    of ``left_ns``, or -1 where there is none within ``tolerance_ns``.
+    """
+    left_ns = np.asarray(left_ns, dtype=np.int64)
+    right_ns = np.asarray(right_ns, dtype=np.int64)
+    if len(right_ns) == 0:
+        return np.full(len(left_ns), -1, dtype=np.int64)
+    after = np.clip(np.searchsorted(right_ns, left_ns, side="left"), 0, len(right_ns) - 1)
+    before = np.clip(after - 1, 0, len(right_ns) - 1)
+    d_after = np.abs(right_ns[after] - left_ns)
+    d_before = np.abs(left_ns - right_ns[before])
+    idx = np.where(d_before <= d_after, before, after)
+    if tolerance_ns is not None:
+        idx = np.where(np.minimum(d_before, d_after) <= tolerance_ns, idx, -1)
+    return idx
+
+
+def nearest_join(left_ns, right_ns, values, tolerance_ns=None):
+    """(N, C) float rows of ``values`` nearest to ``left_ns``, NaN when unmatched."""
+    values = np.asarray(values, dtype=np.float64).reshape(len(right_ns), -1)
+    idx = nearest_index(left_ns, right_ns, tolerance_ns)
+    out = np.full((len(idx), values.shape[1]), np.nan)
+    hit = idx >= 0
+    out[hit] = values[idx[hit]]
+    return out
+
+
+def interp_join(left_ns, right_ns, values, tolerance_ns=None):
+    """
+    Linear interpolation of ``values`` (sampled at sorted ``right_ns``) at
+    ``left_ns``. Rows whose bracketing samples are not both within
+    ``tolerance_ns`` are NaN; exact hits are always kept.
+    """
+    left_ns = np.asarray(left_ns, dtype=np.int64)
+    right_ns = np.asarray(right_ns, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64).reshape(len(right_ns), -1)
+    out = np.full((len(left_ns), values.shape[1]), np.nan)
+    if len(right_ns) == 0:
+        return out
+    after = np.searchsorted(right_ns, left_ns, side="left")
+    exact = (after < len(right_ns)) & (right_ns[np.minimum(after, len(right_ns) - 1)] == left_ns)
+    inside = (after > 0) & (after < len(right_ns)) & ~exact
+    hi = np.minimum(after, len(right_ns) - 1)
+    lo = np.maximum(after - 1, 0)
+    if tolerance_ns is not None:
+        inside &= (left_ns - right_ns[lo] <= tolerance_ns) & (right_ns[hi] - left_ns <= tolerance_ns)
+    # offsets from the lower sample keep the weights exact in float64
+    span = (right_ns[hi] - right_ns[lo]).astype(np.float64)
+    w = np.divide((left_ns - right_ns[lo]).astype(np.float64), span, out=np.zeros(len(left_ns)), where=span > 0)
+    out[inside] = values[lo[inside]] + w[inside, None] * (values[hi[inside]] - values[lo[inside]])
+    out[exact] = values[after[exact]]
+    return out
+
+
+JOINS = {
+    "nearest": nearest_join,
+    "interp": interp_join,
+}
+
+
+def align(left, right, columns, tolerance_ms=None, method="nearest", left_on=TIME_COLUMN, right_on=TIME_COLUMN):
+    """
+    Copy of ``left`` with ``columns`` of ``right`` joined on the int64 time
+    columns. Non-numeric columns (gaze confidence names) always take the
+    nearest sample.
+    """
+    right = right[valid(right[right_on].to_numpy())]
+    right = right.sort_values(right_on, kind="stable")
+    tolerance_ns = None if tolerance_ms is None else int(round(tolerance_ms * NS_PER_MS))
+    left_ns = left[left_on].to_numpy(np.int64)
+    right_ns = right[right_on].to_numpy(np.int64)
+
+    numeric = [c for c in columns if pd.api.types.is_numeric_dtype(right[c])]
+    joined = JOINS[method](left_ns, right_ns, right[numeric].to_numpy(np.float64), tolerance_ns)
+    left = left.copy()
+    for i, c in enumerate(numeric):
+        left[c] = joined[:, i]
+
+    idx = nearest_index(left_ns, right_ns, tolerance_ns)
+    for c in columns:
+        if c not in numeric:
+            values = right[c].to_numpy()
+            left[c] = np.where(idx >= 0, values[np.maximum(idx, 0)] if len(values) else None, None)
+    return left
+
+
+def stream_align(left_chunks, right_chunks, columns, tolerance_ms=None, method="nearest",
+                 left_on=TIME_COLUMN, right_on=TIME_COLUMN):
+    """
+    ``align`` over two time-ordered streams of DataFrame chunks. Only the
+    right rows that can still match the current left chunk are buffered.
+    """
+    tolerance_ns = None if tolerance_ms is None else int(round(tolerance_ms * NS_PER_MS))
+    right_iter = iter(right_chunks)
+    buffer = None
+    exhausted = False
+    for left in left_chunks:
+        if len(left) == 0:
+            continue
+        t = left[left_on].to_numpy(np.int64)
+        horizon = t.max() + (tolerance_ns or 0)
+        # read ahead until one sample past the end of this chunk is buffered
+        while not exhausted and (buffer is None or len(buffer) == 0 or buffer[right_on].iloc[-1] <= horizon):
+            try:
+                chunk = next(right_iter)
+            except StopIteration:
+                exhausted = True
+                break
+            chunk = chunk[valid(chunk[right_on].to_numpy())]
+            buffer = chunk if buffer is None else pd.concat([buffer, chunk], ignore_index=True)
+        if buffer is None:
+            buffer = pd.DataFrame(columns=[right_on] + list(columns))
+        yield align(left, buffer, columns, tolerance_ms, method, left_on, right_on)
+
+        if len(buffer):
+            # the next chunk starts at or after t.max(); keep one sample
+            # before its window
+            keep = np.searchsorted(buffer[right_on].to_numpy(np.int64), t.max() - (tolerance_ns or 0)) - 1
+            buffer = buffer.iloc[max(keep, 0):].reset_index(drop=True)
+
+
+def read_flight_log(path, chunksize=None, time_column="TimeStamp"):
+    """AirSim recording (tab separated, epoch ms) with an added ``timestamp_ns`` column."""
+    def convert(df):
+        df[TIME_COLUMN] = epoch_ms_to_ns(df[time_column].to_numpy())
+        return df
+    if chunksize is None:
+        return convert(pd.read_csv(path, sep="\t"))
+    return (convert(df) for df in pd.read_csv(path, sep="\t", chunksize=chunksize))
+
+
+def read_gaze_log(path, utc_offset_hours=IST_OFFSET_HOURS, chunksize=None, time_column="absolute_timestamp_iso"):
+    """
+    track_gaze.py log with an added ``timestamp_ns`` column. Its ISO
+    timestamps are local wall-clock time of the recording machine.
+    """
+    def convert(df):
+        df[TIME_COLUMN] = parse_iso_ns(df[time_column].to_numpy(), utc_offset_hours)
+        return df
+    if chunksize is None:
+        return convert(pd.read_csv(path))
+    return (convert(df) for df in pd.read_csv(path, chunksize=chunksize))
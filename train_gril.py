@@ -1,73 +1,209 @@
-import tensorflow as tf
-import numpy as np
-import os
-import random
-from models import gril
-from losses import my_kld, my_softmax
-from batch_loader import generate_gril
+'''
+Config-driven, resumable training.
+
+    python train_gril.py -c train_config.json
+    python train_gril.py -c train_config.json        # after preemption: resumes
+
+Settings come from DEFAULT_CONFIG, overridden by the JSON config file and
+the command line flags. train_path and val_path have no default (an empty
+val_path trains without validation); out_dir defaults to ``runs/<model>``.
+Model weights, optimizer state (including the learning rate step) and the
+position in the data (epoch, batch within the epoch) are checkpointed to
+``<out_dir>/checkpoints`` every ``checkpoint_every`` steps and at the end of
+every epoch. Rerunning with the same out_dir restores the latest checkpoint
+and continues with the batch after it: each epoch shuffles with
+``seed + epoch`` and draws the augmentation of every batch from
+``(seed + epoch, batch index)``, so a resumed epoch sees the same batches,
+augmented the same way.
+
+Epoch and validation lengths come from sample_index.py (frame counts read
+from the episode headers).
+
+At the end the model is written as ``<out_dir>/gil.h5`` and as a SavedModel
+in ``<out_dir>/saved_model``.
+'''
+
+import argparse
+import json
 import os
-os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
-
-
-def action_loss(y_true, y_pred):
-    """
-    Weighted MSE for control commands. This loss function gives
-    higher weightage to errors in roll and yaw commands
-    The weight coefficient are [0.40, 0.10,0.10, 0.40]
-    for roll, pitch, throttle and yaw respectively
-    """
-
-    squared_difference = tf.square(y_true - y_pred)
-    #weights = np.array([[0.40, 0.10, 0.10, 0.40]])
-    # weights = np.array([[0.005, 0.005, 0.005, 0.85]])
-    weights = np.array([[0.10, 0.10, 0.10, 0.70]])
-
-    weighted_squared_difference = weights*squared_difference
-
-    return tf.reduce_mean(weighted_squared_difference, axis=-1)
-
-
-#64
-batch_size = 32 #todo:: this was 16 earlier - different from noufan
-train_datapath = "/home/ameen/Desktop/Drone_Project-Mtech_Thesis/Code/training_data"
-val_datapath =  "/home/ameen/Desktop/Drone_Project-Mtech_Thesis/Code/validation_data"
-
-
-file_list = os.listdir(train_datapath)
-val_list = os.listdir(val_datapath)
-
-random.shuffle(file_list)
-
-# The file_list here should be the lenght of elements in npz files!
-steps_per_epoch = np.int(np.ceil(len(file_list)/batch_size))
-val_steps = np.int(np.ceil(len(val_list)/batch_size))
 
+import tensorflow as tf
 
-my_callbacks = [
-    tf.keras.callbacks.CSVLogger('gil.log')
-]
-
-
-tfx = tf.data.Dataset.from_generator(generate_gril, args=[train_datapath, file_list],output_types = ({"image":tf.float32,"depth":tf.float32}, {"action":tf.float64, "gaze":tf.float64}))
-
-val = tf.data.Dataset.from_generator(generate_gril, args=[val_datapath, val_list],output_types = ({"image":tf.float32,"depth":tf.float32}, {"action":tf.float64, "gaze":tf.float64}))
-
-
-
-
-tfx = tfx.batch(batch_size)
-val = val.batch(batch_size)
-model = gril()
-
-
-lr_schedule = tf.keras.optimizers.schedules.ExponentialDecay(
-    initial_learning_rate=0.00001,
-    decay_steps=10000,
-    decay_rate=0.9)
-
-opt=tf.keras.optimizers.Adam(learning_rate=lr_schedule, epsilon=10e-4)
-model.compile(loss=[action_loss, 'mean_squared_error'], optimizer=opt)
-
-model.fit(tfx, epochs=30, validation_data=val, validation_steps=val_steps, callbacks = my_callbacks)
+from batch_loader import make_dataset
+from losses import action_loss
+from models import gril, gril_head, transfer_head_weights
+from multi_train import MODELS, build, match_outputs, model_batch
+from precision import compile_model, set_precision
+from sample_index import SampleIndex
+os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
 
-model.save('gil.h5')
\ No newline at end of file
+DEFAULT_CONFIG = {
+    # gril, gril_head (trained on feature_cache.py folders), il_cgl, vanilla_bc or agil_airsim
+    "model": "gril",
+    "train_path": None,
+    # "" trains without validation
+    "val_path": None,
+    # None: runs/<model>
+    "out_dir": None,
+    "batch_size": 32,  #todo:: this was 16 earlier - different from noufan
+    "epochs": 30,
+    "learning_rate": 0.00001,
+    # applied to the training batches on the fly (augment.py)
+    "augment": ["flip"],
+    # "mixed_bfloat16" on CPUs with AVX-512 BF16/AMX, "mixed_float16" on GPUs
+    "precision": "float32",
+    "jit_compile": False,
+    "seed": 0,
+    "shuffle_buffer": 1024,
+    "checkpoint_every": 500,
+    "keep_checkpoints": 3,
+}
+
+
+def load_config(path=None, overrides=None):
+    config = dict(DEFAULT_CONFIG)
+    if path:
+        with open(path, "r") as f:
+            user = json.load(f)
+        unknown = set(user) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"unknown config keys: {sorted(unknown)}")
+        config.update(user)
+    config.update(overrides or {})
+
+    if config["model"] not in MODELS + ("gril_head",):
+        raise ValueError(f"unknown model {config['model']}")
+    if not config["train_path"]:
+        raise ValueError("train_path is not set, pass -t or set it in the config file")
+    if config["val_path"] is None:
+        raise ValueError('val_path is not set, pass -v or set it in the config file ("" for no validation)')
+    if config["out_dir"] is None:
+        config["out_dir"] = os.path.join("runs", config["model"])
+    return config
+
+
+def build_model(config):
+    name = config["model"]
+    if name == "gril_head":
+        model = gril_head()
+        lr_schedule = tf.keras.optimizers.schedules.ExponentialDecay(
+            initial_learning_rate=config["learning_rate"],
+            decay_steps=10000,
+            decay_rate=0.9)
+        opt = tf.keras.optimizers.Adam(learning_rate=lr_schedule, epsilon=10e-4)
+        return compile_model(model, [action_loss, 'mean_squared_error'], opt, jit_compile=config["jit_compile"])
+    return build(name, learning_rate=config["learning_rate"], jit_compile=config["jit_compile"])
+
+
+def epoch_dataset(config, model, index, epoch, skip=0):
+    """Training batches of ``epoch`` in a fixed order, starting after ``skip`` batches."""
+    name = config["model"]
+    layout = name if name in ("gril", "gril_head") else "gril"
+    augment = () if name == "gril_head" else config["augment"]
+    ds = make_dataset(config["train_path"], index.files, model=layout, batch_size=config["batch_size"],
+                      shuffle_buffer=config["shuffle_buffer"], seed=config["seed"] + epoch, augment=augment,
+                      num_samples=index.num_samples)
+    if layout != name:
+        ds = ds.map(lambda x, y: model_batch(name, x, y))
+    ds = ds.map(lambda x, y: (x, match_outputs(model, y)))
+    # skipped batches are still read, but not trained on
+    return ds.skip(skip) if skip else ds
+
+
+def val_dataset(config, model):
+    """Validation batches covering every validation sample, and their count."""
+    if not config["val_path"]:
+        return None, None
+    name = config["model"]
+    layout = name if name in ("gril", "gril_head") else "gril"
+    index = SampleIndex.build(config["val_path"])
+    ds = make_dataset(config["val_path"], index.files, model=layout,
+                      batch_size=config["batch_size"], shuffle_buffer=0, num_samples=index.num_samples)
+    if layout != name:
+        ds = ds.map(lambda x, y: model_batch(name, x, y))
+    return ds.map(lambda x, y: (x, match_outputs(model, y))), index.steps(config["batch_size"])
+
+
+class StepCheckpoint(tf.keras.callbacks.Callback):
+    """Saves the training checkpoint every ``every`` steps and at epoch ends."""
+
+    def __init__(self, manager, epoch_var, batch_var, every, skipped=0):
+        super().__init__()
+        self.manager = manager
+        self.epoch_var = epoch_var
+        self.batch_var = batch_var
+        self.every = every
+        self.skipped = skipped
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.batch_var.assign(self.skipped + batch + 1)
+        step = int(self.model.optimizer.iterations.numpy())
+        if self.every and step % self.every == 0:
+            self.manager.save(checkpoint_number=step)
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epoch_var.assign(epoch + 1)
+        self.batch_var.assign(0)
+        self.manager.save(checkpoint_number=int(self.model.optimizer.iterations.numpy()))
+
+
+def train(config):
+    out_dir = config["out_dir"]
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "config.json"), "w") as f:
+        json.dump(config, f, indent=1)
+
+    set_precision(config["precision"])
+    model = build_model(config)
+
+    epoch_var = tf.Variable(0, dtype=tf.int64, trainable=False)
+    batch_var = tf.Variable(0, dtype=tf.int64, trainable=False)
+    ckpt = tf.train.Checkpoint(model=model, optimizer=model.optimizer, epoch=epoch_var, batch=batch_var)
+    manager = tf.train.CheckpointManager(ckpt, os.path.join(out_dir, "checkpoints"), max_to_keep=config["keep_checkpoints"])
+    if manager.latest_checkpoint:
+        ckpt.restore(manager.latest_checkpoint)
+        print(f"resuming from {manager.latest_checkpoint}: epoch {int(epoch_var.numpy())}, batch {int(batch_var.numpy())}")
+
+    index = SampleIndex.build(config["train_path"])
+    steps = index.steps(config["batch_size"])
+    val, val_steps = val_dataset(config, model)
+    print(f"{index.num_samples} training samples in {len(index)} episodes, {steps} steps per epoch")
+    while int(epoch_var.numpy()) < config["epochs"]:
+        epoch, skip = int(epoch_var.numpy()), int(batch_var.numpy())
+        if skip >= steps:
+            # stopped between the last batch and the end-of-epoch checkpoint
+            epoch_var.assign(epoch + 1)
+            batch_var.assign(0)
+            continue
+        callbacks = [
+            tf.keras.callbacks.CSVLogger(os.path.join(out_dir, 'gil.log'), append=True),
+            StepCheckpoint(manager, epoch_var, batch_var, config["checkpoint_every"], skip),
+        ]
+        model.fit(epoch_dataset(config, model, index, epoch, skip), epochs=epoch + 1, initial_epoch=epoch,
+                  steps_per_epoch=steps - skip, validation_data=val, validation_steps=val_steps,
+                  callbacks=callbacks)
+
+    if config["model"] == "gril_head":
+        # rollouts need the full model with the backbone in front of the head
+        model = transfer_head_weights(model, gril())
+
+    model.save(os.path.join(out_dir, 'gil.h5'))
+    model.save(os.path.join(out_dir, 'saved_model'), save_format='tf')
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="config-driven, resumable training of the models in models.py")
+    parser.add_argument("-c", "--config", type=str, default=None, help="JSON file overriding DEFAULT_CONFIG")
+    parser.add_argument("-t", "--train", type=str, default=None, help="overrides train_path of the config")
+    parser.add_argument("-v", "--val", type=str, default=None, help="overrides val_path of the config")
+    parser.add_argument("-o", "--out-dir", type=str, default=None, help="overrides out_dir of the config")
+    parser.add_argument("--print-config", action="store_true", help="print the merged config and exit")
+
+    args = parser.parse_args()
+    flags = {"train_path": args.train, "val_path": args.val, "out_dir": args.out_dir}
+    config = load_config(args.config, {k: v for k, v in flags.items() if v is not None})
+    if args.print_config:
+        print(json.dumps(config, indent=1))
+    else:
+        train(config)
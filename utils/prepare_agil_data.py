@@ -4,74 +4,127 @@ import cv2
 import numpy as np
 import os
 import re
-from read_gaze import preprocess_gaze_heatmap, reshape_heatmap, reshape_image
+import sys
+from read_gaze import preprocess_gaze_heatmap
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocessing import GRAY_STORE_SPEC, preprocess
+from shards import SHARD_SUFFIX, resume_writer
+from build_cache import BuildCache, output_name
 
 
 def get_im_index(filename):
     return re.search(r'\d+', filename).group(0)
 
-def prepare_data(data_path):
-    for subdir in os.listdir(data_path):
+def agil_frames(dirname, csv_path, start=0):
+    """(gray image, gaze, action) of every logged frame with an image, from frame ``start`` on."""
+    n = 0
+    with open(csv_path, 'r') as csvfile:
+        gaze = csv.reader(csvfile)
+        next(gaze)  # skip the head row
+        for i, row in enumerate(gaze):
+            img_path = os.path.join(dirname, "rgb", f"rgb_{i}.png")
+            # print(img_path)
+            if os.path.exists(img_path):
+                n += 1
+                if n <= start:
+                    continue
+                print(f"rgb_{i}.png", row[-3], row[-2])
+                im = preprocess(cv2.imread(img_path), GRAY_STORE_SPEC)
+                coords = np.array((float(row[-3]), float(row[-2])))
+                act_commands = np.array((float(row[-7]), float(row[-6]), float(row[-5]), float(row[-4])))
+                yield im, coords, act_commands
+
+
+def write_shard(out_name, frames, checkpoint_every=256, chunk_size=64):
+    """Stream ``agil_frames`` into a shard, heatmaps are computed per chunk."""
+    writer = resume_writer(out_name + SHARD_SUFFIX, checkpoint_every)
+    if writer is None:
+        print(f"{out_name}{SHARD_SUFFIX} is complete, skipping")
+        return
+    with writer:
+        chunk = []
+        for frame in frames(writer.num_frames):
+            chunk.append(frame)
+            if len(chunk) < chunk_size:
+                continue
+            _append_chunk(writer, chunk)
+            chunk = []
+        if chunk:
+            _append_chunk(writer, chunk)
+    print(out_name + SHARD_SUFFIX, writer.num_frames)
+
+
+def _append_chunk(writer, chunk):
+    imgs, gaze_pos, act_lbls = (np.array(x) for x in zip(*chunk))
+    hmap = preprocess_gaze_heatmap(gaze_pos, 10, shape=(224, 224))
+    writer.append(images=np.reshape(imgs, imgs.shape[:3] + (1,)), heatmap=hmap, vel_comm=act_lbls[..., None].astype(np.float32))
+
+
+def prepare_data(data_path, fmt="npz", checkpoint_every=256):
+    subdirs = sorted(os.listdir(data_path))
+    # episodes whose inputs did not change since the last run are skipped
+    cache = BuildCache()
+    params = {"builder": "agil", "format": fmt, "specs": [repr(GRAY_STORE_SPEC)], "sigma": 10}
+    for subdir in subdirs:
         print(subdir)
         fname = ["rgb", "log.csv"]
         dirname = os.path.join(data_path, subdir)
         print(dirname)
 
-        imgs = []
-        gaze_pos = []
-        act_lbls = []
+        npz_name = data_path.split("/")[-2]
+        # several episodes would otherwise overwrite the same file
+        out_name = npz_name if len(subdirs) == 1 else f"{npz_name}_{subdir}"
+        if cache.begin(output_name(out_name, fmt), dirname, params) is None:
+            continue
+
             # img_idx=[]
             # print(os.path.join(dirname, fname)
         if fname[1].endswith('.csv'):
             log = fname[1]
         csv_path = os.path.join(dirname, log)
         print(csv_path)
-        with open(csv_path, 'r') as csvfile:
-            gaze = csv.reader(csvfile)
-            next(gaze)  # skip the head row
-            for i, row in enumerate(gaze):
-                img_path = os.path.join(dirname, "rgb", f"rgb_{i}.png")
-                # print(img_path)
-                if os.path.exists(img_path):
-                    print(f"rgb_{i}.png", row[-3], row[-2])
-                    im = np.float32(cv2.imread(img_path))
-                    im = reshape_image(im)  # reshape to 84x84
-                    imgs.append(im)
-
-                    coords = np.hstack((row[-3], row[-2]))
-                    gaze_pos.append(coords)
-                    act_commands = np.hstack((row[-7], row[-6], row[-5], row[-4]))
-                    act_lbls.append(act_commands)
-
-            gaze_pos = np.array(gaze_pos)
-            gaze_pos = gaze_pos.astype(float)
-
-            act_lbls = np.array(act_lbls)
-            act_lbls = act_lbls.astype(float)
-            # print(gaze_pos.shape)
-            imgs = np.array(imgs)
-            #print(imgs.shape)
-
-            hmap = preprocess_gaze_heatmap(np.array(gaze_pos), 10)
-            hmap = np.squeeze(hmap, axis=1)
-            hmap = reshape_heatmap(hmap)
-            print(hmap.shape)
-            print(imgs.shape)
-            print(act_lbls.shape)
-            hmap = np.reshape(hmap, (hmap.shape[0], hmap.shape[1], hmap.shape[2], 1))
-            imgs = np.reshape(imgs, (imgs.shape[0], imgs.shape[1], imgs.shape[2], 1))
-            act_lbls = np.reshape(act_lbls, (act_lbls.shape[0], act_lbls.shape[1], 1))
-        npz_name = data_path.split("/")[-2]
-        print(npz_name)
-        np.savez_compressed(f"{npz_name}.npz", images=imgs, heatmap=hmap, vel_comm=act_lbls)
+
+        if fmt == "shard":
+            # streamed to disk chunk by chunk, continues an interrupted run
+            write_shard(out_name, lambda start: agil_frames(dirname, csv_path, start), checkpoint_every)
+            cache.done(output_name(out_name, fmt))
+            continue
+
+        imgs = []
+        gaze_pos = []
+        act_lbls = []
+        for im, coords, act_commands in agil_frames(dirname, csv_path):
+            imgs.append(im)
+            gaze_pos.append(coords)
+            act_lbls.append(act_commands)
+
+        gaze_pos = np.array(gaze_pos)
+        act_lbls = np.array(act_lbls, dtype=np.float32)
+        # print(gaze_pos.shape)
+        imgs = np.array(imgs)
+        #print(imgs.shape)
+
+        # (N, 224, 224, 1) heatmaps at the image resolution
+        hmap = preprocess_gaze_heatmap(gaze_pos, 10, shape=(224, 224))
+        print(hmap.shape)
+        print(imgs.shape)
+        print(act_lbls.shape)
+        imgs = np.reshape(imgs, (imgs.shape[0], imgs.shape[1], imgs.shape[2], 1))
+        act_lbls = np.reshape(act_lbls, (act_lbls.shape[0], act_lbls.shape[1], 1))
+        print(out_name)
+        np.savez_compressed(f"{out_name}.npz", images=imgs, heatmap=hmap, vel_comm=act_lbls)
+        cache.done(output_name(out_name, fmt))
 
 
 if __name__ == "__main__":
     #data_path = '/scratch/user/ravikt/airsim/data/moving_truck_mountains3/'
     parser = argparse.ArgumentParser(description="script for creating numpy compressed data")
     parser.add_argument("-p", "--path", type=str, help="path to airsim data")
+    parser.add_argument("-f", "--format", type=str, default="npz", choices=["npz", "shard"],
+                        help="shard streams frames to disk with bounded memory and resumes interrupted runs")
+    parser.add_argument("-k", "--checkpoint-every", type=int, default=256, help="frames between shard checkpoints")
 
     args = parser.parse_args()
     data_path = args.path
-    prepare_data(data_path)
-
+    prepare_data(data_path, args.format, args.checkpoint_every)
@@ -11,110 +11,150 @@ import cv2
 import numpy as np
 import os
 import re
+import sys
 import pandas as pd
-
-def reshape_depth(depth):
-    """Resize to the same size as the one in Ritwik's work."""
-    width = 224
-    height = 224
-    frame = cv2.cvtColor(depth, cv2.COLOR_RGB2GRAY)
-    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
-    frame = np.expand_dims(frame, axis=2)
-    #cv2.imwrite('rgb_cv.png', frame)
-    #plt.imsave('rgb_plt.png', frame)
-    return frame / 255.0
-
-def reshape_image(image):
-    """Resize to the size as required in ResNet."""
-    width = 224
-    height = 224
-    frame = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
-
-    return frame / 255.0
-
-
-def prepare_data(data_path):
-    for subdir in os.listdir(data_path):
-        print(subdir)
-        fname = ["rgb", "log.csv"]
-        dirname = os.path.join(data_path, subdir)
-        print(dirname)
-
-        imgs = []
-        depth = []
-        gaze_pos = []
-        act_lbls = []
-
-        if fname[1].endswith('.csv'):
-            log = fname[1]
-        csv_path = os.path.join(dirname, log)
-        print(csv_path)
-        train_df = pd.read_csv(csv_path)
-        train_df["rgb_addr"]  = train_df["rgb_addr"].apply(lambda x: x.split("/")[-1])
-        train_df["depth_addr"]= train_df["depth_addr"].apply(lambda x: x.split("/")[-1])
-
-        non_zero_yaw = train_df[train_df["act_yaw"] != 0.0]
-        zero_yaw = train_df.query("act_yaw == 0.0").sample(frac=0.10)
-        final_df = pd.concat([zero_yaw, non_zero_yaw])
-
-        for i, data in final_df.iterrows():
-            img_path   = os.path.join(dirname, "rgb", data["rgb_addr"])
-            depth_path = os.path.join(dirname, "depth", data["depth_addr"])
-            # print(img_path)
-            # if (os.path.exists(img_path) and float(row[-4])==0.0):
-            print(data["rgb_addr"], data["gaze_x"], data["gaze_y"])
-
-            # read color images
-            im = np.float32(cv2.imread(img_path))
-            im = reshape_image(im)
-            imgs.append(im)
-
-            # read depth images
-            dt = np.float32(cv2.imread(depth_path))
-            dt = reshape_depth(dt)
-            depth.append(dt)
-
-            # gaze coordinate
-            coords = np.hstack((data["gaze_x"], data["gaze_y"]))
-            gaze_pos.append(coords)
-
-            # control commands
-            act_commands = np.hstack((data["act_roll"], data["act_pitch"], data["act_throttle"], data["act_yaw"]))
-            act_lbls.append(act_commands)
-
-
-        gaze_pos = np.array(gaze_pos)
-        gaze_pos = gaze_pos.astype(float)
-
-        act_lbls = np.array(act_lbls)
-        act_lbls = act_lbls.astype(float)
-
-        imgs = np.array(imgs)
-
-        depth= np.array(depth)
-
-        #print(imgs.shape)
-
-
-        print(depth.shape)
-        print(imgs.shape)
-        print(gaze_pos.shape)
-        print(act_lbls.shape)
-
-        gaze_pos = np.reshape(gaze_pos, (gaze_pos.shape[0], gaze_pos.shape[1], 1))
-        act_lbls = np.reshape(act_lbls, (act_lbls.shape[0], act_lbls.shape[1], 1))
-
-        npz_name = data_path.split("/")[-2]
-        print(npz_name)
-        np.savez_compressed(f"{npz_name}.npz", images=imgs, depth=depth, action=act_lbls, gaze_coords=gaze_pos)
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocessing import DEPTH_STORE_SPEC, IMAGE_STORE_SPEC, preprocess_batch
+from shards import SHARD_SUFFIX, resume_writer
+from build_cache import BuildCache, output_name
+
+
+def read_episode_log(dirname, seed=0):
+    """All non-zero yaw rows of an episode plus 10% of the zero-yaw rows."""
+    csv_path = os.path.join(dirname, "log.csv")
+    print(csv_path)
+    train_df = pd.read_csv(csv_path)
+    train_df["rgb_addr"]  = train_df["rgb_addr"].apply(lambda x: x.split("/")[-1])
+    train_df["depth_addr"]= train_df["depth_addr"].apply(lambda x: x.split("/")[-1])
+
+    non_zero_yaw = train_df[train_df["act_yaw"] != 0.0]
+    # seeded so a resumed shard continues with the same frames
+    zero_yaw = train_df.query("act_yaw == 0.0").sample(frac=0.10, random_state=seed)
+    return pd.concat([zero_yaw, non_zero_yaw])
+
+
+def load_frames(dirname, rgb_names, depth_names):
+    """Read and resize one chunk of uint8 frames; runs inside the worker processes."""
+    # read color images
+    imgs = preprocess_batch([cv2.imread(os.path.join(dirname, "rgb", f)) for f in rgb_names], IMAGE_STORE_SPEC)
+    # read depth images
+    depth = preprocess_batch([cv2.imread(os.path.join(dirname, "depth", f)) for f in depth_names], DEPTH_STORE_SPEC)
+    return imgs, depth
+
+
+def _submit(pool, fn, *args):
+    if pool is None:
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+    return pool.submit(fn, *args)
+
+
+def frame_chunks(pool, dirname, final_df, chunk_size, start=0, window=4):
+    """
+    Decoded (imgs, depth) chunks of an episode from frame ``start`` on, in
+    order. At most ``window`` chunks are in flight, which bounds memory.
+    """
+    rgb_names = final_df["rgb_addr"].tolist()
+    depth_names = final_df["depth_addr"].tolist()
+    pending = deque()
+    for first in range(start, len(final_df), chunk_size):
+        last = min(first + chunk_size, len(final_df))
+        pending.append(_submit(pool, load_frames, dirname, rgb_names[first:last], depth_names[first:last]))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def episode_labels(final_df):
+    # gaze coordinate and control commands, (N, 2, 1) and (N, 4, 1)
+    gaze_pos = final_df[["gaze_x", "gaze_y"]].to_numpy(dtype=np.float32)
+    act_lbls = final_df[["act_roll", "act_pitch", "act_throttle", "act_yaw"]].to_numpy(dtype=np.float32)
+    return gaze_pos[:, :, None], act_lbls[:, :, None]
+
+
+def write_npz(pool, dirname, out_name, chunk_size, window):
+    final_df = read_episode_log(dirname)
+    gaze_pos, act_lbls = episode_labels(final_df)
+    chunks = list(frame_chunks(pool, dirname, final_df, chunk_size, window=window))
+    imgs = np.concatenate([c[0] for c in chunks]) if chunks else np.empty((0,) + IMAGE_STORE_SPEC.shape, IMAGE_STORE_SPEC.dtype)
+    depth = np.concatenate([c[1] for c in chunks]) if chunks else np.empty((0,) + DEPTH_STORE_SPEC.shape, DEPTH_STORE_SPEC.dtype)
+
+    print(depth.shape)
+    print(imgs.shape)
+    print(gaze_pos.shape)
+    print(act_lbls.shape)
+
+    print(out_name)
+    np.savez_compressed(f"{out_name}.npz", images=imgs, depth=depth, action=act_lbls, gaze_coords=gaze_pos)
+
+
+def write_shard(pool, dirname, out_name, chunk_size, window, checkpoint_every):
+    """Stream the episode into ``<out_name>.shard``, continuing an interrupted run."""
+    writer = resume_writer(out_name + SHARD_SUFFIX, checkpoint_every)
+    if writer is None:
+        print(f"{out_name}{SHARD_SUFFIX} is complete, skipping")
+        return
+    final_df = read_episode_log(dirname)
+    gaze_pos, act_lbls = episode_labels(final_df)
+    start = writer.num_frames
+    if start:
+        print(f"resuming {out_name}{SHARD_SUFFIX} at frame {start}/{len(final_df)}")
+    with writer:
+        for imgs, depth in frame_chunks(pool, dirname, final_df, chunk_size, start, window):
+            stop = start + len(imgs)
+            writer.append(images=imgs, depth=depth, action=act_lbls[start:stop], gaze_coords=gaze_pos[start:stop])
+            start = stop
+    print(out_name + SHARD_SUFFIX, writer.num_frames)
+
+
+def prepare_data(data_path, workers=1, chunk_size=64, fmt="npz", checkpoint_every=256):
+    """
+    Build one npz (or streamed shard) per episode subdirectory of
+    ``data_path``. With more than one worker, frame chunks are decoded in a
+    process pool, a few chunks ahead of the writer. Episodes whose inputs
+    did not change since the last run are skipped (build_cache.py).
+    """
+    npz_name = data_path.split("/")[-2]
+    subdirs = sorted(os.listdir(data_path))
+    window = 2 * workers
+    cache = BuildCache()
+    params = {"builder": "aril", "format": fmt, "specs": [repr(IMAGE_STORE_SPEC), repr(DEPTH_STORE_SPEC)]}
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for subdir in subdirs:
+            print(subdir)
+            dirname = os.path.join(data_path, subdir)
+            print(dirname)
+            # several episodes would otherwise overwrite the same file
+            out_name = npz_name if len(subdirs) == 1 else f"{npz_name}_{subdir}"
+            if cache.begin(output_name(out_name, fmt), dirname, params) is None:
+                continue
+            if fmt == "shard":
+                write_shard(pool, dirname, out_name, chunk_size, window, checkpoint_every)
+            else:
+                write_npz(pool, dirname, out_name, chunk_size, window)
+            cache.done(output_name(out_name, fmt))
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
 
 if __name__ == "__main__":
     #data_path = '/scratch/user/ravikt/airsim/data/moving_truck_mountains3/'
     parser = argparse.ArgumentParser(description="script for creating numpy compressed data")
     parser.add_argument("-p", "--path", type=str, help="path to airsim data")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("-c", "--chunk-size", type=int, default=64, help="frames per worker task")
+    parser.add_argument("-f", "--format", type=str, default="npz", choices=["npz", "shard"],
+                        help="shard streams frames to disk with bounded memory and resumes interrupted runs")
+    parser.add_argument("-k", "--checkpoint-every", type=int, default=256, help="frames between shard checkpoints")
 
     args = parser.parse_args()
     data_path = args.path
-    prepare_data(data_path)
-
+    prepare_data(data_path, args.workers, args.chunk_size, args.format, args.checkpoint_every)
@@ -2,6 +2,9 @@
 The script prepares data for gaze regularized imitation learning
 in the following format
 [rgb, depth, action, gaze_coord]
+
+The flipped copies are only needed by pipelines outside batch_loader;
+make_dataset(..., augment=("flip",)) applies the same flip on the fly.
 '''
 
 
@@ -11,39 +14,67 @@ import cv2
 import numpy as np
 import os
 import re
+import sys
 import pandas as pd
 
-def reshape_depth(depth):
-    """Resize to the same size as the one in Ritwik's work."""
-    width = 224
-    height = 224
-    frame = cv2.cvtColor(depth, cv2.COLOR_RGB2GRAY)
-    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
-    frame = np.expand_dims(frame, axis=2)
-    #cv2.imwrite('rgb_cv.png', frame)
-    #plt.imsave('rgb_plt.png', frame)
-    return frame / 255.0
-
-def reshape_image(image):
-    """Resize to the size as required in ResNet."""
-    width = 224
-    height = 224
-    frame = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
-
-    return frame / 255.0
-
-
-def prepare_data(data_path):
-    for subdir in os.listdir(data_path):
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocessing import DEPTH_STORE_SPEC, IMAGE_STORE_SPEC, preprocess
+from shards import SHARD_SUFFIX, resume_writer
+from build_cache import BuildCache, output_name
+
+
+def flipped_frames(dirname, final_df, start=0):
+    """Horizontally flipped (image, depth, gaze, action) of every frame from ``start`` on."""
+    for i, (_, data) in enumerate(final_df.iterrows()):
+        if i < start:
+            continue
+        img_path   = os.path.join(dirname, "rgb", data["rgb_addr"])
+        depth_path = os.path.join(dirname, "depth", data["depth_addr"])
+        # print(img_path)
+        # if (os.path.exists(img_path) and float(row[-4])==0.0):
+        print(data["rgb_addr"], data["gaze_x"], data["gaze_y"])
+
+        # flip the image horizontally
+        im_flip = cv2.flip(cv2.imread(img_path), 1)
+        im_flip = preprocess(im_flip, IMAGE_STORE_SPEC)
+
+        # flip the depth image horizontally
+        dt_flip = cv2.flip(cv2.imread(depth_path), 1)
+        dt_flip = preprocess(dt_flip, DEPTH_STORE_SPEC)
+
+        # gaze cordinates flipped
+        coords_flip = np.hstack((1.0-data["gaze_x"], data["gaze_y"]))
+
+        # control commands fized
+        act_commands_flip = np.hstack((-1.0*data["act_roll"], data["act_pitch"], data["act_throttle"], -1.0*data["act_yaw"]))
+        yield im_flip, dt_flip, coords_flip, act_commands_flip
+
+
+def prepare_data(data_path, fmt="npz", checkpoint_every=256):
+    subdirs = sorted(os.listdir(data_path))
+    # episodes whose inputs did not change since the last run are skipped
+    cache = BuildCache()
+    params = {"builder": "flipped", "format": fmt, "specs": [repr(IMAGE_STORE_SPEC), repr(DEPTH_STORE_SPEC)]}
+    for subdir in subdirs:
         print(subdir)
         fname = ["rgb", "log.csv"]
         dirname = os.path.join(data_path, subdir)
         print(dirname)
 
-        imgs_flip = []
-        depth_flip= []
-        gaze_pos_flip = []
-        act_lbls_flip = []
+        npz_name = data_path.split("/")[-2]
+        # several episodes would otherwise overwrite the same file
+        out_name = f"flipped_{npz_name}" if len(subdirs) == 1 else f"flipped_{npz_name}_{subdir}"
+        if cache.begin(output_name(out_name, fmt), dirname, params) is None:
+            continue
+
+        writer = None
+        if fmt == "shard":
+            # streamed to disk frame by frame, continues an interrupted run
+            writer = resume_writer(out_name + SHARD_SUFFIX, checkpoint_every)
+            if writer is None:
+                print(f"{out_name}{SHARD_SUFFIX} is complete, skipping")
+                continue
+
         # img_idx=[]
         # print(os.path.join(dirname, fname)
         if fname[1].endswith('.csv'):
@@ -55,39 +86,34 @@ def prepare_data(data_path):
         train_df["depth_addr"]= train_df["depth_addr"].apply(lambda x: x.split("/")[-1])
 
         non_zero_yaw = train_df[train_df["act_yaw"] != 0.0]
-        zero_yaw = train_df.query("act_yaw == 0.0").sample(frac=0.10)
+        # seeded so a resumed shard continues with the same frames
+        zero_yaw = train_df.query("act_yaw == 0.0").sample(frac=0.10, random_state=0)
         final_df = pd.concat([zero_yaw, non_zero_yaw])
 
-        for i, data in final_df.iterrows():
-            img_path   = os.path.join(dirname, "rgb", data["rgb_addr"])
-            depth_path = os.path.join(dirname, "depth", data["depth_addr"])
-            # print(img_path)
-            # if (os.path.exists(img_path) and float(row[-4])==0.0):
-            print(data["rgb_addr"], data["gaze_x"], data["gaze_y"])
+        if writer is not None:
+            with writer:
+                for im_flip, dt_flip, coords_flip, act_flip in flipped_frames(dirname, final_df, writer.num_frames):
+                    writer.append(images=im_flip[None], depth=dt_flip[None],
+                                  action=act_flip[None, :, None], gaze_coords=coords_flip[None, :, None])
+            print(out_name + SHARD_SUFFIX, writer.num_frames)
+            cache.done(output_name(out_name, fmt))
+            continue
 
-            # flip the image horizontally
-            im_flip = np.float32(cv2.flip(cv2.imread(img_path), 1))
-            im_flip = reshape_image(im_flip)
+        imgs_flip = []
+        depth_flip= []
+        gaze_pos_flip = []
+        act_lbls_flip = []
+        for im_flip, dt_flip, coords_flip, act_commands_flip in flipped_frames(dirname, final_df):
             imgs_flip.append(im_flip)
-
-            # flip the depth image horizontally
-            dt_flip = np.float32(cv2.flip(cv2.imread(depth_path), 1))
-            dt_flip = reshape_depth(dt_flip)
             depth_flip.append(dt_flip)
-
-            # gaze cordinates flipped
-            coords_flip = np.hstack((1.0-data["gaze_x"], data["gaze_y"]))
             gaze_pos_flip.append(coords_flip)
-
-            # control commands fized
-            act_commands_flip = np.hstack((-1.0*data["act_roll"], data["act_pitch"], data["act_throttle"], -1.0*data["act_yaw"]))
             act_lbls_flip.append(act_commands_flip)
 
         gaze_pos_flip = np.array(gaze_pos_flip)
-        gaze_pos_flip = gaze_pos_flip.astype(float)
+        gaze_pos_flip = gaze_pos_flip.astype(np.float32)
 
         act_lbls_flip = np.array(act_lbls_flip)
-        act_lbls_flip = act_lbls_flip.astype(float)
+        act_lbls_flip = act_lbls_flip.astype(np.float32)
         # print(gaze_pos.shape)
         imgs_flip = np.array(imgs_flip)
         depth_flip = np.array(depth_flip)
@@ -102,9 +128,9 @@ def prepare_data(data_path):
         gaze_pos_flip = np.reshape(gaze_pos_flip, (gaze_pos_flip.shape[0], gaze_pos_flip.shape[1], 1))
         act_lbls_flip = np.reshape(act_lbls_flip, (act_lbls_flip.shape[0], act_lbls_flip.shape[1], 1))
 
-        npz_name = data_path.split("/")[-2]
-        print(npz_name)
-        np.savez_compressed(f"flipped_{npz_name}.npz", images=imgs_flip, depth=depth_flip, action=act_lbls_flip, gaze_coords=gaze_pos_flip)
+        print(out_name)
+        np.savez_compressed(f"{out_name}.npz", images=imgs_flip, depth=depth_flip, action=act_lbls_flip, gaze_coords=gaze_pos_flip)
+        cache.done(output_name(out_name, fmt))
 
 
 
@@ -112,7 +138,10 @@ if __name__ == "__main__":
     #data_path = '/scratch/user/ravikt/airsim/data/moving_truck_mountains3/'
     parser = argparse.ArgumentParser(description="script for creating numpy compressed data")
     parser.add_argument("-p", "--path", type=str, help="path to airsim data")
+    parser.add_argument("-f", "--format", type=str, default="npz", choices=["npz", "shard"],
+                        help="shard streams frames to disk with bounded memory and resumes interrupted runs")
+    parser.add_argument("-k", "--checkpoint-every", type=int, default=256, help="frames between shard checkpoints")
 
     args = parser.parse_args()
     data_path = args.path
-    prepare_data(data_path)
+    prepare_data(data_path, args.format, args.checkpoint_every)
@@ -4,7 +4,11 @@ import cv2
 import numpy as np
 import os
 import re
-from read_gaze import preprocess_gaze_heatmap, reshape_heatmap, reshape_image
+import sys
+from read_gaze import preprocess_gaze_heatmap
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocessing import GRAY_STORE_SPEC, preprocess
 
 
 def get_im_index(filename):
@@ -34,8 +38,7 @@ def prepare_data(data_path):
                 # print(img_path)
                 if os.path.exists(img_path):
                     print(f"rgb_{i}.png", row[-3], row[-2])
-                    im = np.float32(cv2.imread(img_path))
-                    im = reshape_image(im)  # reshape to 84x84
+                    im = preprocess(cv2.imread(img_path), GRAY_STORE_SPEC)
                     imgs.append(im)
 
                     coords = np.hstack((row[-3], row[-2]))
@@ -44,7 +47,7 @@ def prepare_data(data_path):
                     #act_lbls.append(act_commands)
 
             gaze_pos = np.array(gaze_pos)
-            gaze_pos = gaze_pos.astype(float)
+            gaze_pos = gaze_pos.astype(np.float32)
 
             #act_lbls = np.array(act_lbls)
             #act_lbls = act_lbls.astype(float)
@@ -1,95 +1,83 @@
 import csv
 import cv2
-import copy
+import functools
 from itertools import islice
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy.stats import multivariate_normal
-from scipy.ndimage import gaussian_filter
-import torch
-
-'''
-def reshape_image(image):
-    """Warp frames to 84x84 as done in the Nature paper and later work."""
-    width = 224 #84
-    height = 224 #84
-    frame = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
-    return frame / 255.0
-'''
-
-
-def reshape_image(image):
-    """Resize to the same size as the one in Ritwik's work."""
-    width = 224
-    height = 224
-    frame = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
-    frame = np.expand_dims(frame, axis=2)
-    #cv2.imwrite('rgb_cv.png', frame)
-    #plt.imsave('rgb_plt.png', frame)
-    return frame / 255.0
-
-
-
-def reshape_heatmap(heatmap):
-    ghmap = []
-    # print(heatmap.shape, type(heatmap))
-    heatmap = heatmap.numpy()
-    # print(heatmap[0].shape, len(heatmap))
 
-    for i in range(len(heatmap)):
-        ghmap.append(cv2.resize(
-            heatmap[i], (224, 224), interpolation=cv2.INTER_AREA))
-
-    return np.array(ghmap)
+def reshape_heatmap(heatmap, size=(224, 224)):
+    """Resize a (N, H, W) stack of heatmaps; no-op when already at ``size``."""
+    heatmap = np.asarray(heatmap, dtype=np.float32)
+    if heatmap.shape[1:3] == (size[1], size[0]):
+        return heatmap
 
+    ghmap = np.empty((len(heatmap), size[1], size[0]), dtype=np.float32)
+    for i in range(len(heatmap)):
+        cv2.resize(heatmap[i], size, dst=ghmap[i], interpolation=cv2.INTER_AREA)
 
-def get_mask(center, size, sig):
-    y, x = np.ogrid[-center[0]: size[0] -
-                    center[0], -center[1]: size[1] - center[1]]
-    keep = x * x + y * y < 1
-    mask = np.zeros(size)
-    mask[keep] = 1
-    mask = gaussian_filter(mask, sigma=sig)
-    #print(mask.sum())
-
-    return mask / mask.sum()
+    return ghmap
 
 
 h = 224 # 480  # row
 w = 224 # 704  # column
 
 
-def preprocess_gaze_heatmap(gaze_2ds, sigma):
-    ''' Convert 1-hot gaze heatmap to gaussian distribution;
-    note that this assumes each frame only has 0 or 1 valid gaze positions'''
-    gmaps = np.zeros([len(gaze_2ds), h, w, 1], dtype=np.float32)
-    dim_x, dim_y = h, w  # gmaps.shape[1], gmaps.shape[2]
-    # x and y not necessarily means values along x and y axis
-    # dim_y, dim_x = h, w#gmaps.shape[1], gmaps.shape[2]
-
-    # print(gaze_2ds.shape)
-    for i in range(len(gaze_2ds)):
-        gaze_x, gaze_y = gaze_2ds[i][0], gaze_2ds[i][1]
-        if gaze_x == -1:
-            mask = np.ones((dim_x, dim_y)) / (dim_x * dim_y)  # uniform
-        else:
-            # mask = get_mask([gaze_x*w, gaze_y*h], [dim_x, dim_y], sigma)
-            mask = get_mask([gaze_y*h, gaze_x*w], [dim_x, dim_y], sigma)
-
-        mask = np.expand_dims(mask, axis=2)
-        gmaps[i] = copy.deepcopy(mask)
-        # print(gmaps[i])
-        # print(np.any(np.isnan(gmaps[i])))
-        if np.any(np.isnan(gmaps[i])):
-            break
-        #plt.imshow(np.squeeze(gmaps[i], axis=2))
-        #plt.imsave(f'out{i}.png', np.squeeze(gmaps[i], axis=2))
-
-    gmaps = torch.tensor(gmaps, dtype=torch.float32).permute(0, 3, 1, 2)
-    return gmaps
+@functools.lru_cache(maxsize=16)
+def _kernel_table(size, sigma, steps):
+    """1-D Gaussians over ``size`` pixels for centers on a 1/steps pixel grid."""
+    centers = np.arange(size * steps + 1, dtype=np.float32) / steps
+    d = np.arange(size, dtype=np.float32)[None, :] - centers[:, None]
+    return np.exp(-d * d / np.float32(2 * sigma * sigma))
+
+
+def _exact_kernels(centers, size, sigma):
+    d = np.arange(size, dtype=np.float32)[None, :] - centers[:, None].astype(np.float32)
+    return np.exp(-d * d / np.float32(2 * sigma * sigma))
+
+
+def _axis_kernels(centers, size, sigma, steps):
+    if not steps:
+        return _exact_kernels(centers, size, sigma)
+    # the table only covers centers on the frame; off-frame gaze is
+    # computed exactly so it decays (or underflows) as with steps=0
+    inside = (centers >= 0) & (centers <= size)
+    idx = np.rint(np.where(inside, centers, 0) * steps).astype(np.int64)
+    kernels = _kernel_table(size, float(sigma), steps)[idx]
+    if not inside.all():
+        kernels[~inside] = _exact_kernels(centers[~inside], size, sigma)
+    return kernels
+
+
+def preprocess_gaze_heatmap(gaze_2ds, sigma, shape=(h, w), steps=8):
+    ''' Convert gaze positions to gaussian heatmaps, all frames at once.
+
+    gaze_2ds holds normalized (x, y) gaze per frame, -1 (or nan) marks a frame
+    without gaze, which gets a uniform map. The 2-D Gaussian is separable, so
+    each map is the outer product of a row and a column kernel, normalized to
+    sum to 1. ``shape`` is the output (rows, cols) and sigma is in output
+    pixels. With ``steps`` the 1-D kernels come from a table cached per
+    sigma with centers rounded to 1/steps pixel; steps=0 computes them
+    exactly. Returns float32 (N, rows, cols, 1).'''
+    rows, cols = shape
+    gaze = np.asarray(gaze_2ds, dtype=np.float64).reshape(len(gaze_2ds), -1)
+    gaze_x, gaze_y = gaze[:, 0], gaze[:, 1]
+
+    missing = (gaze_x == -1) | ~np.isfinite(gaze_x) | ~np.isfinite(gaze_y)
+    gaze_x = np.where(missing, 0.5, gaze_x)
+    gaze_y = np.where(missing, 0.5, gaze_y)
+
+    ky = _axis_kernels(gaze_y * rows, rows, sigma, steps)
+    kx = _axis_kernels(gaze_x * cols, cols, sigma, steps)
+    sy = ky.sum(axis=1)
+    sx = kx.sum(axis=1)
+    # centers far outside the frame underflow to zero; treat them as missing
+    missing |= (sy == 0) | (sx == 0)
+    ky = ky / np.where(sy == 0, 1, sy)[:, None]
+    kx = kx / np.where(sx == 0, 1, sx)[:, None]
+
+    gmaps = np.einsum("ni,nj->nij", ky, kx).astype(np.float32, copy=False)
+    gmaps[missing] = 1.0 / (rows * cols)  # uniform
+    return gmaps[..., None]
 
 
 if __name__ == "__main__":